@@ -0,0 +1,247 @@
+import atexit
+import os
+import re
+import socket
+import threading
+from email.utils import parsedate_to_datetime
+from http import HTTPStatus
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+
+# 匹配单个字节范围请求，如 bytes=0-1023、bytes=1024-、bytes=-500
+RANGE_PATTERN = re.compile(r"^bytes=(\d*)-(\d*)$")
+
+# 服务器默认端口，被占用时依次往后尝试
+DEFAULT_PORT = 8000
+MAX_PORT_ATTEMPTS = 100
+
+# 进程内唯一的服务器实例，Streamlit每次重新运行页面脚本都会复用
+_server = None
+_server_thread = None
+_server_lock = threading.Lock()
+
+# 分片和媒体文件：文件名不随内容变化（重新转换到同一目录、后期加密都会原地改写，
+# 单文件输出在转换过程中还在增长），每次都用ETag/Last-Modified重新验证，未修改时只返回304
+MEDIA_EXTENSIONS = ('.ts', '.m4s', '.mp4', '.aac')
+
+
+def get_cache_control(path):
+    """根据文件类型返回缓存策略"""
+    if path.endswith(MEDIA_EXTENSIONS):
+        return "no-cache"
+    if path.endswith(('.m3u8', '.mpd')):
+        # 转换过程中播放列表还会更新，只缓存很短的时间
+        return "public, max-age=2"
+    if path.endswith('.key'):
+        return "no-store"
+    if path.endswith(('.jpg', '.png', '.vtt')):
+        return "public, max-age=300"
+    return "no-cache"
+
+
+class HLSRequestHandler(SimpleHTTPRequestHandler):
+    """支持CORS、Range、ETag/Last-Modified条件请求和sendfile零拷贝的静态文件处理器"""
+
+    protocol_version = "HTTP/1.1"
+    extensions_map = {
+        **SimpleHTTPRequestHandler.extensions_map,
+        '.m3u8': 'application/vnd.apple.mpegurl',
+        '.mpd': 'application/dash+xml',
+        '.ts': 'video/mp2t',
+        '.m4s': 'video/iso.segment',
+        '.mp4': 'video/mp4',
+        '.aac': 'audio/aac',
+        '.vtt': 'text/vtt',
+        '.key': 'application/octet-stream'
+    }
+
+    def end_headers(self):
+        self.send_header('Access-Control-Allow-Origin', '*')
+        self.send_header('Access-Control-Allow-Methods', 'GET, HEAD, OPTIONS')
+        self.send_header('Access-Control-Allow-Headers', '*')
+        self.send_header('Access-Control-Expose-Headers', 'Content-Length, Content-Range, Accept-Ranges, ETag')
+        super().end_headers()
+
+    def do_OPTIONS(self):
+        self.send_response(HTTPStatus.NO_CONTENT)
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+
+    def log_message(self, format, *args):
+        # 分片请求非常多，不输出访问日志
+        pass
+
+    def _not_modified(self, etag, mtime):
+        """判断条件请求是否可以返回304"""
+        if_none_match = self.headers.get('If-None-Match')
+        if if_none_match:
+            return etag in [tag.strip() for tag in if_none_match.split(',')] or if_none_match.strip() == '*'
+        if_modified_since = self.headers.get('If-Modified-Since')
+        if if_modified_since:
+            try:
+                return int(mtime) <= parsedate_to_datetime(if_modified_since).timestamp()
+            except (TypeError, ValueError, IndexError, OverflowError):
+                return False
+        return False
+
+    def _parse_range(self, size, etag):
+        """解析Range请求头，返回 (起始位置, 长度)；没有Range返回None，无法满足返回False"""
+        range_header = self.headers.get('Range')
+        if not range_header:
+            return None
+        # If-Range与当前版本不一致时忽略Range，返回完整文件
+        if_range = self.headers.get('If-Range')
+        if if_range and if_range.strip() != etag:
+            return None
+        match = RANGE_PATTERN.match(range_header.strip())
+        if not match:
+            # 多段范围等不支持的格式按完整文件返回
+            return None
+        first, last = match.groups()
+        if first:
+            start = int(first)
+            end = min(int(last), size - 1) if last else size - 1
+        elif last:
+            start = max(size - int(last), 0)
+            end = size - 1
+        else:
+            return None
+        if start >= size or start > end:
+            return False
+        return start, end - start + 1
+
+    def send_head(self):
+        self._range = None
+        path = self.translate_path(self.path)
+        if os.path.isdir(path):
+            return super().send_head()
+
+        try:
+            f = open(path, 'rb')
+        except OSError:
+            self.send_error(HTTPStatus.NOT_FOUND, "File not found")
+            return None
+
+        try:
+            fs = os.fstat(f.fileno())
+            size = fs.st_size
+            etag = f'"{fs.st_mtime_ns:x}-{size:x}"'
+            last_modified = self.date_time_string(int(fs.st_mtime))
+            cache_control = get_cache_control(path)
+
+            if self._not_modified(etag, fs.st_mtime):
+                f.close()
+                self.send_response(HTTPStatus.NOT_MODIFIED)
+                self.send_header('ETag', etag)
+                self.send_header('Last-Modified', last_modified)
+                self.send_header('Cache-Control', cache_control)
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+                return None
+
+            byte_range = self._parse_range(size, etag)
+            if byte_range is False:
+                f.close()
+                self.send_response(HTTPStatus.REQUESTED_RANGE_NOT_SATISFIABLE)
+                self.send_header('Content-Range', f'bytes */{size}')
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+                return None
+
+            if byte_range:
+                start, length = byte_range
+                self.send_response(HTTPStatus.PARTIAL_CONTENT)
+                self.send_header('Content-Range', f'bytes {start}-{start + length - 1}/{size}')
+            else:
+                start, length = 0, size
+                self.send_response(HTTPStatus.OK)
+            self.send_header('Content-Type', self.guess_type(path))
+            self.send_header('Content-Length', str(length))
+            self.send_header('Accept-Ranges', 'bytes')
+            self.send_header('ETag', etag)
+            self.send_header('Last-Modified', last_modified)
+            self.send_header('Cache-Control', cache_control)
+            self.end_headers()
+            self._range = (start, length)
+            return f
+        except Exception:
+            f.close()
+            raise
+
+    def copyfile(self, source, outputfile):
+        if not self._range:
+            return super().copyfile(source, outputfile)
+        start, length = self._range
+        try:
+            # socket.sendfile在支持的系统上使用os.sendfile，数据不经过用户态
+            self.connection.sendfile(source, offset=start, count=length)
+        except (ConnectionResetError, BrokenPipeError):
+            # 播放器拖动进度条时经常会中断请求
+            pass
+
+
+class HLSServer(ThreadingHTTPServer):
+    """每个请求一个线程，慢客户端不会阻塞其他分片请求"""
+
+    daemon_threads = True
+    block_on_close = False
+    # SO_REUSEADDR在Windows上允许绑定其他进程正在监听的端口，换端口的循环会失效，请求也会发到别的服务器
+    allow_reuse_address = False
+
+    def server_bind(self):
+        if hasattr(socket, "SO_EXCLUSIVEADDRUSE"):
+            # Windows上独占端口，其他进程也不能再绑定
+            self.socket.setsockopt(socket.SOL_SOCKET, socket.SO_EXCLUSIVEADDRUSE, 1)
+        super().server_bind()
+
+
+def _bind(host, port):
+    """从指定端口开始依次尝试绑定，直接绑定失败再换端口，避免先探测后绑定的竞争"""
+    for candidate in range(port, port + MAX_PORT_ATTEMPTS):
+        try:
+            return HLSServer((host, candidate), HLSRequestHandler)
+        except OSError:
+            continue
+    raise OSError(f"端口 {port}-{port + MAX_PORT_ATTEMPTS - 1} 都已被占用")
+
+
+def start_http_server(host='localhost', port=DEFAULT_PORT):
+    """启动支持CORS和Range的HTTP服务器并返回端口
+
+    整个进程只启动一个服务器，页面每次运行都调用也不会重复启动；
+    服务线程意外退出时重新启动。
+    """
+    global _server, _server_thread
+    with _server_lock:
+        if _server is not None and _server_thread.is_alive():
+            return _server.server_address[1]
+        if _server is not None:
+            _server.server_close()
+
+        _server = _bind(host, port)
+        _server_thread = threading.Thread(target=_server.serve_forever, name="hls-http-server", daemon=True)
+        _server_thread.start()
+        return _server.server_address[1]
+
+
+def get_server_status():
+    """返回服务器的端口和运行状态"""
+    with _server_lock:
+        if _server is None:
+            return {'running': False, 'port': None}
+        return {'running': _server_thread.is_alive(), 'port': _server.server_address[1]}
+
+
+def stop_http_server():
+    """停止服务器并释放端口"""
+    global _server, _server_thread
+    with _server_lock:
+        if _server is None:
+            return
+        if _server_thread.is_alive():
+            _server.shutdown()
+        _server.server_close()
+        _server = None
+        _server_thread = None
+
+
+atexit.register(stop_http_server)
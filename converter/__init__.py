@@ -0,0 +1 @@
+"""MP4转M3U8转换引擎（不依赖Streamlit，可供页面和命令行共同使用）"""
@@ -0,0 +1,191 @@
+import hashlib
+import json
+import os
+import shutil
+import threading
+import time
+
+from converter.commands import get_hwaccel, get_output_resolutions, uses_separate_audio, uses_single_file
+from converter.ladder import DEFAULT_TARGET_CRF, propose_ladder
+from converter.probe import get_video_info
+
+# 缓存默认保存在项目的config目录下
+DEFAULT_CACHE_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'config', 'cache')
+
+# 指纹采样：每块大小和采样块数（包括文件开头和结尾）
+SAMPLE_BLOCK_SIZE = 64 * 1024
+SAMPLE_BLOCKS = 16
+
+# 影响输出结果的设置项，其余设置（并行数、分段数、续转等）只影响转换速度
+OUTPUT_SETTING_KEYS = (
+    'video_encoder',
+    'audio_encoder',
+    'segment_time',
+    'segment_type',
+    'single_file',
+    'playlist_type',
+    'output_name',
+    'encryption_enabled',
+    'key_rotation',
+    'previews',
+    'preview_interval',
+    'smart_poster',
+    'single_decode',
+    'hw_decode',
+    'aligned_keyframes',
+    'scene_cuts',
+    'scene_threshold'
+)
+
+# 进程内的指纹缓存，以 (路径, 大小, 修改时间) 为键
+_fingerprints = {}
+_fingerprints_lock = threading.Lock()
+
+
+def get_fingerprint(path):
+    """计算文件的快速内容指纹：文件大小加上均匀采样的若干数据块的哈希
+
+    大文件只读取约1MB数据，同一内容换了文件名也能得到相同的指纹。
+    """
+    stat = os.stat(path)
+    memo_key = (os.path.abspath(path), stat.st_size, stat.st_mtime_ns)
+    with _fingerprints_lock:
+        if memo_key in _fingerprints:
+            return _fingerprints[memo_key]
+
+    size = stat.st_size
+    digest = hashlib.sha256(str(size).encode())
+    with open(path, 'rb') as f:
+        if size <= SAMPLE_BLOCK_SIZE * SAMPLE_BLOCKS:
+            digest.update(f.read())
+        else:
+            step = (size - SAMPLE_BLOCK_SIZE) // (SAMPLE_BLOCKS - 1)
+            for i in range(SAMPLE_BLOCKS):
+                f.seek(i * step)
+                digest.update(f.read(SAMPLE_BLOCK_SIZE))
+    fingerprint = digest.hexdigest()
+
+    with _fingerprints_lock:
+        _fingerprints[memo_key] = fingerprint
+    return fingerprint
+
+
+def normalize_settings(settings):
+    """提取影响输出结果的设置，用于生成缓存键"""
+    normalized = {key: settings.get(key) for key in OUTPUT_SETTING_KEYS}
+    normalized['segment_time'] = str(normalized['segment_time'])
+    normalized['single_file'] = uses_single_file(settings)
+    normalized['separate_audio'] = uses_separate_audio(settings)
+    # 只有GPU编码时才会用到硬件解码，记录实际使用的解码方式
+    normalized['hw_decode'] = get_hwaccel(settings)
+    if settings['audio_encoder'] == "copy":
+        normalized['audio_bitrate'] = None
+    else:
+        normalized['audio_bitrate'] = settings.get('audio_bitrate')
+    resolutions = get_output_resolutions(settings)
+    normalized['resolutions'] = resolutions
+    if settings['video_encoder'] != "copy":
+        normalized['video_bitrates'] = {r: settings['video_bitrates'][r] for r in resolutions}
+    return normalized
+
+
+def get_conversion_key(fingerprint, settings):
+    """根据源文件指纹和输出相关的设置生成缓存键"""
+    payload = json.dumps({'source': fingerprint, 'settings': normalize_settings(settings)}, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+def _read_json(path):
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _write_json(path, data):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    temp_path = f"{path}.tmp"
+    with open(temp_path, 'w', encoding='utf-8') as f:
+        json.dump(data, f, ensure_ascii=False)
+    os.replace(temp_path, path)
+
+
+def get_cached_video_info(input_file, cache_dir=DEFAULT_CACHE_DIR):
+    """获取视频信息，同一内容只调用一次ffprobe，结果保存在磁盘上"""
+    cache_path = os.path.join(cache_dir, 'probe', f"{get_fingerprint(input_file)}.json")
+    video_info = _read_json(cache_path)
+    if video_info is None:
+        video_info = get_video_info(input_file)
+        _write_json(cache_path, video_info)
+    return video_info
+
+
+def get_cached_ladder(input_file, settings, video_info=None, cache_dir=DEFAULT_CACHE_DIR):
+    """按内容推荐码率阶梯，同一内容、相同的候选分辨率和目标画质只试编码一次"""
+    payload = json.dumps({
+        'source': get_fingerprint(input_file),
+        'resolutions': list(settings['resolutions']),
+        'target_crf': settings.get('ladder_crf') or DEFAULT_TARGET_CRF
+    }, sort_keys=True, ensure_ascii=False)
+    cache_path = os.path.join(cache_dir, 'ladder', f"{hashlib.sha256(payload.encode('utf-8')).hexdigest()}.json")
+    proposal = _read_json(cache_path)
+    if proposal is None:
+        proposal = propose_ladder(input_file, settings, video_info)
+        _write_json(cache_path, proposal)
+    else:
+        # JSON的键都是字符串，还原为CRF数值
+        proposal['points'] = {int(crf): bitrate for crf, bitrate in proposal['points'].items()}
+    return proposal
+
+
+def lookup_conversion(cache_key, cache_dir=DEFAULT_CACHE_DIR):
+    """查找相同内容、相同设置的已完成转换，返回其输出目录；结果已被删除时返回None"""
+    cache_path = os.path.join(cache_dir, 'outputs', f"{cache_key}.json")
+    entry = _read_json(cache_path)
+    if entry is None:
+        return None
+    if not os.path.exists(os.path.join(entry['output_dir'], "master.m3u8")):
+        os.remove(cache_path)
+        return None
+    return entry['output_dir']
+
+
+def store_conversion(cache_key, output_dir, cache_dir=DEFAULT_CACHE_DIR):
+    """记录一次完成的转换"""
+    _write_json(os.path.join(cache_dir, 'outputs', f"{cache_key}.json"), {
+        'output_dir': os.path.abspath(output_dir),
+        'created_at': time.time()
+    })
+
+
+def link_tree(source_dir, target_dir):
+    """用硬链接把已有的转换结果复制到新的输出目录，不支持硬链接时改为复制文件"""
+    if os.path.abspath(source_dir) == os.path.abspath(target_dir):
+        return
+    for root, _, files in os.walk(source_dir):
+        relative = os.path.relpath(root, source_dir)
+        target_root = os.path.normpath(os.path.join(target_dir, relative))
+        os.makedirs(target_root, exist_ok=True)
+        for name in files:
+            source = os.path.join(root, name)
+            target = os.path.join(target_root, name)
+            if os.path.exists(target):
+                continue
+            try:
+                os.link(source, target)
+            except OSError:
+                shutil.copy2(source, target)
+
+
+def forget_conversion(output_dir, cache_dir=DEFAULT_CACHE_DIR):
+    """删除指向某个输出目录的转换记录（输出内容被修改后不能再复用）"""
+    outputs_dir = os.path.join(cache_dir, 'outputs')
+    if not os.path.isdir(outputs_dir):
+        return
+    output_dir = os.path.abspath(output_dir)
+    for name in os.listdir(outputs_dir):
+        cache_path = os.path.join(outputs_dir, name)
+        entry = _read_json(cache_path)
+        if entry and entry.get('output_dir') == output_dir:
+            os.remove(cache_path)
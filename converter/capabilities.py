@@ -0,0 +1,145 @@
+import json
+import os
+import platform
+import re
+import shutil
+import subprocess
+import threading
+
+# 检测结果默认保存在项目的config目录下
+DEFAULT_CAPABILITIES_FILE = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'config', 'capabilities.json')
+
+# 需要检测的硬件编码器及其在检测结果中的字段名
+HW_ENCODERS = {
+    "h264_nvenc": "nvidia_gpu",
+    "h264_qsv": "intel_qsv",
+    "h264_videotoolbox": "videotoolbox"
+}
+
+# 单个编码器试编码的超时时间（秒）
+TEST_ENCODE_TIMEOUT = 20
+
+# 进程内的检测结果缓存，以 (ffmpeg路径, 修改时间) 为键
+_capabilities = {}
+_capabilities_lock = threading.Lock()
+
+
+def get_cpu_info():
+    """获取CPU型号"""
+    try:
+        if platform.system() == "Darwin":  # macOS
+            result = subprocess.run(['sysctl', '-n', 'machdep.cpu.brand_string'], capture_output=True, text=True)
+            return result.stdout.strip()
+        elif platform.system() == "Linux":
+            with open('/proc/cpuinfo', 'r') as f:
+                for line in f:
+                    if 'model name' in line:
+                        return line.split(':')[1].strip()
+        elif platform.system() == "Windows":
+            result = subprocess.run(['wmic', 'cpu', 'get', 'name'], capture_output=True, text=True)
+            return result.stdout.split('\n')[1].strip()
+    except Exception:
+        pass
+    return "无法获取CPU信息"
+
+
+def test_encoder(ffmpeg_path, encoder):
+    """用几帧测试画面实际编码一次，确认编码器在本机可用（驱动、设备都正常）"""
+    cmd = [
+        ffmpeg_path,
+        '-hide_banner',
+        '-v', 'error',
+        '-f', 'lavfi',
+        '-i', 'color=c=black:s=256x256:r=25:d=0.2',
+        '-pix_fmt', 'nv12',
+        '-frames:v', '3',
+        '-c:v', encoder,
+        '-f', 'null',
+        '-'
+    ]
+    try:
+        result = subprocess.run(cmd, capture_output=True, text=True, timeout=TEST_ENCODE_TIMEOUT)
+    except (OSError, subprocess.TimeoutExpired) as e:
+        return False, str(e)
+    return result.returncode == 0, result.stderr.strip()
+
+
+def _detect(ffmpeg_path):
+    """检测系统环境并返回可用的编码器信息"""
+    env_info = {
+        "ffmpeg_installed": False,
+        "ffmpeg_path": ffmpeg_path,
+        "ffmpeg_version": None,
+        "nvidia_gpu": False,
+        "intel_qsv": False,
+        "videotoolbox": False,
+        "encoders_listed": [],
+        "encoder_errors": {},
+        "cpu_info": get_cpu_info(),
+        "os_info": platform.system(),
+        "error": None
+    }
+    if not ffmpeg_path:
+        return env_info
+
+    env_info["ffmpeg_installed"] = True
+    try:
+        # 获取FFmpeg版本
+        result = subprocess.run([ffmpeg_path, '-version'], capture_output=True, text=True)
+        version_match = re.search(r'ffmpeg version (\S+)', result.stdout)
+        if version_match:
+            env_info["ffmpeg_version"] = version_match.group(1)
+
+        # 编译进FFmpeg的编码器不一定能用（没有显卡或驱动），对列出的硬件编码器逐个试编码
+        encoders = subprocess.run([ffmpeg_path, '-hide_banner', '-encoders'], capture_output=True, text=True)
+        for encoder, field in HW_ENCODERS.items():
+            if re.search(rf"\s{encoder}\s", encoders.stdout):
+                env_info["encoders_listed"].append(encoder)
+                ok, error = test_encoder(ffmpeg_path, encoder)
+                env_info[field] = ok
+                if not ok:
+                    env_info["encoder_errors"][encoder] = error[-500:]
+    except Exception as e:
+        env_info["error"] = str(e)
+    return env_info
+
+
+def _read_disk_cache(path):
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def detect_capabilities(refresh=False, cache_file=DEFAULT_CAPABILITIES_FILE):
+    """获取系统环境和编码器检测结果
+
+    结果按FFmpeg路径和修改时间缓存在进程内和磁盘上，FFmpeg升级或更换后自动重新检测；
+    refresh为True时强制重新检测。
+    """
+    ffmpeg_path = shutil.which('ffmpeg')
+    mtime = os.path.getmtime(ffmpeg_path) if ffmpeg_path else 0
+    cache_key = f"{ffmpeg_path}|{mtime}"
+
+    with _capabilities_lock:
+        if not refresh and cache_key in _capabilities:
+            return _capabilities[cache_key]
+
+        disk_cache = _read_disk_cache(cache_file)
+        if not refresh and cache_key in disk_cache:
+            env_info = disk_cache[cache_key]
+        else:
+            env_info = _detect(ffmpeg_path)
+            if env_info["ffmpeg_installed"] and not env_info["error"]:
+                try:
+                    os.makedirs(os.path.dirname(cache_file), exist_ok=True)
+                    temp_file = f"{cache_file}.tmp"
+                    with open(temp_file, 'w', encoding='utf-8') as f:
+                        json.dump({cache_key: env_info}, f, ensure_ascii=False, indent=2)
+                    os.replace(temp_file, cache_file)
+                except OSError:
+                    pass
+        _capabilities.clear()
+        _capabilities[cache_key] = env_info
+        return env_info
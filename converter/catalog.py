@@ -0,0 +1,252 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+from contextlib import closing
+
+from converter.commands import RESOLUTION_DIRS, get_output_resolutions, get_resolution_dir, get_resolution_dir_name
+
+# 目录索引默认保存在项目的config目录下
+DEFAULT_CATALOG_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'config', 'catalog.db')
+
+# 每个输出目录中记录转换结果的清单文件
+MANIFEST_NAME = "manifest.json"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS titles (
+    output_dir TEXT PRIMARY KEY,
+    root TEXT NOT NULL,
+    title TEXT NOT NULL,
+    created_at REAL NOT NULL,
+    duration REAL,
+    size INTEGER NOT NULL DEFAULT 0,
+    thumbnail TEXT,
+    resolutions TEXT NOT NULL DEFAULT '',
+    manifest TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_titles_root ON titles (root, created_at);
+CREATE INDEX IF NOT EXISTS idx_titles_title ON titles (root, title COLLATE NOCASE);
+CREATE TABLE IF NOT EXISTS roots (
+    root TEXT PRIMARY KEY,
+    mtime_ns INTEGER NOT NULL
+);
+"""
+
+# 列表的排序方式
+SORT_ORDERS = {
+    "newest": "created_at DESC",
+    "oldest": "created_at ASC",
+    "title": "title COLLATE NOCASE ASC",
+    "duration": "duration DESC",
+    "size": "size DESC"
+}
+
+# 分辨率目录名到分辨率的对应关系，用于为没有清单的旧输出目录生成清单
+_DIR_RESOLUTIONS = {name: resolution for resolution, name in RESOLUTION_DIRS.items()}
+
+# 同一进程内对同一根目录的刷新串行执行
+_refresh_lock = threading.Lock()
+
+
+def _dir_size(path):
+    """统计目录下所有文件的大小"""
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.path.getsize(os.path.join(root, name))
+            except OSError:
+                pass
+    return total
+
+
+def build_manifest(output_dir, resolutions, duration=None, created_at=None):
+    """根据输出目录中的文件生成清单：标题、创建时间、各分辨率、时长、大小和封面"""
+    renditions = []
+    for resolution in resolutions:
+        rendition_dir = get_resolution_dir(output_dir, resolution)
+        if os.path.isdir(rendition_dir):
+            renditions.append({
+                'resolution': resolution,
+                'name': get_resolution_dir_name(resolution),
+                'size': _dir_size(rendition_dir)
+            })
+    thumbnail_path = os.path.join(output_dir, "thumbnail.jpg")
+    return {
+        'title': os.path.basename(os.path.normpath(output_dir)),
+        'output_dir': os.path.abspath(output_dir),
+        'created_at': created_at or time.time(),
+        'duration': duration,
+        'renditions': renditions,
+        'size': sum(rendition['size'] for rendition in renditions),
+        'thumbnail': "thumbnail.jpg" if os.path.exists(thumbnail_path) else None
+    }
+
+
+def write_manifest(output_dir, settings, duration=None):
+    """转换完成后写入清单（先写临时文件再替换，不会修改硬链接共享的文件）"""
+    manifest = build_manifest(output_dir, get_output_resolutions(settings), duration)
+    manifest_path = os.path.join(output_dir, MANIFEST_NAME)
+    temp_path = f"{manifest_path}.tmp"
+    with open(temp_path, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+    os.replace(temp_path, manifest_path)
+    return manifest
+
+
+def read_manifest(output_dir):
+    """读取输出目录的清单；没有清单的旧目录根据已有的分辨率子目录生成，不是转换结果时返回None"""
+    try:
+        with open(os.path.join(output_dir, MANIFEST_NAME), 'r', encoding='utf-8') as f:
+            manifest = json.load(f)
+        # 复用缓存结果时清单是从其他目录链接过来的，以实际所在目录为准
+        manifest['output_dir'] = os.path.abspath(output_dir)
+        manifest['title'] = os.path.basename(os.path.normpath(output_dir))
+        return manifest
+    except (OSError, ValueError):
+        pass
+
+    try:
+        names = [entry.name for entry in os.scandir(output_dir) if entry.is_dir()]
+        created_at = os.path.getctime(output_dir)
+    except OSError:
+        return None
+    # 还在转换中的目录没有主播放列表，等转换完成时再加入索引
+    if not os.path.exists(os.path.join(output_dir, "master.m3u8")):
+        return None
+    resolutions = [_DIR_RESOLUTIONS[name] for name in names if name in _DIR_RESOLUTIONS]
+    return build_manifest(output_dir, resolutions, created_at=created_at)
+
+
+class Catalog:
+    """已转换视频的索引，预览页面只从索引读取列表，不再扫描输出目录
+
+    索引在转换完成时直接更新；对输出根目录只比较修改时间，
+    有目录新增或删除时才重新列出根目录，并且只读取新增目录的清单。
+    """
+
+    def __init__(self, path=DEFAULT_CATALOG_PATH):
+        self.path = path
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with closing(self._connect()) as conn:
+            conn.executescript(SCHEMA)
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA journal_mode=WAL")
+        return conn
+
+    @staticmethod
+    def _upsert(conn, manifest):
+        output_dir = manifest['output_dir']
+        resolutions = " ".join(rendition['name'] for rendition in manifest['renditions'])
+        conn.execute(
+            "INSERT INTO titles (output_dir, root, title, created_at, duration, size, thumbnail, resolutions, manifest) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?) "
+            "ON CONFLICT (output_dir) DO UPDATE SET root = excluded.root, title = excluded.title, "
+            "created_at = excluded.created_at, duration = excluded.duration, size = excluded.size, "
+            "thumbnail = excluded.thumbnail, resolutions = excluded.resolutions, manifest = excluded.manifest",
+            (
+                output_dir,
+                os.path.dirname(output_dir),
+                manifest['title'],
+                manifest['created_at'],
+                manifest.get('duration'),
+                manifest.get('size', 0),
+                os.path.join(output_dir, manifest['thumbnail']) if manifest.get('thumbnail') else None,
+                f" {resolutions} " if resolutions else "",
+                json.dumps(manifest, ensure_ascii=False)
+            )
+        )
+
+    def add(self, manifest):
+        """添加或更新一个视频"""
+        with closing(self._connect()) as conn:
+            self._upsert(conn, manifest)
+
+    def remove(self, output_dir):
+        """从索引中删除一个视频"""
+        with closing(self._connect()) as conn:
+            conn.execute("DELETE FROM titles WHERE output_dir = ?", (os.path.abspath(output_dir),))
+
+    def refresh(self, root="output"):
+        """根据输出根目录的修改时间增量更新索引，根目录没有变化时不读取任何目录"""
+        root = os.path.abspath(root)
+        try:
+            mtime_ns = os.stat(root).st_mtime_ns
+        except OSError:
+            mtime_ns = None
+
+        with _refresh_lock, closing(self._connect()) as conn:
+            row = conn.execute("SELECT mtime_ns FROM roots WHERE root = ?", (root,)).fetchone()
+            if row is not None and row['mtime_ns'] == mtime_ns:
+                return False
+
+            indexed = {r['output_dir'] for r in conn.execute("SELECT output_dir FROM titles WHERE root = ?", (root,))}
+            present = set()
+            if mtime_ns is not None:
+                with os.scandir(root) as entries:
+                    present = {os.path.join(root, entry.name) for entry in entries if entry.is_dir()}
+
+            conn.execute("BEGIN")
+            for output_dir in indexed - present:
+                conn.execute("DELETE FROM titles WHERE output_dir = ?", (output_dir,))
+            for output_dir in present - indexed:
+                manifest = read_manifest(output_dir)
+                if manifest:
+                    self._upsert(conn, manifest)
+            if mtime_ns is None:
+                conn.execute("DELETE FROM roots WHERE root = ?", (root,))
+            else:
+                conn.execute(
+                    "INSERT INTO roots (root, mtime_ns) VALUES (?, ?) "
+                    "ON CONFLICT (root) DO UPDATE SET mtime_ns = excluded.mtime_ns",
+                    (root, mtime_ns)
+                )
+            conn.execute("COMMIT")
+            return True
+
+    def get(self, output_dir):
+        """获取一个视频的清单"""
+        with closing(self._connect()) as conn:
+            row = conn.execute("SELECT manifest FROM titles WHERE output_dir = ?", (os.path.abspath(output_dir),)).fetchone()
+        return json.loads(row['manifest']) if row else None
+
+    @staticmethod
+    def _filters(root, search=None, resolution=None, date_from=None, date_to=None):
+        """生成筛选条件：名称包含、包含某个分辨率（目录名）、创建时间范围（时间戳）"""
+        conditions = ["root = ?"]
+        params = [os.path.abspath(root)]
+        if search:
+            escaped = search.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+            conditions.append("title LIKE ? ESCAPE '\\'")
+            params.append(f"%{escaped}%")
+        if resolution:
+            conditions.append("resolutions LIKE ?")
+            params.append(f"% {resolution} %")
+        if date_from is not None:
+            conditions.append("created_at >= ?")
+            params.append(date_from)
+        if date_to is not None:
+            conditions.append("created_at < ?")
+            params.append(date_to)
+        return " AND ".join(conditions), params
+
+    def list(self, root="output", limit=None, offset=0, sort="newest", **filters):
+        """分页列出输出根目录下符合条件的视频，filters见_filters"""
+        where, params = self._filters(root, **filters)
+        order = SORT_ORDERS.get(sort, SORT_ORDERS["newest"])
+        with closing(self._connect()) as conn:
+            rows = conn.execute(
+                f"SELECT manifest FROM titles WHERE {where} ORDER BY {order}, output_dir LIMIT ? OFFSET ?",
+                (*params, -1 if limit is None else limit, offset)
+            ).fetchall()
+        return [json.loads(row['manifest']) for row in rows]
+
+    def count(self, root="output", **filters):
+        """统计输出根目录下符合条件的视频数量"""
+        where, params = self._filters(root, **filters)
+        with closing(self._connect()) as conn:
+            return conn.execute(f"SELECT COUNT(*) FROM titles WHERE {where}", params).fetchone()[0]
@@ -0,0 +1,171 @@
+import bisect
+import filecmp
+import os
+import shutil
+import subprocess
+
+from converter.commands import SINGLE_FILE_PREFIX, build_commands, get_output_renditions, get_resolution_dir
+from converter.playlist import get_byte_range, parse_attributes, read_media_playlist, write_media_playlist
+
+# 每个分段的最短时长（秒），太短的视频分段并行收益不大
+MIN_CHUNK_SECONDS = 60
+
+# 分段临时输出目录名
+CHUNKS_DIR_NAME = ".chunks"
+
+
+def get_chunk_dir(output_dir, index):
+    """获取第index个分段的临时输出目录"""
+    return os.path.join(output_dir, CHUNKS_DIR_NAME, f"chunk_{index:03d}")
+
+
+def probe_keyframes(input_file):
+    """获取源视频关键帧的时间点（只读取封装层的数据包，不解码）"""
+    cmd = [
+        'ffprobe',
+        '-v', 'error',
+        '-select_streams', 'v:0',
+        '-show_entries', 'packet=pts_time,flags',
+        '-of', 'csv=p=0',
+        input_file
+    ]
+    result = subprocess.run(cmd, capture_output=True, text=True)
+    if result.returncode != 0:
+        raise Exception(f"ffprobe failed: {result.stderr}")
+
+    keyframes = []
+    for line in result.stdout.splitlines():
+        parts = line.strip().split(",")
+        if len(parts) >= 2 and "K" in parts[1] and parts[0] not in ("", "N/A"):
+            keyframes.append(float(parts[0]))
+    keyframes.sort()
+
+    # 以第一个关键帧为起点，与 -ss 的时间基准保持一致
+    if keyframes:
+        origin = keyframes[0]
+        keyframes = [t - origin for t in keyframes]
+    return keyframes
+
+
+def plan_chunks(keyframes, duration, chunk_count, segment_time=None):
+    """在关键帧处把源视频切成若干时间段
+
+    分界点优先取在分片时长的整数倍附近，再对齐到其后的第一个关键帧，
+    这样每段结尾的分片不会太短。返回 (起始时间, 时长) 列表。
+    """
+    chunk_count = min(int(chunk_count), int(duration // MIN_CHUNK_SECONDS))
+    if chunk_count < 2 or not keyframes:
+        return [(0.0, duration)]
+
+    boundaries = [0.0]
+    for i in range(1, chunk_count):
+        target = duration * i / chunk_count
+        if segment_time:
+            target = round(target / float(segment_time)) * float(segment_time)
+        index = bisect.bisect_left(keyframes, target)
+        if index >= len(keyframes):
+            break
+        boundary = keyframes[index]
+        if boundary <= boundaries[-1] or boundary >= duration:
+            continue
+        boundaries.append(boundary)
+    boundaries.append(duration)
+
+    return [(start, end - start) for start, end in zip(boundaries, boundaries[1:])]
+
+
+def build_chunk_jobs(input_file, output_dir, settings, chunks, has_audio=True):
+    """为每个时间段生成转换任务，各段输出到独立的临时目录"""
+    jobs = []
+    for index, (start, length) in enumerate(chunks):
+        # 最后一段一直转换到文件结尾，避免时长误差丢掉末尾的画面
+        is_last = index == len(chunks) - 1
+        chunk_jobs = build_commands(
+            input_file,
+            get_chunk_dir(output_dir, index),
+            settings,
+            has_audio,
+            start,
+            None if is_last else length
+        )
+        for job in chunk_jobs:
+            job['chunk'] = index
+            job['duration'] = length
+            job['time_offset'] = start
+            jobs.append(job)
+    return jobs
+
+
+def stitch_playlists(chunk_dirs, rendition_dir, output_name):
+    """把各段的分片按顺序移动到分辨率目录，并生成一个连续的播放列表
+
+    fMP4模式下各段有各自的初始化分片：与前一段内容相同时共用前一段的，
+    不同时重命名为init_NNN.mp4后由EXT-X-MAP分别引用。
+    单文件输出时每段的媒体文件整体移动并按段号重命名，EXT-X-BYTERANGE保持不变。
+    """
+    segments = []
+    version = 3
+    init_uri = None
+    for chunk_index, chunk_dir in enumerate(chunk_dirs):
+        playlist = read_media_playlist(os.path.join(chunk_dir, f"{output_name}.m3u8"))
+        version = max(version, playlist['version'])
+        media_files = {}
+
+        def move_media_file(uri):
+            # 同一个媒体文件被多个分片引用，只移动一次
+            if uri not in media_files:
+                media_files[uri] = f"{SINGLE_FILE_PREFIX}{chunk_index:03d}{os.path.splitext(uri)[1]}"
+                os.replace(os.path.join(chunk_dir, uri), os.path.join(rendition_dir, media_files[uri]))
+            return media_files[uri]
+
+        for segment in playlist['segments']:
+            tags = []
+            for tag in segment['tags']:
+                if tag.startswith("#EXT-X-MAP:"):
+                    map_attributes = parse_attributes(tag.split(":", 1)[1])
+                    if 'BYTERANGE' in map_attributes:
+                        # 单文件输出时初始化分片在媒体文件开头
+                        init_uri = move_media_file(map_attributes['URI'])
+                        tag = f'#EXT-X-MAP:URI="{init_uri}",BYTERANGE="{map_attributes["BYTERANGE"]}"'
+                    else:
+                        chunk_init = os.path.join(chunk_dir, map_attributes['URI'])
+                        if init_uri and filecmp.cmp(chunk_init, os.path.join(rendition_dir, init_uri), shallow=False):
+                            # 与前一段相同，不需要再插入EXT-X-MAP
+                            os.remove(chunk_init)
+                            continue
+                        name, extension = os.path.splitext(os.path.basename(chunk_init))
+                        init_uri = f"{name}_{chunk_index:03d}{extension}"
+                        os.replace(chunk_init, os.path.join(rendition_dir, init_uri))
+                        tag = f'#EXT-X-MAP:URI="{init_uri}"'
+                tags.append(tag)
+
+            if get_byte_range(segment):
+                uri = move_media_file(segment['uri'])
+            else:
+                extension = os.path.splitext(segment['uri'])[1]
+                uri = f"segment_{len(segments):03d}{extension}"
+                os.replace(os.path.join(chunk_dir, segment['uri']), os.path.join(rendition_dir, uri))
+            segments.append({'duration': segment['duration'], 'uri': uri, 'tags': tags})
+
+    write_media_playlist(os.path.join(rendition_dir, f"{output_name}.m3u8"), {
+        'version': version,
+        'media_sequence': 0,
+        'playlist_type': "VOD",
+        'endlist': True,
+        'segments': segments
+    })
+    return len(segments)
+
+
+def stitch_chunks(output_dir, settings, chunk_count):
+    """合并所有分辨率的分段输出，并清理临时目录"""
+    output_name = settings.get('output_name', 'playlist')
+    for resolution in get_output_renditions(settings):
+        chunk_dirs = [get_resolution_dir(get_chunk_dir(output_dir, i), resolution) for i in range(chunk_count)]
+        # 断点续转时已经合并过的分辨率、没有音频时的音频路都没有分段输出
+        if not os.path.exists(os.path.join(chunk_dirs[0], f"{output_name}.m3u8")):
+            continue
+        rendition_dir = get_resolution_dir(output_dir, resolution)
+        os.makedirs(rendition_dir, exist_ok=True)
+        stitch_playlists(chunk_dirs, rendition_dir, output_name)
+    shutil.rmtree(os.path.join(output_dir, CHUNKS_DIR_NAME), ignore_errors=True)
@@ -0,0 +1,335 @@
+import argparse
+import json
+import sys
+import threading
+
+from converter.cache import get_cached_ladder
+from converter.capabilities import detect_capabilities
+from converter.commands import SEGMENT_TYPES
+from converter.job_queue import DEFAULT_QUEUE_PATH, JobQueue, run_worker
+from converter.ladder import format_ladder, propose_ladder
+from converter.pipeline import convert, expand_inputs, get_output_dirs
+from converter.scheduler import format_eta
+from converter.segment_crypto import DEFAULT_WORKERS, protect_output
+from converter.settings import get_default_settings, load_settings
+
+
+def parse_ladder(text, settings):
+    """解析分辨率阶梯，如 1920x1080:4500k,1280x720:2500k（码率可省略，使用默认码率）"""
+    resolutions = []
+    video_bitrates = dict(settings['video_bitrates'])
+    for item in text.split(","):
+        item = item.strip()
+        if not item:
+            continue
+        resolution, _, bitrate = item.partition(":")
+        if resolution == "raw":
+            resolution = "原始分辨率"
+        if resolution not in video_bitrates and not bitrate:
+            raise argparse.ArgumentTypeError(f"未知分辨率 {resolution}，请同时指定码率，如 {resolution}:3000k")
+        if bitrate:
+            video_bitrates[resolution] = bitrate
+        resolutions.append(resolution)
+    return resolutions, video_bitrates
+
+
+def build_settings(args):
+    """根据命令行参数生成转换设置"""
+    settings = load_settings(args.config) if args.config else get_default_settings()
+    if args.video_encoder:
+        settings['video_encoder'] = args.video_encoder
+    if args.ladder:
+        settings['resolutions'], settings['video_bitrates'] = parse_ladder(args.ladder, settings)
+    if args.auto_ladder:
+        settings['auto_ladder'] = True
+    if args.ladder_crf:
+        settings['ladder_crf'] = args.ladder_crf
+    if args.audio_encoder:
+        settings['audio_encoder'] = args.audio_encoder
+    if args.audio_bitrate:
+        settings['audio_bitrate'] = args.audio_bitrate
+    if args.segment_time:
+        settings['segment_time'] = str(args.segment_time)
+    if args.segment_type:
+        settings['segment_type'] = args.segment_type
+    if args.separate_audio:
+        settings['separate_audio'] = True
+    if args.single_file:
+        settings['single_file'] = True
+    if args.single_decode:
+        settings['single_decode'] = True
+    if args.no_hw_decode:
+        settings['hw_decode'] = False
+    if args.parallel is not None:
+        settings['max_parallel_jobs'] = args.parallel
+    if args.chunks is not None:
+        settings['chunk_count'] = args.chunks
+    if args.no_resume:
+        settings['resume'] = False
+    if args.no_cache:
+        settings['cache'] = False
+    if args.no_previews:
+        settings['previews'] = False
+    if args.no_aligned_keyframes:
+        settings['aligned_keyframes'] = False
+    if args.scene_cuts:
+        settings['scene_cuts'] = True
+    if args.first_frame_poster:
+        settings['smart_poster'] = False
+    settings['output_name'] = args.output_name
+    settings.setdefault('playlist_type', 'vod')
+    return settings
+
+
+def run_convert(args):
+    """convert子命令：转换一个或多个视频，把结果以JSON输出到标准输出"""
+    try:
+        settings = build_settings(args)
+    except (argparse.ArgumentTypeError, OSError, ValueError) as e:
+        print(f"参数错误: {e}", file=sys.stderr)
+        return 2
+
+    input_files = expand_inputs(args.inputs)
+    if not input_files:
+        print("没有找到要转换的文件", file=sys.stderr)
+        return 2
+
+    def on_status(message):
+        if args.verbose:
+            print(message, file=sys.stderr)
+
+    def on_progress(state):
+        if args.verbose:
+            print(f"进度 {state['overall'] * 100:.1f}%，预计剩余 {format_eta(state['eta'])}", file=sys.stderr)
+
+    results = []
+    for input_file, output_dir in zip(input_files, get_output_dirs(input_files, args.output_dir)):
+        on_status(f"开始转换 {input_file} -> {output_dir}")
+        try:
+            results.append(convert(input_file, output_dir, settings, on_progress, on_status))
+        except Exception as e:
+            results.append({
+                'input_file': input_file,
+                'output_dir': output_dir,
+                'status': 'failed',
+                'error': str(e)
+            })
+
+    failed = sum(1 for result in results if result['status'] != 'success')
+    json.dump({
+        'succeeded': len(results) - failed,
+        'failed': failed,
+        'results': results
+    }, sys.stdout, ensure_ascii=False, indent=2)
+    sys.stdout.write("\n")
+    return 1 if failed else 0
+
+
+def run_ladder(args):
+    """ladder子命令：按视频内容推荐分辨率阶梯和码率，以JSON输出，不转换"""
+    try:
+        settings = build_settings(args)
+    except (argparse.ArgumentTypeError, OSError, ValueError) as e:
+        print(f"参数错误: {e}", file=sys.stderr)
+        return 2
+
+    input_files = expand_inputs(args.inputs)
+    if not input_files:
+        print("没有找到要分析的文件", file=sys.stderr)
+        return 2
+
+    results = {}
+    failed = 0
+    for input_file in input_files:
+        try:
+            if settings['cache']:
+                proposal = get_cached_ladder(input_file, settings)
+            else:
+                proposal = propose_ladder(input_file, settings)
+            proposal['ladder'] = format_ladder(proposal['resolutions'], proposal['video_bitrates'])
+            results[input_file] = proposal
+        except Exception as e:
+            failed += 1
+            results[input_file] = {'error': str(e)}
+            print(f"{input_file}: {e}", file=sys.stderr)
+    json.dump(results, sys.stdout, ensure_ascii=False, indent=2)
+    sys.stdout.write("\n")
+    return 1 if failed else 0
+
+
+def run_enqueue(args):
+    """enqueue子命令：把视频加入持久化队列，由worker子命令在后台转换"""
+    try:
+        settings = build_settings(args)
+    except (argparse.ArgumentTypeError, OSError, ValueError) as e:
+        print(f"参数错误: {e}", file=sys.stderr)
+        return 2
+
+    input_files = expand_inputs(args.inputs)
+    if not input_files:
+        print("没有找到要转换的文件", file=sys.stderr)
+        return 2
+
+    job_queue = JobQueue(args.queue)
+    jobs = []
+    for input_file, output_dir in zip(input_files, get_output_dirs(input_files, args.output_dir)):
+        job_id = job_queue.enqueue(input_file, output_dir, settings)
+        jobs.append({'id': job_id, 'input_file': input_file, 'output_dir': output_dir})
+
+    json.dump({'enqueued': len(jobs), 'jobs': jobs}, sys.stdout, ensure_ascii=False, indent=2)
+    sys.stdout.write("\n")
+    return 0
+
+
+def run_workers(args):
+    """worker子命令：启动工作线程处理队列中的任务，中断后重启会继续未完成的任务"""
+    job_queue = JobQueue(args.queue)
+    stop_event = threading.Event()
+
+    def on_status(message):
+        print(message, file=sys.stderr)
+
+    threads = [
+        threading.Thread(
+            target=run_worker,
+            kwargs={'job_queue': job_queue, 'stop_event': stop_event, 'drain': args.drain, 'on_status': on_status},
+            daemon=True
+        )
+        for _ in range(max(1, args.workers))
+    ]
+    for thread in threads:
+        thread.start()
+    try:
+        while any(thread.is_alive() for thread in threads):
+            for thread in threads:
+                thread.join(timeout=1)
+    except KeyboardInterrupt:
+        # 正在转换的任务租约到期后会被下次启动的工作进程重新领取
+        stop_event.set()
+        print("已停止领取新任务", file=sys.stderr)
+        return 130
+
+    counts = job_queue.counts()
+    json.dump(counts, sys.stdout, ensure_ascii=False, indent=2)
+    sys.stdout.write("\n")
+    return 1 if counts.get('failed') else 0
+
+
+def run_list_jobs(args):
+    """jobs子命令：以JSON列出队列中的任务"""
+    jobs = JobQueue(args.queue).list(status=args.status, limit=args.limit)
+    json.dump(jobs, sys.stdout, ensure_ascii=False, indent=2)
+    sys.stdout.write("\n")
+    return 0
+
+
+def run_capabilities(args):
+    """capabilities子命令：以JSON输出FFmpeg和硬件编码器的检测结果"""
+    env_info = detect_capabilities(refresh=args.refresh)
+    json.dump(env_info, sys.stdout, ensure_ascii=False, indent=2)
+    sys.stdout.write("\n")
+    return 0 if env_info['ffmpeg_installed'] else 1
+
+
+def add_settings_arguments(parser):
+    """添加转换设置相关的参数"""
+    parser.add_argument("inputs", nargs="+", help="输入文件路径或通配符，如 'input/*.mp4'")
+    parser.add_argument("-o", "--output-dir", default="output", help="输出根目录，每个输入文件输出到以文件名命名的子目录")
+    parser.add_argument("--config", help="JSON配置文件，格式与 config/convert_config.json 相同")
+    parser.add_argument("--ladder", help="分辨率阶梯，如 1920x1080:4500k,1280x720:2500k，raw表示原始分辨率")
+    parser.add_argument("--auto-ladder", action="store_true", help="转换前试编码采样片段，按视频内容推荐分辨率阶梯和码率")
+    parser.add_argument("--ladder-crf", type=int, help="推荐码率对应的画质（x264的CRF，默认23，越小画质越高）")
+    parser.add_argument("--video-encoder", choices=["copy", "libx264", "h264_nvenc", "h264_qsv", "h264_videotoolbox"])
+    parser.add_argument("--audio-encoder", choices=["copy", "aac"])
+    parser.add_argument("--audio-bitrate", help="音频码率，如 128k")
+    parser.add_argument("--segment-time", type=int, help="分片时长(秒)")
+    parser.add_argument("--segment-type", choices=list(SEGMENT_TYPES), help="分片格式，fmp4为CMAF分片并额外生成DASH清单")
+    parser.add_argument("--separate-audio", action="store_true", help="音频只编码一次，作为单独的音频组供所有分辨率共用（fmp4模式下总是如此）")
+    parser.add_argument("--single-file", action="store_true", help="每个分辨率只写一个媒体文件，播放列表用EXT-X-BYTERANGE引用分片（不能与加密同时使用）")
+    parser.add_argument("--output-name", default="playlist", help="分辨率播放列表文件名（不含扩展名）")
+    parser.add_argument("--single-decode", action="store_true", help="单次解码多路输出")
+    parser.add_argument("--no-hw-decode", action="store_true", help="使用GPU编码器时仍用CPU解码和缩放")
+    parser.add_argument("--parallel", type=int, help="并行任务数，0为自动")
+    parser.add_argument("--chunks", type=int, help="分段并行编码的段数，0为不分段")
+    parser.add_argument("--no-resume", action="store_true", help="不从上次中断处继续，重新转换所有分片")
+    parser.add_argument("--no-cache", action="store_true", help="不复用相同内容的已有转换结果")
+    parser.add_argument("--no-previews", action="store_true", help="不生成封面、雪碧图和缩略图轨道")
+    parser.add_argument("--no-aligned-keyframes", action="store_true", help="不对齐各分辨率的关键帧，由编码器自行决定")
+    parser.add_argument("--scene-cuts", action="store_true", help="检测场景切换，分片边界尽量落在场景切换处")
+    parser.add_argument("--first-frame-poster", action="store_true", help="使用第一帧作为封面，不自动挑选")
+
+
+def run_protect(args):
+    """encrypt/decrypt子命令：对已转换的视频加密或解密分片，不重新编码"""
+    decrypt = args.command == "decrypt"
+    results = {}
+    failed = 0
+    for output_dir in args.output_dirs:
+        try:
+            results[output_dir] = protect_output(
+                output_dir,
+                decrypt=decrypt,
+                output_name=args.output_name,
+                rotation=getattr(args, 'key_rotation', 0),
+                workers=args.workers
+            )
+        except Exception as e:
+            failed += 1
+            results[output_dir] = {'error': str(e)}
+            print(f"{output_dir}: {e}", file=sys.stderr)
+    json.dump(results, sys.stdout, ensure_ascii=False, indent=2)
+    sys.stdout.write("\n")
+    return 1 if failed else 0
+
+
+def build_parser():
+    """构建命令行参数解析器"""
+    parser = argparse.ArgumentParser(prog="python -m converter", description="MP4转M3U8命令行工具")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    convert_parser = subparsers.add_parser("convert", help="把视频转换为多分辨率HLS")
+    add_settings_arguments(convert_parser)
+    convert_parser.add_argument("-v", "--verbose", action="store_true", help="在标准错误输出中打印进度")
+    convert_parser.set_defaults(func=run_convert)
+
+    ladder_parser = subparsers.add_parser("ladder", help="按视频内容推荐分辨率阶梯和码率")
+    add_settings_arguments(ladder_parser)
+    ladder_parser.set_defaults(func=run_ladder)
+
+    enqueue_parser = subparsers.add_parser("enqueue", help="把视频加入批量转换队列")
+    add_settings_arguments(enqueue_parser)
+    enqueue_parser.add_argument("--queue", default=DEFAULT_QUEUE_PATH, help="队列数据库路径")
+    enqueue_parser.set_defaults(func=run_enqueue)
+
+    worker_parser = subparsers.add_parser("worker", help="处理批量转换队列中的任务")
+    worker_parser.add_argument("-n", "--workers", type=int, default=1, help="同时转换的视频数")
+    worker_parser.add_argument("--drain", action="store_true", help="队列为空时退出，而不是等待新任务")
+    worker_parser.add_argument("--queue", default=DEFAULT_QUEUE_PATH, help="队列数据库路径")
+    worker_parser.set_defaults(func=run_workers)
+
+    jobs_parser = subparsers.add_parser("jobs", help="查看批量转换队列中的任务")
+    jobs_parser.add_argument("--status", choices=["queued", "running", "success", "failed", "cancelled"])
+    jobs_parser.add_argument("--limit", type=int, default=100)
+    jobs_parser.add_argument("--queue", default=DEFAULT_QUEUE_PATH, help="队列数据库路径")
+    jobs_parser.set_defaults(func=run_list_jobs)
+
+    capabilities_parser = subparsers.add_parser("capabilities", help="检测FFmpeg和可用的硬件编码器")
+    capabilities_parser.add_argument("--refresh", action="store_true", help="忽略缓存，重新检测")
+    capabilities_parser.set_defaults(func=run_capabilities)
+
+    for name, help_text in (("encrypt", "用AES-128加密已转换视频的分片"), ("decrypt", "解密已转换视频的分片")):
+        protect_parser = subparsers.add_parser(name, help=help_text)
+        protect_parser.add_argument("output_dirs", nargs="+", help="视频输出目录（包含各分辨率子目录）")
+        protect_parser.add_argument("--output-name", default="playlist", help="分辨率播放列表文件名（不含扩展名）")
+        protect_parser.add_argument("-j", "--workers", type=int, default=DEFAULT_WORKERS, help="同时处理的分片数")
+        if name == "encrypt":
+            protect_parser.add_argument("--key-rotation", type=int, default=0, help="每隔多少个分片更换一次密钥，0为不轮换")
+        protect_parser.set_defaults(func=run_protect)
+
+    return parser
+
+
+def main(argv=None):
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    return args.func(args)
@@ -0,0 +1,391 @@
+import os
+import platform
+import shlex
+import subprocess
+
+from converter.keyframes import build_keyframe_args
+from converter.previews import add_preview_outputs
+
+# 分辨率到输出子目录名的映射
+RESOLUTION_DIRS = {
+    "3840x2160": "4k",
+    "2560x1440": "2k",
+    "1920x1080": "1080p",
+    "1280x720": "720p",
+    "854x480": "480p",
+    "640x360": "360p",
+    "原始分辨率": "raw"
+}
+
+# 分辨率的显示名称
+RESOLUTION_LABELS = {
+    "3840x2160": "4K (3840x2160)",
+    "2560x1440": "2K (2560x1440)",
+    "1920x1080": "1080P (1920x1080)",
+    "1280x720": "720P (1280x720)",
+    "854x480": "480P (854x480)",
+    "640x360": "360P (640x360)",
+    "原始分辨率": "原始分辨率"
+}
+
+# 单独输出音频时使用的伪分辨率，音频只编码一次，写到audio子目录供所有分辨率共用
+AUDIO_RENDITION = "audio"
+
+# 分片封装格式：MPEG-TS，或CMAF（fMP4分片加初始化分片，HLS和DASH都能播放）
+SEGMENT_TYPES = {
+    "mpegts": "MPEG-TS (.ts)",
+    "fmp4": "CMAF / fMP4 (.m4s)"
+}
+
+# fMP4模式下每个分辨率目录中的初始化分片文件名
+INIT_SEGMENT_NAME = "init.mp4"
+
+# 单文件输出时媒体文件名的前缀（后接起始分片序号）
+SINGLE_FILE_PREFIX = "media_"
+
+# GPU编码器对应的硬件解码方式，解码、缩放和编码都在GPU上完成，帧不经过内存
+HW_DECODERS = {
+    "nvenc": "cuda",
+    "qsv": "qsv"
+}
+
+# 硬件解码或GPU缩放初始化失败时FFmpeg输出的错误，出现时改用CPU解码重新执行
+# （没有驱动或设备、会话数超限，或源视频的编码格式GPU不能解码导致帧不在显存中）
+HWACCEL_ERRORS = (
+    "Device creation failed",
+    "Cannot load libcuda",
+    "Could not dynamically load CUDA",
+    "No device available for decoder",
+    "hwaccel initialisation returned error",
+    "Error creating a MFX session",
+    "Error initializing an MFX session",
+    "Impossible to convert between the formats supported by the filter"
+)
+
+
+def get_resolution_dir_name(resolution):
+    """获取分辨率对应的输出子目录名"""
+    if resolution == AUDIO_RENDITION:
+        return AUDIO_RENDITION
+    return RESOLUTION_DIRS.get(resolution, "raw")
+
+
+def get_resolution_dir(output_dir, resolution):
+    """获取分辨率对应的输出目录"""
+    return os.path.join(output_dir, get_resolution_dir_name(resolution))
+
+
+def get_resolution_label(resolution):
+    """获取分辨率的显示名称"""
+    if resolution == AUDIO_RENDITION:
+        return "音频"
+    return RESOLUTION_LABELS.get(resolution, resolution)
+
+
+def get_output_resolutions(settings):
+    """获取实际要输出的分辨率列表（直接复制模式只输出原始分辨率）"""
+    if settings['video_encoder'] == "copy":
+        return ["原始分辨率"]
+    return list(settings['resolutions'])
+
+
+def is_fmp4(settings):
+    """是否输出fMP4（CMAF）分片"""
+    return settings.get('segment_type') == "fmp4"
+
+
+def get_segment_extension(settings):
+    """分片文件的扩展名"""
+    return ".m4s" if is_fmp4(settings) else ".ts"
+
+
+def uses_separate_audio(settings):
+    """音频是否单独输出为一路
+
+    单独输出时音频只编码一次，主播放列表用EXT-X-MEDIA音频组引用，各分辨率只包含视频。
+    fMP4模式下总是单独输出（CMAF每个轨道一路，DASH作为单独的AdaptationSet）。
+    """
+    return is_fmp4(settings) or bool(settings.get('separate_audio'))
+
+
+def uses_single_file(settings):
+    """每个分辨率是否只写一个媒体文件，播放列表用EXT-X-BYTERANGE引用其中的各个分片
+
+    整段加密要求每个分片单独加密，与单文件输出不兼容，启用加密时仍按分片输出。
+    """
+    return bool(settings.get('single_file')) and not settings.get('encryption_enabled')
+
+
+def get_output_renditions(settings, has_audio=True):
+    """获取要输出的所有路（各分辨率的视频，音频单独输出时再加一路音频）"""
+    renditions = get_output_resolutions(settings)
+    if has_audio and uses_separate_audio(settings):
+        renditions.append(AUDIO_RENDITION)
+    return renditions
+
+
+def get_hwaccel(settings):
+    """GPU编码时使用的硬件解码方式（cuda/qsv），不使用硬件解码时返回None"""
+    video_encoder = settings['video_encoder']
+    if not settings.get('hw_decode') or video_encoder == "copy":
+        return None
+    for family, hwaccel in HW_DECODERS.items():
+        if family in video_encoder:
+            return hwaccel
+    return None
+
+
+def get_cpu_settings(settings):
+    """硬件解码失败时重新执行使用的设置：CPU解码和缩放，仍用GPU编码"""
+    return {**settings, 'hw_decode': False}
+
+
+def is_hwaccel_failure(stderr):
+    """FFmpeg的错误输出是否表明硬件解码或GPU缩放无法初始化"""
+    return any(error in (stderr or "") for error in HWACCEL_ERRORS)
+
+
+def get_scale_filter(resolution, hwaccel=None):
+    """缩放到指定分辨率的滤镜
+
+    硬件解码时帧留在显存中，用scale_cuda/vpp_qsv在GPU上缩放，并统一转换为8位nv12
+    （10位的源视频也能交给H.264编码器）；原始分辨率只转换像素格式。
+    """
+    size = None if resolution == "原始分辨率" else resolution.split("x")
+    if hwaccel == "cuda":
+        return f"scale_cuda={size[0]}:{size[1]}:format=nv12" if size else "scale_cuda=format=nv12"
+    if hwaccel == "qsv":
+        return f"vpp_qsv=w={size[0]}:h={size[1]}:format=nv12" if size else "vpp_qsv=format=nv12"
+    return f"scale={size[0]}:{size[1]}" if size else "null"
+
+
+def get_encoder_args(video_encoder):
+    """根据不同编码器返回特定参数"""
+    if video_encoder == "libx264":
+        return ["-preset", "fast"]
+    elif "nvenc" in video_encoder:
+        return ["-preset", "p4", "-rc", "cbr"]
+    elif "qsv" in video_encoder:
+        return ["-preset", "medium"]
+    elif "videotoolbox" in video_encoder:
+        return ["-allow_sw", "1"]
+    return []
+
+
+def _audio_args(settings):
+    """音频编码参数"""
+    args = ["-c:a", settings['audio_encoder']]
+    if settings['audio_encoder'] != "copy":
+        args.extend(["-b:a", settings['audio_bitrate']])
+    return args
+
+
+def _hls_args(settings, segment_dir):
+    """HLS切片参数
+
+    启用加密时FFmpeg仍输出明文分片，转换完成后再按分片序号统一加密（见segment_crypto）。
+    """
+    flags = []
+    if uses_single_file(settings):
+        # 续转时写到以起始序号命名的新文件，不覆盖已被播放列表引用的部分
+        segment_file = f"{SINGLE_FILE_PREFIX}{int(settings.get('start_number') or 0):03d}{get_segment_extension(settings)}"
+        flags.append("single_file")
+    else:
+        segment_file = f"segment_%03d{get_segment_extension(settings)}"
+    args = [
+        "-f", "hls",
+        "-hls_time", str(settings['segment_time']),
+        "-hls_playlist_type", settings.get('playlist_type', 'vod'),
+        "-hls_segment_filename", f"{segment_dir}/{segment_file}"
+    ]
+    if is_fmp4(settings):
+        # 初始化分片与播放列表在同一目录，播放列表用EXT-X-MAP引用
+        args.extend(["-hls_segment_type", "fmp4", "-hls_fmp4_init_filename", INIT_SEGMENT_NAME])
+    if settings.get('start_number'):
+        args.extend(["-start_number", str(settings['start_number'])])
+    if flags:
+        args.extend(["-hls_flags", "+".join(flags)])
+    return args
+
+
+def _input_args(input_file, start=None, length=None, hwaccel=None):
+    """输入参数，指定start/length时只转换源视频的一段，指定hwaccel时用GPU解码"""
+    args = ["ffmpeg", "-y"]
+    if hwaccel:
+        args.extend(["-hwaccel", hwaccel, "-hwaccel_output_format", hwaccel])
+    if start:
+        args.extend(["-ss", f"{start:.3f}"])
+    if length:
+        args.extend(["-t", f"{length:.3f}"])
+    args.extend(["-i", input_file])
+    return args
+
+
+def _offset_args(start=None):
+    """分段转换时保持输出时间戳与原视频连续"""
+    if start:
+        return ["-output_ts_offset", f"{start:.3f}"]
+    return []
+
+
+def build_rendition_command(input_file, output_dir, resolution, settings, start=None, length=None):
+    """构建单个分辨率的FFmpeg命令（resolution为AUDIO_RENDITION时只输出音频）"""
+    if resolution == AUDIO_RENDITION:
+        return build_audio_command(input_file, output_dir, settings, start, length)
+
+    video_encoder = settings['video_encoder']
+    hwaccel = get_hwaccel(settings)
+    command_parts = _input_args(input_file, start, length, hwaccel)
+
+    # 视频编码参数
+    command_parts.extend(["-c:v", video_encoder])
+    if video_encoder != "copy":
+        if hwaccel:
+            command_parts.extend(["-vf", get_scale_filter(resolution, hwaccel)])
+        elif resolution != "原始分辨率":
+            command_parts.extend(["-s", resolution])
+        command_parts.extend(["-b:v", settings['video_bitrates'][resolution]])
+        command_parts.extend(get_encoder_args(video_encoder))
+        command_parts.extend(build_keyframe_args(settings, start, length))
+
+    # 音频编码参数，单独输出音频时视频路不带音频
+    if uses_separate_audio(settings):
+        command_parts.append("-an")
+    else:
+        command_parts.extend(_audio_args(settings))
+
+    # HLS参数
+    command_parts.extend(_offset_args(start))
+    resolution_dir = get_resolution_dir(output_dir, resolution)
+    command_parts.extend(_hls_args(settings, resolution_dir))
+
+    # 输出文件
+    command_parts.append(os.path.join(resolution_dir, f"{settings.get('output_name', 'playlist')}.m3u8"))
+    return command_parts
+
+
+def build_audio_command(input_file, output_dir, settings, start=None, length=None):
+    """构建只输出音频的FFmpeg命令，音频只编码一次，所有分辨率共用"""
+    command_parts = _input_args(input_file, start, length)
+    command_parts.extend(["-vn", "-map", "0:a:0"])
+    command_parts.extend(_audio_args(settings))
+    command_parts.extend(_offset_args(start))
+    audio_dir = get_resolution_dir(output_dir, AUDIO_RENDITION)
+    command_parts.extend(_hls_args(settings, audio_dir))
+    command_parts.append(os.path.join(audio_dir, f"{settings.get('output_name', 'playlist')}.m3u8"))
+    return command_parts
+
+
+def build_single_decode_command(input_file, output_dir, settings, has_audio=True, start=None, length=None):
+    """构建单次解码、多路输出的FFmpeg命令
+
+    源视频只解码一次，通过split滤镜分发给每个分辨率的scale，
+    再用var_stream_map在一个进程里写出所有分辨率的播放列表。
+    硬件解码时split分发的是显存中的帧，每路在GPU上缩放。
+    """
+    resolutions = get_output_resolutions(settings)
+    count = len(resolutions)
+    hwaccel = get_hwaccel(settings)
+
+    # split + 每路scale的滤镜图
+    filters = [f"[0:v]split={count}" + "".join(f"[s{i}]" for i in range(count))]
+    for i, resolution in enumerate(resolutions):
+        filters.append(f"[s{i}]{get_scale_filter(resolution, hwaccel)}[v{i}]")
+
+    command_parts = _input_args(input_file, start, length, hwaccel) + ["-filter_complex", ";".join(filters)]
+
+    # 每路输出一个视频流，有音频时每路各映射一份音频；音频单独输出时只映射一次，作为单独的一路
+    separate_audio = uses_separate_audio(settings)
+    stream_map = []
+    for i, resolution in enumerate(resolutions):
+        command_parts.extend(["-map", f"[v{i}]"])
+        if has_audio and not separate_audio:
+            command_parts.extend(["-map", "0:a:0"])
+            stream_map.append(f"v:{i},a:{i},name:{get_resolution_dir_name(resolution)}")
+        else:
+            stream_map.append(f"v:{i},name:{get_resolution_dir_name(resolution)}")
+    if has_audio and separate_audio:
+        command_parts.extend(["-map", "0:a:0"])
+        stream_map.append(f"a:0,name:{AUDIO_RENDITION}")
+
+    # 视频编码参数
+    command_parts.extend(["-c:v", settings['video_encoder']])
+    for i, resolution in enumerate(resolutions):
+        command_parts.extend([f"-b:v:{i}", settings['video_bitrates'][resolution]])
+    command_parts.extend(get_encoder_args(settings['video_encoder']))
+    command_parts.extend(build_keyframe_args(settings, start, length))
+
+    # 音频编码参数
+    if has_audio:
+        command_parts.extend(_audio_args(settings))
+
+    # HLS参数，%v 会被替换为var_stream_map中的name
+    command_parts.extend(_offset_args(start))
+    segment_dir = os.path.join(output_dir, "%v")
+    command_parts.extend(_hls_args(settings, segment_dir))
+    command_parts.extend(["-var_stream_map", " ".join(stream_map)])
+
+    # 输出文件
+    command_parts.append(os.path.join(segment_dir, f"{settings.get('output_name', 'playlist')}.m3u8"))
+    return command_parts
+
+
+def build_commands(input_file, output_dir, settings, has_audio=True, start=None, length=None):
+    """根据设置生成所有要执行的转换任务
+
+    返回任务列表，每个任务包含该命令负责的分辨率列表、视频编码器、输出目录和命令参数。
+    指定start/length时只转换源视频的一段（用于分段并行编码）。
+    使用硬件解码的任务另带fallback_command（CPU解码的同一命令），硬件解码初始化失败时改用它重新执行。
+    """
+    resolutions = get_output_resolutions(settings)
+    separate_audio = has_audio and uses_separate_audio(settings)
+    hwaccel = get_hwaccel(settings)
+    if settings.get('single_decode') and settings['video_encoder'] != "copy" and len(resolutions) > 1:
+        jobs = [{
+            'resolutions': resolutions + ([AUDIO_RENDITION] if separate_audio else []),
+            'encoder': settings['video_encoder'],
+            'output_dir': output_dir,
+            'command': build_single_decode_command(input_file, output_dir, settings, has_audio, start, length)
+        }]
+        if hwaccel:
+            jobs[0]['fallback_command'] = build_single_decode_command(
+                input_file, output_dir, get_cpu_settings(settings), has_audio, start, length
+            )
+    else:
+        jobs = []
+        for resolution in resolutions:
+            job = {
+                'resolutions': [resolution],
+                'encoder': settings['video_encoder'],
+                'output_dir': output_dir,
+                'command': build_rendition_command(input_file, output_dir, resolution, settings, start, length)
+            }
+            if hwaccel:
+                job['fallback_command'] = build_rendition_command(
+                    input_file, output_dir, resolution, get_cpu_settings(settings), start, length
+                )
+            jobs.append(job)
+        if separate_audio:
+            jobs.append({
+                'resolutions': [AUDIO_RENDITION],
+                'encoder': settings['audio_encoder'],
+                'output_dir': output_dir,
+                'command': build_audio_command(input_file, output_dir, settings, start, length)
+            })
+
+    # 转换整个视频时由第一个任务顺带生成封面和雪碧图，不再单独解码一次源视频
+    # （硬件解码时从解码后的显存帧复制一路回内存；CPU解码的备用命令同样带上）
+    if (settings.get('previews', True) and settings['video_encoder'] != "copy"
+            and start is None and length is None):
+        jobs[0]['command'] = add_preview_outputs(jobs[0]['command'], output_dir, settings, hwaccel)
+        if 'fallback_command' in jobs[0]:
+            jobs[0]['fallback_command'] = add_preview_outputs(jobs[0]['fallback_command'], output_dir, settings)
+        jobs[0]['previews'] = True
+    return jobs
+
+
+def format_command(command_parts):
+    """将命令参数格式化为可复制到终端执行的字符串"""
+    if platform.system() == "Windows":
+        return subprocess.list2cmdline(command_parts)
+    return shlex.join(command_parts)
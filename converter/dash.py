@@ -0,0 +1,162 @@
+import os
+import re
+import xml.etree.ElementTree as ET
+
+from converter.playlist import measure_bitrate, parse_attributes, read_media_playlist
+from converter.probe import get_codec_string, get_media_streams
+
+# 与HLS主播放列表放在同一目录的DASH清单
+DASH_MANIFEST_NAME = "manifest.mpd"
+
+# SegmentTimeline的时间单位（毫秒）
+DASH_TIMESCALE = 1000
+
+# 分片文件名中的序号，DASH清单用SegmentTemplate的$Number$按序号引用分片
+SEGMENT_NAME_PATTERN = re.compile(r"^segment_(\d+)\.m4s$")
+
+AUDIO_CHANNEL_SCHEME = "urn:mpeg:dash:23003:3:audio_channel_configuration:2011"
+
+
+def get_dash_manifest_path(output_dir):
+    return os.path.join(output_dir, DASH_MANIFEST_NAME)
+
+
+def _format_duration(seconds):
+    return f"PT{seconds:.3f}S"
+
+
+def _segment_timeline(durations):
+    """把分片时长转换为SegmentTimeline，连续相同时长的分片合并为一项（r为重复次数）
+
+    按累计时间取整再求差，分片再多也不会累积误差。
+    """
+    entries = []
+    elapsed = 0.0
+    for duration in durations:
+        start = round(elapsed * DASH_TIMESCALE)
+        elapsed += duration
+        length = round(elapsed * DASH_TIMESCALE) - start
+        if entries and entries[-1]['d'] == length:
+            entries[-1]['r'] += 1
+        else:
+            entries.append({'t': start, 'd': length, 'r': 0})
+
+    timeline = ET.Element("SegmentTimeline")
+    for entry in entries:
+        attributes = {'t': str(entry['t']), 'd': str(entry['d'])}
+        if entry['r']:
+            attributes['r'] = str(entry['r'])
+        ET.SubElement(timeline, "S", attributes)
+    return timeline
+
+
+def read_rendition(output_dir, name, output_name="playlist"):
+    """读取一路fMP4输出的分片信息和流信息，无法用DASH描述时抛出ValueError"""
+    rendition_dir = os.path.join(output_dir, name)
+    playlist = read_media_playlist(os.path.join(rendition_dir, f"{output_name}.m3u8"))
+    if not playlist['segments']:
+        raise ValueError(f"{name} 没有分片")
+
+    init_uris = set()
+    numbers = []
+    for segment in playlist['segments']:
+        for tag in segment['tags']:
+            if tag.startswith("#EXT-X-MAP:"):
+                init_uris.add(parse_attributes(tag.split(":", 1)[1])['URI'])
+            elif tag.startswith("#EXT-X-KEY:") and parse_attributes(tag.split(":", 1)[1]).get('METHOD') != "NONE":
+                raise ValueError(f"{name} 的分片已整段加密，DASH播放器无法播放")
+        match = SEGMENT_NAME_PATTERN.match(segment['uri'])
+        if not match:
+            raise ValueError(f"{name} 不是fMP4分片: {segment['uri']}")
+        numbers.append(int(match.group(1)))
+
+    if len(init_uris) != 1:
+        raise ValueError(f"{name} 有 {len(init_uris)} 个初始化分片，DASH清单的每一路只能有一个")
+    if numbers != list(range(numbers[0], numbers[0] + len(numbers))):
+        raise ValueError(f"{name} 的分片序号不连续")
+
+    init_uri = init_uris.pop()
+    streams = get_media_streams(os.path.join(rendition_dir, init_uri))
+    if not streams:
+        raise ValueError(f"{name} 的初始化分片中没有媒体流")
+    peak, _ = measure_bitrate(rendition_dir, playlist)
+    return {
+        'name': name,
+        'init': init_uri,
+        'start_number': numbers[0],
+        'durations': [segment['duration'] for segment in playlist['segments']],
+        'stream': streams[0],
+        'bandwidth': peak
+    }
+
+
+def _add_representation(adaptation_set, rendition):
+    stream = rendition['stream']
+    attributes = {'id': rendition['name'], 'bandwidth': str(max(rendition['bandwidth'], 1))}
+    codecs = get_codec_string(stream)
+    if codecs:
+        attributes['codecs'] = codecs
+    if stream.get('codec_type') == "video":
+        attributes['width'] = str(stream.get('width', 0))
+        attributes['height'] = str(stream.get('height', 0))
+    elif stream.get('sample_rate'):
+        attributes['audioSamplingRate'] = str(stream['sample_rate'])
+    representation = ET.SubElement(adaptation_set, "Representation", attributes)
+    if stream.get('codec_type') == "audio" and stream.get('channels'):
+        ET.SubElement(representation, "AudioChannelConfiguration", {
+            'schemeIdUri': AUDIO_CHANNEL_SCHEME,
+            'value': str(stream['channels'])
+        })
+
+    name = rendition['name']
+    template = ET.SubElement(representation, "SegmentTemplate", {
+        'timescale': str(DASH_TIMESCALE),
+        'initialization': f"{name}/{rendition['init']}",
+        'media': f"{name}/segment_$Number%03d$.m4s",
+        'startNumber': str(rendition['start_number'])
+    })
+    template.append(_segment_timeline(rendition['durations']))
+
+
+def write_dash_manifest(output_dir, rendition_names, output_name="playlist", segment_time=6):
+    """根据各路fMP4的HLS播放列表生成DASH清单，与HLS共用同一套分片
+
+    视频各分辨率放在一个AdaptationSet中供播放器切换，音频单独一个AdaptationSet。
+    """
+    renditions = [
+        read_rendition(output_dir, name, output_name)
+        for name in rendition_names
+        if os.path.exists(os.path.join(output_dir, name, f"{output_name}.m3u8"))
+    ]
+    if not renditions:
+        raise ValueError("没有可以写入DASH清单的输出")
+    duration = max(sum(rendition['durations']) for rendition in renditions)
+
+    mpd = ET.Element("MPD", {
+        'xmlns': "urn:mpeg:dash:schema:mpd:2011",
+        'profiles': "urn:mpeg:dash:profile:isoff-live:2011",
+        'type': "static",
+        'mediaPresentationDuration': _format_duration(duration),
+        'minBufferTime': _format_duration(float(segment_time))
+    })
+    period = ET.SubElement(mpd, "Period", {'id': "0", 'start': "PT0S"})
+    for content_type in ("video", "audio"):
+        members = [rendition for rendition in renditions if rendition['stream'].get('codec_type') == content_type]
+        if not members:
+            continue
+        adaptation_set = ET.SubElement(period, "AdaptationSet", {
+            'id': str(len(period)),
+            'contentType': content_type,
+            'mimeType': f"{content_type}/mp4",
+            'segmentAlignment': "true",
+            'startWithSAP': "1"
+        })
+        for rendition in sorted(members, key=lambda r: r['bandwidth'], reverse=True):
+            _add_representation(adaptation_set, rendition)
+
+    ET.indent(mpd)
+    manifest_path = get_dash_manifest_path(output_dir)
+    temp_path = f"{manifest_path}.tmp"
+    ET.ElementTree(mpd).write(temp_path, encoding="utf-8", xml_declaration=True)
+    os.replace(temp_path, manifest_path)
+    return manifest_path
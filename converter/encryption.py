@@ -0,0 +1,67 @@
+import json
+import os
+
+# 密钥目录（所有分辨率共用同一组密钥）和密钥池清单的文件名
+KEYS_DIR_NAME = "keys"
+KEY_POOL_NAME = "pool.json"
+
+# AES-128的密钥长度（字节）
+KEY_SIZE = 16
+
+
+def get_keys_dir(output_dir):
+    return os.path.join(output_dir, KEYS_DIR_NAME)
+
+
+def _write_atomic(path, data, mode=0o644):
+    """先写临时文件再替换，中断时不会留下写了一半的密钥文件"""
+    temp_path = f"{path}.tmp"
+    fd = os.open(temp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, mode)
+    with os.fdopen(fd, 'wb') as f:
+        f.write(data)
+    os.replace(temp_path, path)
+
+
+def _new_key(keys_dir, index):
+    """用os.urandom生成一个密钥文件（IV使用各分片的媒体序号，不随密钥保存）"""
+    name = f"key_{index:03d}.key"
+    _write_atomic(os.path.join(keys_dir, name), os.urandom(KEY_SIZE), 0o600)
+    return {
+        'name': name,
+        # 播放列表在分辨率子目录中，密钥目录在上一级
+        'uri': f"../{KEYS_DIR_NAME}/{name}"
+    }
+
+
+def load_key_pool(output_dir):
+    """读取已生成的密钥池，没有时返回空列表"""
+    try:
+        with open(os.path.join(get_keys_dir(output_dir), KEY_POOL_NAME), 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return []
+
+
+def _save_key_pool(output_dir, pool):
+    data = json.dumps(pool, ensure_ascii=False, indent=2).encode('utf-8')
+    _write_atomic(os.path.join(get_keys_dir(output_dir), KEY_POOL_NAME), data, 0o600)
+
+
+def ensure_key_pool(output_dir, count):
+    """确保密钥池中至少有count个密钥，已有的密钥保持不变（续转时已加密的分片仍能解密）"""
+    keys_dir = get_keys_dir(output_dir)
+    os.makedirs(keys_dir, exist_ok=True)
+    pool = [key for key in load_key_pool(output_dir) if os.path.exists(os.path.join(keys_dir, key['name']))]
+    if len(pool) >= count:
+        return pool
+    while len(pool) < count:
+        pool.append(_new_key(keys_dir, len(pool)))
+    _save_key_pool(output_dir, pool)
+    return pool
+
+
+def get_rotation_period(settings):
+    """每隔多少个分片更换一次密钥，0表示不轮换"""
+    if not settings.get('encryption_enabled'):
+        return 0
+    return max(int(settings.get('key_rotation') or 0), 0)
@@ -0,0 +1,380 @@
+import json
+import os
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+from contextlib import closing
+
+from converter.commands import get_resolution_dir_name
+from converter.pipeline import convert
+
+# 队列数据库默认保存在项目的config目录下
+DEFAULT_QUEUE_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'config', 'jobs.db')
+
+# 租约时长（秒）：工作进程需要在租约到期前续约，否则任务会被其他工作进程接管
+LEASE_SECONDS = 60
+
+# 同一任务最多尝试的次数（包括进程崩溃导致的重试）
+MAX_ATTEMPTS = 3
+
+# 进度写入数据库的最小间隔（秒）
+PROGRESS_INTERVAL = 1.0
+
+# 页面上直接开始的转换优先于批量队列中排队的任务（不会中断正在转换的任务）
+INTERACTIVE_PRIORITY = 10
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    input_file TEXT NOT NULL,
+    output_dir TEXT NOT NULL,
+    settings TEXT NOT NULL,
+    status TEXT NOT NULL DEFAULT 'queued',
+    priority INTEGER NOT NULL DEFAULT 0,
+    worker TEXT,
+    lease_expires REAL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    progress REAL NOT NULL DEFAULT 0,
+    result TEXT,
+    error TEXT,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs (status, id);
+CREATE TABLE IF NOT EXISTS renditions (
+    job_id INTEGER NOT NULL,
+    name TEXT NOT NULL,
+    status TEXT NOT NULL,
+    updated_at REAL NOT NULL,
+    PRIMARY KEY (job_id, name)
+);
+"""
+
+
+class JobQueue:
+    """基于SQLite的持久化转换任务队列
+
+    任务状态：queued（排队中）、running（转换中）、success（成功）、failed（失败）、cancelled（已取消）。
+    工作进程通过租约领取任务，进程崩溃后租约过期，任务会被重新领取。
+    """
+
+    def __init__(self, path=DEFAULT_QUEUE_PATH):
+        self.path = path
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with closing(self._connect()) as conn:
+            conn.executescript(SCHEMA)
+            # 旧版本的数据库没有priority列
+            columns = [row['name'] for row in conn.execute("PRAGMA table_info(jobs)")]
+            if 'priority' not in columns:
+                conn.execute("ALTER TABLE jobs ADD COLUMN priority INTEGER NOT NULL DEFAULT 0")
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_jobs_priority ON jobs (status, priority DESC, id)")
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA journal_mode=WAL")
+        return conn
+
+    def enqueue(self, input_file, output_dir, settings, priority=0):
+        """添加一个转换任务，返回任务ID；priority越大越先被领取，相同优先级按提交顺序"""
+        now = time.time()
+        with closing(self._connect()) as conn:
+            cursor = conn.execute(
+                "INSERT INTO jobs (input_file, output_dir, settings, priority, created_at, updated_at) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (input_file, output_dir, json.dumps(settings, ensure_ascii=False), priority, now, now)
+            )
+            return cursor.lastrowid
+
+    def position(self, job_id):
+        """排队中的任务前面还有几个任务会先被领取，任务不在排队中时返回None"""
+        with closing(self._connect()) as conn:
+            row = conn.execute("SELECT priority FROM jobs WHERE id = ? AND status = 'queued'", (job_id,)).fetchone()
+            if row is None:
+                return None
+            return conn.execute(
+                "SELECT COUNT(*) FROM jobs WHERE status = 'queued' AND (priority > ? OR (priority = ? AND id < ?))",
+                (row['priority'], row['priority'], job_id)
+            ).fetchone()[0]
+
+    def claim(self, worker, lease_seconds=LEASE_SECONDS):
+        """领取下一个任务：优先排队中的任务，其次是租约已过期（工作进程中断）的任务"""
+        now = time.time()
+        conn = self._connect()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            # 超过最大尝试次数的中断任务直接标记为失败
+            conn.execute(
+                "UPDATE jobs SET status = 'failed', error = '多次中断，已放弃', updated_at = ? "
+                "WHERE status = 'running' AND lease_expires < ? AND attempts >= ?",
+                (now, now, MAX_ATTEMPTS)
+            )
+            row = conn.execute(
+                "SELECT * FROM jobs WHERE status = 'queued' OR (status = 'running' AND lease_expires < ?) "
+                "ORDER BY priority DESC, id LIMIT 1",
+                (now,)
+            ).fetchone()
+            if row is None:
+                conn.execute("COMMIT")
+                return None
+            conn.execute(
+                "UPDATE jobs SET status = 'running', worker = ?, lease_expires = ?, attempts = attempts + 1, "
+                "error = NULL, updated_at = ? WHERE id = ?",
+                (worker, now + lease_seconds, now, row['id'])
+            )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        finally:
+            conn.close()
+        return self.get(row['id'])
+
+    def renew_lease(self, job_id, worker, lease_seconds=LEASE_SECONDS):
+        """续约，返回False表示任务已不属于该工作进程（被取消或被接管）"""
+        now = time.time()
+        with closing(self._connect()) as conn:
+            cursor = conn.execute(
+                "UPDATE jobs SET lease_expires = ?, updated_at = ? WHERE id = ? AND worker = ? AND status = 'running'",
+                (now + lease_seconds, now, job_id, worker)
+            )
+            return cursor.rowcount == 1
+
+    def update_progress(self, job_id, progress, renditions=None):
+        """记录任务进度和每个分辨率的状态"""
+        now = time.time()
+        with closing(self._connect()) as conn:
+            conn.execute("UPDATE jobs SET progress = ?, updated_at = ? WHERE id = ?", (progress, now, job_id))
+            for name, status in (renditions or {}).items():
+                conn.execute(
+                    "INSERT INTO renditions (job_id, name, status, updated_at) VALUES (?, ?, ?, ?) "
+                    "ON CONFLICT (job_id, name) DO UPDATE SET status = excluded.status, updated_at = excluded.updated_at",
+                    (job_id, name, status, now)
+                )
+
+    def complete(self, job_id, worker, result):
+        """标记任务成功，返回False表示任务已不属于该工作进程（被取消或被接管），状态未修改"""
+        with closing(self._connect()) as conn:
+            cursor = conn.execute(
+                "UPDATE jobs SET status = 'success', progress = 1, lease_expires = NULL, result = ?, updated_at = ? "
+                "WHERE id = ? AND worker = ? AND status = 'running'",
+                (json.dumps(result, ensure_ascii=False), time.time(), job_id, worker)
+            )
+            return cursor.rowcount == 1
+
+    def fail(self, job_id, worker, error):
+        """标记任务失败，返回False表示任务已不属于该工作进程（被取消或被接管），状态未修改"""
+        with closing(self._connect()) as conn:
+            cursor = conn.execute(
+                "UPDATE jobs SET status = 'failed', lease_expires = NULL, error = ?, updated_at = ? "
+                "WHERE id = ? AND worker = ? AND status = 'running'",
+                (error, time.time(), job_id, worker)
+            )
+            return cursor.rowcount == 1
+
+    def cancel(self, job_id):
+        """取消排队中的任务"""
+        with closing(self._connect()) as conn:
+            cursor = conn.execute(
+                "UPDATE jobs SET status = 'cancelled', updated_at = ? WHERE id = ? AND status = 'queued'",
+                (time.time(), job_id)
+            )
+            return cursor.rowcount == 1
+
+    def retry(self, job_id):
+        """把失败或已取消的任务重新放回队列"""
+        with closing(self._connect()) as conn:
+            cursor = conn.execute(
+                "UPDATE jobs SET status = 'queued', attempts = 0, error = NULL, updated_at = ? "
+                "WHERE id = ? AND status IN ('failed', 'cancelled')",
+                (time.time(), job_id)
+            )
+            return cursor.rowcount == 1
+
+    def get(self, job_id):
+        """获取任务详情"""
+        with closing(self._connect()) as conn:
+            row = conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+            if row is None:
+                return None
+            renditions = conn.execute(
+                "SELECT name, status FROM renditions WHERE job_id = ? ORDER BY name", (job_id,)
+            ).fetchall()
+        return self._to_job(row, renditions)
+
+    def list(self, status=None, limit=100):
+        """按创建顺序倒序列出任务"""
+        with closing(self._connect()) as conn:
+            if status:
+                rows = conn.execute("SELECT * FROM jobs WHERE status = ? ORDER BY id DESC LIMIT ?", (status, limit)).fetchall()
+            else:
+                rows = conn.execute("SELECT * FROM jobs ORDER BY id DESC LIMIT ?", (limit,)).fetchall()
+            jobs = []
+            for row in rows:
+                renditions = conn.execute(
+                    "SELECT name, status FROM renditions WHERE job_id = ? ORDER BY name", (row['id'],)
+                ).fetchall()
+                jobs.append(self._to_job(row, renditions))
+        return jobs
+
+    def has_pending(self):
+        """是否有待处理的任务：排队中的任务，或租约已过期（工作进程中断）的任务"""
+        with closing(self._connect()) as conn:
+            row = conn.execute(
+                "SELECT 1 FROM jobs WHERE status = 'queued' OR (status = 'running' AND lease_expires < ?) LIMIT 1",
+                (time.time(),)
+            ).fetchone()
+        return row is not None
+
+    def counts(self):
+        """统计各状态的任务数"""
+        with closing(self._connect()) as conn:
+            rows = conn.execute("SELECT status, COUNT(*) AS count FROM jobs GROUP BY status").fetchall()
+        return {row['status']: row['count'] for row in rows}
+
+    @staticmethod
+    def _to_job(row, renditions):
+        job = dict(row)
+        job['settings'] = json.loads(job['settings'])
+        job['result'] = json.loads(job['result']) if job['result'] else None
+        job['renditions'] = {r['name']: r['status'] for r in renditions}
+        return job
+
+
+def get_rendition_status(state):
+    """把调度器的任务状态汇总为每个分辨率的状态（分段编码时一个分辨率对应多个任务）"""
+    statuses = {}
+    for job_state in state['jobs']:
+        for resolution in job_state['resolutions']:
+            statuses.setdefault(get_resolution_dir_name(resolution), []).append(job_state['status'])
+
+    renditions = {}
+    for name, values in statuses.items():
+        if all(value == 'done' for value in values):
+            renditions[name] = 'success'
+        elif any(value == 'failed' for value in values):
+            renditions[name] = 'failed'
+        elif any(value in ('running', 'done') for value in values):
+            renditions[name] = 'running'
+        else:
+            renditions[name] = 'queued'
+    return renditions
+
+
+# 当前进程中正在执行的任务的实时进度（调度器状态快照和最新的阶段说明），按任务ID索引
+_live_progress = {}
+_live_lock = threading.Lock()
+
+
+def get_live_progress(job_id):
+    """获取本进程中正在执行的任务的实时进度，任务不在本进程中执行时返回None"""
+    with _live_lock:
+        live = _live_progress.get(job_id)
+        return dict(live) if live else None
+
+
+def run_job(job_queue, job, worker, on_progress=None, on_status=None):
+    """执行一个已领取的任务，转换期间定期续约并记录进度
+
+    续约失败说明任务已被取消或被其他工作进程接管，此时立即停止转换，不写入任何结果。
+    """
+    stop_heartbeat = threading.Event()
+    lease_lost = threading.Event()
+    with _live_lock:
+        _live_progress[job['id']] = {'state': None, 'message': None}
+
+    def heartbeat():
+        while not stop_heartbeat.wait(LEASE_SECONDS / 3):
+            if not job_queue.renew_lease(job['id'], worker):
+                lease_lost.set()
+                break
+
+    heartbeat_thread = threading.Thread(target=heartbeat, daemon=True)
+    heartbeat_thread.start()
+
+    last_update = [0.0]
+
+    def record_progress(state):
+        # 调度器会继续修改state，保存一份快照供页面读取
+        snapshot = {**state, 'jobs': [dict(job_state) for job_state in state['jobs']]}
+        with _live_lock:
+            _live_progress[job['id']]['state'] = snapshot
+        now = time.time()
+        if now - last_update[0] >= PROGRESS_INTERVAL:
+            last_update[0] = now
+            job_queue.update_progress(job['id'], state['overall'], get_rendition_status(state))
+        if on_progress:
+            on_progress(state)
+
+    def record_status(message):
+        with _live_lock:
+            _live_progress[job['id']]['message'] = message
+        if on_status:
+            on_status(message)
+
+    # 租约过期后任务可能已被其他工作进程接管，只有仍持有任务时才写入最终状态
+    try:
+        result = convert(
+            job['input_file'], job['output_dir'], job['settings'], record_progress, record_status, lease_lost
+        )
+        if lease_lost.is_set():
+            raise Exception(f"任务 #{job['id']} 的租约续约失败，已停止转换")
+        job_queue.update_progress(job['id'], 1.0, {rendition['name']: 'success' for rendition in result['renditions']})
+    except Exception as e:
+        if not job_queue.fail(job['id'], worker, str(e)):
+            record_status(f"⚠️ 任务 #{job['id']} 已被其他工作进程接管或已取消，失败状态未写入队列")
+        raise
+    else:
+        if not job_queue.complete(job['id'], worker, result):
+            raise Exception(f"任务 #{job['id']} 已被其他工作进程接管或已取消，转换结果未写入队列")
+        return result
+    finally:
+        stop_heartbeat.set()
+        heartbeat_thread.join()
+        with _live_lock:
+            _live_progress.pop(job['id'], None)
+
+
+def run_worker(job_queue, worker=None, stop_event=None, poll_interval=2.0, drain=False, on_status=None):
+    """工作循环：不断领取并执行任务
+
+    drain为True时队列为空就退出，否则一直等待新任务直到stop_event被设置。
+    """
+    worker = worker or f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:6]}"
+    stop_event = stop_event or threading.Event()
+    while not stop_event.is_set():
+        job = job_queue.claim(worker)
+        if job is None:
+            if drain:
+                break
+            stop_event.wait(poll_interval)
+            continue
+
+        if on_status:
+            on_status(f"[{worker}] 开始任务 #{job['id']}: {job['input_file']}")
+        try:
+            run_job(job_queue, job, worker)
+            if on_status:
+                on_status(f"[{worker}] 任务 #{job['id']} 完成")
+        except Exception as e:
+            if on_status:
+                on_status(f"[{worker}] 任务 #{job['id']} 失败: {str(e)}")
+
+
+# 当前进程中已启动的后台工作线程（按队列路径区分，避免重复启动）
+_background_workers = {}
+_background_lock = threading.Lock()
+
+
+def start_background_workers(job_queue, count=1):
+    """在当前进程中启动后台工作线程，已启动的不会重复启动，返回存活的线程数"""
+    with _background_lock:
+        threads = [thread for thread in _background_workers.get(job_queue.path, []) if thread.is_alive()]
+        while len(threads) < count:
+            thread = threading.Thread(target=run_worker, args=(job_queue,), daemon=True)
+            thread.start()
+            threads.append(thread)
+        _background_workers[job_queue.path] = threads
+        return len(threads)
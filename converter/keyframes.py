@@ -0,0 +1,109 @@
+import math
+import re
+import subprocess
+
+# 场景切换检测的阈值（0-1，越小检测到的切换越多）
+DEFAULT_SCENE_THRESHOLD = 0.4
+
+# 检测场景切换时先缩小画面，只影响检测速度，不影响结果的时间点
+SCENE_DETECT_WIDTH = 320
+
+# 分片边界之后这个比例的分片时长内有场景切换时，把边界移到场景切换处
+SCENE_SNAP_RATIO = 0.25
+
+# 场景切换与计划中的关键帧相距小于这个时间（秒）时不再额外插入关键帧
+MIN_KEYFRAME_GAP = 0.5
+
+# 匹配showinfo滤镜输出中的时间
+SHOWINFO_TIME_PATTERN = re.compile(r"pts_time:\s*([0-9.]+)")
+
+
+def build_scene_detect_command(input_file, threshold=DEFAULT_SCENE_THRESHOLD):
+    """缩小画面后用select滤镜挑出场景切换的帧，由showinfo输出其时间"""
+    return [
+        "ffmpeg", "-hide_banner", "-nostats",
+        "-i", input_file,
+        "-an", "-sn",
+        "-vf", f"scale={SCENE_DETECT_WIDTH}:-2,select='gt(scene,{threshold})',showinfo",
+        "-f", "null", "-"
+    ]
+
+
+def detect_scene_cuts(input_file, threshold=DEFAULT_SCENE_THRESHOLD):
+    """检测源视频中场景切换的时间点（需要完整解码一次源视频）"""
+    result = subprocess.run(build_scene_detect_command(input_file, threshold), capture_output=True, text=True)
+    if result.returncode != 0:
+        raise Exception(f"场景检测失败: {result.stderr[-2000:]}")
+    return sorted(
+        float(match.group(1))
+        for line in result.stderr.splitlines()
+        if "Parsed_showinfo" in line
+        for match in [SHOWINFO_TIME_PATTERN.search(line)]
+        if match
+    )
+
+
+def plan_keyframes(duration, interval, scene_cuts=()):
+    """为所有分辨率生成共用的关键帧时间点
+
+    每隔interval秒放一个关键帧作为分片边界；边界之后不远处有场景切换时把边界移到场景切换处，
+    其余的场景切换额外插入关键帧（不会成为分片边界，只提高切换处的画质）。
+    HLS切片在每个interval整数倍之后的第一个关键帧处分片，所有分辨率使用同一组时间点时分片边界完全一致。
+    """
+    interval = float(interval)
+    cuts = sorted(scene_cuts)
+    snap = interval * SCENE_SNAP_RATIO
+    times = []
+    for index in range(int(math.ceil(duration / interval))):
+        boundary = index * interval
+        if index > 0:
+            boundary = next((cut for cut in cuts if boundary <= cut <= boundary + snap), boundary)
+        times.append(boundary)
+    for cut in cuts:
+        if cut < duration and all(abs(cut - time) >= MIN_KEYFRAME_GAP for time in times):
+            times.append(cut)
+    return sorted(times)
+
+
+def build_keyframe_args(settings, start=None, length=None):
+    """生成关键帧对齐的编码参数
+
+    有关键帧计划（keyframe_times，包含场景切换）时强制在这些时间点编码关键帧，否则按分片时长等间隔；
+    分段编码和续转时按输入的起点换算成相对时间。同时关闭编码器自己的场景切换检测，
+    知道帧率时把GOP长度固定为一个分片，所有分辨率的关键帧和分片边界都对齐。
+    """
+    video_encoder = settings['video_encoder']
+    if not settings.get('aligned_keyframes') or video_encoder == "copy":
+        return []
+
+    interval = float(settings['segment_time'])
+    offset = start or 0.0
+    times = settings.get('keyframe_times')
+    if times:
+        local_times = [time - offset for time in times if time >= offset and (length is None or time < offset + length)]
+        force_key_frames = ",".join(f"{time:.3f}" for time in local_times) or "0"
+    elif offset:
+        # 起点本身是第一个关键帧，之后在起点之后的每个分片边界处各一个
+        previous = math.floor(offset / interval + 1e-6)
+        force_key_frames = f"expr:gte(t,(n_forced+{previous})*{interval:g}-{offset:.3f})"
+    else:
+        force_key_frames = f"expr:gte(t,n_forced*{interval:g})"
+    args = ["-force_key_frames", force_key_frames]
+
+    frame_rate = settings.get('frame_rate')
+    if frame_rate:
+        # 边界移到场景切换处后两个关键帧的间隔可能超过一个分片，GOP取最大间隔，避免编码器在中间自己插入关键帧
+        gop_seconds = max([interval] + [b - a for a, b in zip(times or [], (times or [])[1:])])
+        gop = max(int(math.ceil(frame_rate * gop_seconds - 1e-6)), 1)
+        args.extend(["-g", str(gop)])
+        if video_encoder == "libx264":
+            args.extend(["-keyint_min", str(gop)])
+
+    if video_encoder == "libx264":
+        args.extend(["-sc_threshold", "0"])
+    elif "nvenc" in video_encoder:
+        # 强制的关键帧编码为IDR帧，并关闭NVENC自己插入的场景切换关键帧
+        args.extend(["-forced-idr", "1", "-no-scenecut", "1"])
+    elif "qsv" in video_encoder:
+        args.extend(["-forced_idr", "1"])
+    return args
@@ -0,0 +1,178 @@
+import math
+import os
+import subprocess
+import tempfile
+
+from converter.probe import get_duration, get_video_info, get_video_stream
+from converter.settings import DEFAULT_SETTINGS
+
+# 试编码使用的CRF，拟合 ln(码率) = a + b * CRF 的码率-质量曲线
+PROBE_CRFS = (20, 26, 32)
+
+# 推荐码率对应的画质（x264的CRF），数值越小画质越高
+DEFAULT_TARGET_CRF = 23
+
+# 试编码的片段数、每段时长（秒）和采样范围（跳过片头片尾）
+SAMPLE_COUNT = 4
+SAMPLE_SECONDS = 4
+SAMPLE_RANGE = (0.1, 0.9)
+
+# 试编码的分辨率（高度），用低分辨率编码速度快，再按像素数换算到各分辨率
+PROBE_HEIGHT = 360
+
+# 码率与像素数的关系：码率 ∝ 像素数^SCALE_EXPONENT（分辨率越高每个像素需要的码率越少）
+SCALE_EXPONENT = 0.75
+
+# 推荐码率限制在默认码率的这个倍数范围内，避免极端内容得到不合理的码率
+BITRATE_LIMITS = (0.2, 2.0)
+
+# 相邻两档的码率至少相差这个倍数，否则较低的一档对画质和带宽都没有意义，从阶梯中去掉
+MIN_RUNG_RATIO = 1.4
+
+
+def get_sample_times(duration, count=SAMPLE_COUNT, length=SAMPLE_SECONDS):
+    """在视频中均匀选取试编码片段的起点，视频太短时只取开头一段"""
+    if not duration or duration <= length * count:
+        return [0.0]
+    start, end = SAMPLE_RANGE
+    span = duration * (end - start) - length
+    return [duration * start + span * i / max(count - 1, 1) for i in range(count)]
+
+
+def build_probe_command(input_file, start, length, output_paths, crfs=PROBE_CRFS):
+    """对一个片段只解码一次，缩小后按每个CRF各编码一份，输出到output_paths"""
+    filters = [f"[0:v]scale=-2:{PROBE_HEIGHT},split={len(crfs)}" + "".join(f"[p{i}]" for i in range(len(crfs)))]
+    command = [
+        "ffmpeg", "-y", "-v", "error",
+        "-ss", f"{start:.3f}", "-t", f"{length:.3f}", "-i", input_file,
+        "-filter_complex", ";".join(filters)
+    ]
+    for i, (crf, output_path) in enumerate(zip(crfs, output_paths)):
+        command.extend([
+            "-map", f"[p{i}]", "-an",
+            "-c:v", "libx264", "-preset", "veryfast", "-crf", str(crf),
+            "-f", "mp4", output_path
+        ])
+    return command
+
+
+def measure_complexity(input_file, duration, crfs=PROBE_CRFS):
+    """试编码采样片段，返回每个CRF在试编码分辨率下的平均码率（bit/s）"""
+    totals = {crf: 0 for crf in crfs}
+    seconds = 0.0
+    with tempfile.TemporaryDirectory(prefix="ladder_") as temp_dir:
+        for index, start in enumerate(get_sample_times(duration)):
+            length = min(SAMPLE_SECONDS, duration - start) if duration else SAMPLE_SECONDS
+            output_paths = [os.path.join(temp_dir, f"sample_{index}_{crf}.mp4") for crf in crfs]
+            result = subprocess.run(
+                build_probe_command(input_file, start, length, output_paths, crfs),
+                capture_output=True,
+                text=True
+            )
+            if result.returncode != 0:
+                raise Exception(f"试编码失败: {result.stderr}")
+            for crf, output_path in zip(crfs, output_paths):
+                totals[crf] += os.path.getsize(output_path)
+            seconds += length
+    return {crf: size * 8 / seconds for crf, size in totals.items()}
+
+
+def fit_rate_curve(points):
+    """用最小二乘法拟合 ln(码率) = a + b * CRF，points为 {CRF: 码率}，返回 (a, b)"""
+    xs = list(points)
+    ys = [math.log(max(points[crf], 1)) for crf in xs]
+    mean_x = sum(xs) / len(xs)
+    mean_y = sum(ys) / len(ys)
+    variance = sum((x - mean_x) ** 2 for x in xs)
+    slope = sum((x - mean_x) * (y - mean_y) for x, y in zip(xs, ys)) / variance if variance else 0.0
+    return mean_y - slope * mean_x, slope
+
+
+def predict_bitrate(curve, crf):
+    """按拟合的曲线预测指定CRF的码率"""
+    intercept, slope = curve
+    return math.exp(intercept + slope * crf)
+
+
+def _parse_kbps(bitrate):
+    return float(str(bitrate).rstrip("kK"))
+
+
+def _get_size(resolution, source_size):
+    if resolution == "原始分辨率":
+        return source_size
+    width, height = resolution.split("x")
+    return int(width), int(height)
+
+
+def build_ladder(curve, resolutions, source_size, target_crf=DEFAULT_TARGET_CRF):
+    """根据码率曲线为各分辨率推荐码率，返回 (分辨率列表, 码率字典)
+
+    * 比源视频大的分辨率不输出（放大只会浪费码率）
+    * 码率按像素数换算，并限制在默认码率的BITRATE_LIMITS倍数范围内
+    * 与上一档码率相差不到MIN_RUNG_RATIO倍的分辨率从阶梯中去掉
+    """
+    source_width, source_height = source_size
+    probe_width = round(source_width * PROBE_HEIGHT / source_height / 2) * 2
+    probe_bitrate = predict_bitrate(curve, target_crf)
+
+    candidates = []
+    for resolution in resolutions:
+        width, height = _get_size(resolution, source_size)
+        if resolution != "原始分辨率" and width * height > source_width * source_height:
+            continue
+        kbps = probe_bitrate * ((width * height) / (probe_width * PROBE_HEIGHT)) ** SCALE_EXPONENT / 1000
+        default_kbps = _parse_kbps(DEFAULT_SETTINGS['video_bitrates'].get(resolution, "4000k"))
+        low, high = BITRATE_LIMITS
+        kbps = min(max(kbps, default_kbps * low), default_kbps * high)
+        candidates.append((width * height, resolution, kbps))
+    if not candidates:
+        # 所有分辨率都比源视频大时保留最小的一档
+        smallest = min(resolutions, key=lambda r: _get_size(r, source_size)[0] * _get_size(r, source_size)[1])
+        return build_ladder(curve, [smallest], _get_size(smallest, source_size), target_crf)
+
+    ladder = []
+    previous_kbps = None
+    for _, resolution, kbps in sorted(candidates, reverse=True):
+        if previous_kbps is not None and previous_kbps / kbps < MIN_RUNG_RATIO:
+            continue
+        ladder.append((resolution, kbps))
+        previous_kbps = kbps
+
+    # 保持原来的分辨率顺序
+    order = {resolution: index for index, resolution in enumerate(resolutions)}
+    ladder.sort(key=lambda item: order[item[0]])
+    return [resolution for resolution, _ in ladder], {resolution: f"{int(round(kbps / 10) * 10)}k" for resolution, kbps in ladder}
+
+
+def format_ladder(resolutions, video_bitrates):
+    """格式化为命令行--ladder参数的形式，如 1920x1080:2310k,1280x720:1240k"""
+    return ",".join(f"{'raw' if r == '原始分辨率' else r}:{video_bitrates[r]}" for r in resolutions)
+
+
+def propose_ladder(input_file, settings, video_info=None):
+    """按视频内容推荐分辨率阶梯和码率
+
+    在几个采样片段上用低分辨率做CRF试编码，拟合码率-质量曲线后为各分辨率换算码率。
+    静态画面（讲座、幻灯片）得到的码率远低于默认值，运动剧烈的内容则会提高码率。
+    """
+    if not settings['resolutions']:
+        raise Exception("请至少选择一个输出分辨率")
+    if video_info is None:
+        video_info = get_video_info(input_file)
+    stream = get_video_stream(video_info)
+    if not stream or not stream.get('width') or not stream.get('height'):
+        raise Exception("无法获取源视频的分辨率")
+
+    points = measure_complexity(input_file, get_duration(video_info))
+    curve = fit_rate_curve(points)
+    target_crf = settings.get('ladder_crf') or DEFAULT_TARGET_CRF
+    resolutions, video_bitrates = build_ladder(
+        curve, settings['resolutions'], (int(stream['width']), int(stream['height'])), target_crf
+    )
+    return {
+        'resolutions': resolutions,
+        'video_bitrates': video_bitrates,
+        'points': points,
+        'target_crf': target_crf
+    }
@@ -0,0 +1,368 @@
+import glob
+import os
+import subprocess
+import time
+
+from converter.cache import (
+    get_cached_ladder, get_cached_video_info, get_conversion_key, get_fingerprint, link_tree, lookup_conversion,
+    store_conversion
+)
+from converter.catalog import Catalog, write_manifest
+from converter.chunked import build_chunk_jobs, plan_chunks, probe_keyframes, stitch_chunks
+from converter.commands import (
+    AUDIO_RENDITION, build_commands, get_output_renditions, get_output_resolutions, get_resolution_dir,
+    get_resolution_dir_name, get_resolution_label, is_fmp4, uses_single_file
+)
+from converter.dash import get_dash_manifest_path, write_dash_manifest
+from converter.encryption import get_rotation_period
+from converter.keyframes import DEFAULT_SCENE_THRESHOLD, detect_scene_cuts, plan_keyframes
+from converter.ladder import propose_ladder
+from converter.previews import build_preview_command, get_sprites_dir, has_previews, select_poster, write_thumbnails_vtt
+from converter.probe import get_duration, get_video_info, get_video_stream, has_audio_stream
+from converter.resume import finish_resume, plan_resume, prepare_output
+from converter.scheduler import get_hw_family, run_jobs
+from converter.segment_crypto import encrypt_renditions, require_cryptography
+from converter.variants import analyze_rendition, get_frame_rate, get_variant_attributes
+from converter.settings import merge_settings
+
+# 无法分析实际输出时，各分辨率在主播放列表中声明的带宽
+RESOLUTION_BANDWIDTHS = {
+    "3840x2160": "15000000",
+    "2560x1440": "9000000",
+    "1920x1080": "4500000",
+    "1280x720": "2500000",
+    "854x480": "1000000",
+    "640x360": "500000",
+    "原始分辨率": "2000000"
+}
+
+
+class ConversionError(Exception):
+    """转换失败"""
+
+
+def expand_inputs(patterns):
+    """展开输入文件路径或通配符，保持顺序并去重"""
+    input_files = []
+    for pattern in patterns:
+        matches = sorted(glob.glob(pattern)) if glob.has_magic(pattern) else [pattern]
+        for path in matches:
+            if path not in input_files:
+                input_files.append(path)
+    return input_files
+
+
+def get_output_dirs(input_files, output_root):
+    """为每个输入文件生成输出目录，同名文件自动加序号"""
+    output_dirs = []
+    for input_file in input_files:
+        name = os.path.splitext(os.path.basename(input_file))[0]
+        output_dir = os.path.join(output_root, name)
+        index = 2
+        while output_dir in output_dirs:
+            output_dir = os.path.join(output_root, f"{name}_{index}")
+            index += 1
+        output_dirs.append(output_dir)
+    return output_dirs
+
+
+def write_master_playlist(output_dir, settings, frame_rate=None):
+    """根据实际输出生成主播放列表
+
+    BANDWIDTH、AVERAGE-BANDWIDTH按各分片的实际大小计算，CODECS、RESOLUTION、FRAME-RATE来自对输出文件的探测；
+    某一路无法分析时退回按分辨率预设的带宽。frame_rate为源视频帧率，输出文件中读取不到帧率时使用。
+    fMP4分片需要版本7（EXT-X-MAP）；音频单独输出时用EXT-X-MEDIA声明音频组，每个分辨率通过AUDIO引用。
+    """
+    output_name = settings.get('output_name', 'playlist')
+    master_playlist_path = os.path.join(output_dir, "master.m3u8")
+    audio_dir = get_resolution_dir_name(AUDIO_RENDITION)
+    audio = None
+    if AUDIO_RENDITION in get_output_renditions(settings):
+        audio = analyze_rendition(os.path.join(output_dir, audio_dir), output_name)
+
+    lines = ["#EXTM3U", f"#EXT-X-VERSION:{7 if is_fmp4(settings) else 3}"]
+    if audio:
+        lines.append(
+            f'#EXT-X-MEDIA:TYPE=AUDIO,GROUP-ID="{AUDIO_RENDITION}",NAME="{AUDIO_RENDITION}",'
+            f'DEFAULT=YES,AUTOSELECT=YES,URI="{audio_dir}/{output_name}.m3u8"'
+        )
+
+    # 为每个分辨率添加一个流
+    for resolution in get_output_resolutions(settings):
+        video = analyze_rendition(get_resolution_dir(output_dir, resolution), output_name)
+        if video:
+            attributes = get_variant_attributes(video, audio, frame_rate)
+        else:
+            attributes = {'BANDWIDTH': RESOLUTION_BANDWIDTHS.get(resolution, "2000000")}
+            if resolution != "原始分辨率":
+                attributes['RESOLUTION'] = resolution
+        if audio:
+            attributes['AUDIO'] = f'"{AUDIO_RENDITION}"'
+        lines.append("#EXT-X-STREAM-INF:" + ",".join(f"{key}={value}" for key, value in attributes.items()))
+        lines.append(f'{get_resolution_dir_name(resolution)}/{output_name}.m3u8')
+
+    temp_path = f"{master_playlist_path}.tmp"
+    with open(temp_path, "w", encoding="utf-8") as f:
+        f.write("\n".join(lines) + "\n")
+    os.replace(temp_path, master_playlist_path)
+    return master_playlist_path
+
+
+def generate_previews(input_file, output_dir, settings):
+    """单独生成封面和雪碧图（只解码关键帧）"""
+    os.makedirs(get_sprites_dir(output_dir), exist_ok=True)
+    result = subprocess.run(build_preview_command(input_file, output_dir, settings), capture_output=True, text=True)
+    if result.returncode != 0:
+        raise Exception(result.stderr)
+    thumbnail_path = os.path.join(output_dir, "thumbnail.jpg")
+    if not os.path.exists(thumbnail_path):
+        raise Exception("封面文件未生成")
+    return thumbnail_path
+
+
+def convert(input_file, output_dir, settings, on_progress=None, on_status=None, stop_event=None):
+    """把一个视频转换为多分辨率HLS
+
+    on_progress接收调度器的进度状态，on_status接收当前阶段的文字说明，
+    两个回调都在调用方线程中执行。stop_event被设置后终止正在运行的FFmpeg并停止转换。
+    转换失败或被停止时抛出ConversionError。
+    """
+    started_at = time.time()
+    settings = merge_settings(settings)
+    result = {
+        'input_file': input_file,
+        'output_dir': output_dir,
+        'status': 'running',
+        'master_playlist': None,
+        'dash_manifest': None,
+        'thumbnail': None,
+        'renditions': [],
+        'chunks': 0,
+        'duration': None,
+        'cached_from': None,
+        'ladder': None,
+        'elapsed': 0.0,
+        'warnings': []
+    }
+
+    def report(message):
+        if on_status:
+            on_status(message)
+
+    def check_stopped():
+        if stop_event is not None and stop_event.is_set():
+            raise ConversionError("转换已停止")
+
+    if not os.path.exists(input_file):
+        raise ConversionError(f"输入文件不存在: {input_file}")
+    # 加密在转换完成后进行，先确认可以加密，避免转换完才发现缺少依赖
+    if settings['encryption_enabled']:
+        try:
+            require_cryptography()
+        except RuntimeError as e:
+            raise ConversionError(str(e))
+
+    os.makedirs(output_dir, exist_ok=True)
+
+    # 按视频内容推荐码率阶梯，推荐结果参与缓存键的计算；推荐结果也按内容缓存，重复转换不再试编码
+    if settings['auto_ladder'] and settings['video_encoder'] != "copy":
+        report("⏳ 正在按视频内容推荐码率...")
+        try:
+            if settings['cache']:
+                proposal = get_cached_ladder(input_file, settings, get_cached_video_info(input_file))
+            else:
+                proposal = propose_ladder(input_file, settings)
+            settings = {
+                **settings,
+                'resolutions': proposal['resolutions'],
+                'video_bitrates': {**settings['video_bitrates'], **proposal['video_bitrates']}
+            }
+            result['ladder'] = proposal['video_bitrates']
+            report("🎯 推荐码率：" + "，".join(
+                f"{get_resolution_label(r)} {proposal['video_bitrates'][r]}" for r in proposal['resolutions']
+            ))
+        except Exception as e:
+            result['warnings'].append(f"按内容推荐码率失败，使用设置中的码率: {str(e)}")
+
+    # 输出目录中已有其他源文件或其他设置的结果时先清空，不能续转也不能与缓存结果混在一起
+    try:
+        if prepare_output(output_dir, input_file, settings):
+            report("🧹 输出目录中是其他视频或其他设置的转换结果，已清空后重新转换")
+    except OSError as e:
+        raise ConversionError(f"清理输出目录失败: {str(e)}")
+
+    # 相同内容、相同设置已经转换过时直接复用已有结果
+    cache_key = None
+    if settings['cache']:
+        cache_key = get_conversion_key(get_fingerprint(input_file), settings)
+        cached_dir = lookup_conversion(cache_key)
+        if cached_dir:
+            report(f"⚡ 相同内容已转换过，直接复用 {cached_dir}")
+            link_tree(cached_dir, output_dir)
+            result['cached_from'] = cached_dir
+            try:
+                result['duration'] = get_duration(get_cached_video_info(input_file))
+            except Exception as e:
+                result['warnings'].append(f"获取视频信息失败: {str(e)}")
+            return _finish_result(result, output_dir, settings, started_at)
+
+    # 获取源视频信息：是否有音频流（单次解码模式需要据此生成流映射）以及时长
+    try:
+        video_info = get_cached_video_info(input_file) if settings['cache'] else get_video_info(input_file)
+    except Exception as e:
+        video_info = None
+        result['warnings'].append(f"获取视频信息失败: {str(e)}")
+    has_audio = has_audio_stream(video_info)
+    duration = get_duration(video_info)
+    frame_rate = get_frame_rate(get_video_stream(video_info) or {})
+    result['duration'] = duration
+
+    # 关键帧对齐：所有分辨率共用同一组关键帧时间点，需要时先检测场景切换
+    if settings.get('aligned_keyframes') and settings['video_encoder'] != "copy":
+        settings = {**settings, 'frame_rate': frame_rate}
+        if settings.get('scene_cuts') and duration:
+            report("⏳ 正在检测场景切换...")
+            try:
+                scene_cuts = detect_scene_cuts(input_file, settings.get('scene_threshold', DEFAULT_SCENE_THRESHOLD))
+                settings['keyframe_times'] = plan_keyframes(duration, settings['segment_time'], scene_cuts)
+                report(f"🎬 检测到 {len(scene_cuts)} 处场景切换")
+            except Exception as e:
+                result['warnings'].append(f"场景检测失败，按固定间隔放置关键帧: {str(e)}")
+
+    # 分段并行编码：在关键帧处把源视频切成若干段同时编码
+    chunks = None
+    if int(settings['chunk_count'] or 0) > 1 and settings['video_encoder'] != "copy" and duration:
+        try:
+            chunks = plan_chunks(probe_keyframes(input_file), duration, settings['chunk_count'], settings['segment_time'])
+        except Exception as e:
+            result['warnings'].append(f"获取关键帧失败，改为整体转换: {str(e)}")
+        if chunks and len(chunks) < 2:
+            chunks = None
+
+    # 生成所有要执行的任务
+    if chunks:
+        jobs = build_chunk_jobs(input_file, output_dir, settings, chunks, has_audio)
+        result['chunks'] = len(chunks)
+        report(f"✂️ 已在关键帧处将视频切分为 {len(chunks)} 段并行编码")
+    else:
+        jobs = build_commands(input_file, output_dir, settings, has_audio)
+
+    # 断点续转：跳过已完成的分辨率，未完成的从最后一个完整分片处继续
+    if settings['resume']:
+        jobs = plan_resume(jobs, input_file, output_dir, settings, duration)
+        for job in jobs:
+            if 'resumed_from' in job:
+                resolution_display = get_resolution_label(job['resolutions'][0])
+                report(f"♻️ {resolution_display} 从 {job['resumed_from']:.1f} 秒处继续转换")
+    for job in jobs:
+        for resolution in job['resolutions']:
+            os.makedirs(get_resolution_dir(job['output_dir'], resolution), exist_ok=True)
+        if job.get('previews'):
+            os.makedirs(get_sprites_dir(job['output_dir']), exist_ok=True)
+
+    # 并行执行所有命令
+    check_stopped()
+    hw_family = get_hw_family(settings['video_encoder'])
+    job_results = run_jobs(
+        jobs,
+        max_workers=settings['max_parallel_jobs'],
+        hw_session_limits={hw_family: settings['hw_session_limit']} if hw_family else None,
+        duration=duration,
+        on_progress=on_progress,
+        stop_event=stop_event
+    )
+    check_stopped()
+
+    # 检查命令执行结果
+    for job_result in job_results:
+        if job_result['status'] == 'failed':
+            resolution_display = " / ".join(get_resolution_label(r) for r in job_result['resolutions'])
+            raise ConversionError(f"处理 {resolution_display} 时出错：\n{job_result['stderr']}")
+    if any(job_result['fallback'] for job_result in job_results):
+        result['warnings'].append("硬件解码初始化失败，部分任务已改用CPU解码")
+    finish_resume(jobs, settings)
+
+    # 合并各段的分片和播放列表
+    if chunks:
+        report("⏳ 正在合并分段...")
+        stitch_chunks(output_dir, settings, len(chunks))
+
+    # 完成所有转换后，生成主播放列表（在加密之前，编码信息需要从明文分片中读取）
+    write_master_playlist(output_dir, settings, frame_rate)
+
+    # 加密：转换完成后按分片序号统一加密，各分辨率同一序号的分片使用同一个密钥，
+    # 密钥轮换严格按分片序号进行，与各分辨率的编码速度无关
+    if settings['encryption_enabled']:
+        report("⏳ 正在加密分片...")
+        output_name = settings.get('output_name', 'playlist')
+        rendition_dirs = [get_resolution_dir(output_dir, r) for r in get_output_renditions(settings, has_audio)]
+        rendition_dirs = [d for d in rendition_dirs if os.path.exists(os.path.join(d, f"{output_name}.m3u8"))]
+        try:
+            encrypt_renditions(rendition_dirs, output_name, get_rotation_period(settings))
+        except Exception as e:
+            raise ConversionError(f"加密分片失败: {str(e)}")
+
+    # fMP4分片同时生成DASH清单，与HLS共用分片；整段加密的分片DASH无法播放，单文件输出也不生成
+    if is_fmp4(settings) and not settings['encryption_enabled'] and not uses_single_file(settings):
+        try:
+            write_dash_manifest(
+                output_dir,
+                [get_resolution_dir_name(r) for r in get_output_renditions(settings, has_audio)],
+                settings.get('output_name', 'playlist'),
+                settings['segment_time']
+            )
+        except Exception as e:
+            result['warnings'].append(f"生成DASH清单失败: {str(e)}")
+
+    # 封面和雪碧图一般已在转换时生成（包括硬件解码）；只有直接复制、分段编码或续转时才单独生成，失败不影响转换结果
+    if settings['previews']:
+        try:
+            if not has_previews(output_dir, duration, settings):
+                report("⏳ 正在生成视频封面和预览缩略图...")
+                generate_previews(input_file, output_dir, settings)
+            if duration:
+                write_thumbnails_vtt(output_dir, duration, settings)
+        except Exception as e:
+            result['warnings'].append(f"生成视频封面失败: {str(e)}")
+
+    # 挑选画面清晰、曝光正常的关键帧替换第一帧封面
+    if settings['smart_poster'] and duration:
+        report("⏳ 正在挑选视频封面...")
+        try:
+            select_poster(input_file, output_dir, duration)
+        except Exception as e:
+            result['warnings'].append(f"挑选视频封面失败，使用第一帧作为封面: {str(e)}")
+
+    check_stopped()
+    if cache_key:
+        store_conversion(cache_key, output_dir)
+    return _finish_result(result, output_dir, settings, started_at)
+
+
+def _finish_result(result, output_dir, settings, started_at):
+    """填写转换结果中的输出文件信息"""
+    output_name = settings.get('output_name', 'playlist')
+    result['master_playlist'] = os.path.join(output_dir, "master.m3u8")
+    thumbnail_path = os.path.join(output_dir, "thumbnail.jpg")
+    result['thumbnail'] = thumbnail_path if os.path.exists(thumbnail_path) else None
+    result['renditions'] = [
+        {
+            'resolution': resolution,
+            'name': get_resolution_dir_name(resolution),
+            'playlist': os.path.join(get_resolution_dir(output_dir, resolution), f"{output_name}.m3u8")
+        }
+        for resolution in get_output_renditions(settings)
+        if resolution != AUDIO_RENDITION or os.path.isdir(get_resolution_dir(output_dir, resolution))
+    ]
+    dash_manifest = get_dash_manifest_path(output_dir)
+    result['dash_manifest'] = dash_manifest if os.path.exists(dash_manifest) else None
+
+    # 写入清单并更新视频索引，预览页面只从索引读取列表
+    try:
+        Catalog().add(write_manifest(output_dir, settings, result['duration']))
+    except Exception as e:
+        result['warnings'].append(f"更新视频索引失败: {str(e)}")
+
+    result['status'] = 'success'
+    result['elapsed'] = time.time() - started_at
+    return result
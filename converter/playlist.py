@@ -0,0 +1,127 @@
+import math
+import os
+import re
+
+# 匹配 KEY=VALUE 或 KEY="VALUE" 形式的属性
+ATTRIBUTE_PATTERN = re.compile(r'([A-Z0-9-]+)=("[^"]*"|[^,]*)')
+
+# 只能出现在播放列表头部的标签（其余标签都跟随其后的分片）
+HEADER_TAGS = (
+    "#EXT-X-INDEPENDENT-SEGMENTS",
+    "#EXT-X-ALLOW-CACHE",
+    "#EXT-X-START",
+    "#EXT-X-DISCONTINUITY-SEQUENCE"
+)
+
+
+def parse_attributes(text):
+    """解析 KEY=VALUE,KEY="VALUE" 形式的属性列表"""
+    return {key: value.strip('"') for key, value in ATTRIBUTE_PATTERN.findall(text)}
+
+
+def read_media_playlist(path):
+    """读取媒体播放列表
+
+    返回的字典中segments为分片列表，每个分片包含时长、URI
+    以及紧挨在它前面的标签（如EXT-X-KEY、EXT-X-DISCONTINUITY）。
+    """
+    playlist = {
+        'version': 3,
+        'target_duration': 0,
+        'media_sequence': 0,
+        'playlist_type': None,
+        'endlist': False,
+        'header': [],
+        'segments': []
+    }
+    tags = []
+    duration = None
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            line = line.strip()
+            if not line or line == "#EXTM3U":
+                continue
+            if line.startswith("#EXT-X-VERSION:"):
+                playlist['version'] = int(line.split(":", 1)[1])
+            elif line.startswith("#EXT-X-TARGETDURATION:"):
+                playlist['target_duration'] = int(line.split(":", 1)[1])
+            elif line.startswith("#EXT-X-MEDIA-SEQUENCE:"):
+                playlist['media_sequence'] = int(line.split(":", 1)[1])
+            elif line.startswith("#EXT-X-PLAYLIST-TYPE:"):
+                playlist['playlist_type'] = line.split(":", 1)[1]
+            elif line == "#EXT-X-ENDLIST":
+                playlist['endlist'] = True
+            elif line.startswith("#EXTINF:"):
+                duration = float(line[len("#EXTINF:"):].split(",")[0])
+            elif line.startswith(HEADER_TAGS):
+                playlist['header'].append(line)
+            elif line.startswith("#"):
+                tags.append(line)
+            else:
+                playlist['segments'].append({
+                    'duration': duration or 0.0,
+                    'uri': line,
+                    'tags': tags
+                })
+                tags = []
+                duration = None
+    return playlist
+
+
+def get_byte_range(segment):
+    """返回分片EXT-X-BYTERANGE标签中的 (长度, 起始位置)，没有时返回None；省略起始位置时为None"""
+    for tag in segment['tags']:
+        if tag.startswith("#EXT-X-BYTERANGE:"):
+            length, _, offset = tag.split(":", 1)[1].partition("@")
+            return int(length), int(offset) if offset else None
+    return None
+
+
+def write_media_playlist(path, playlist):
+    """写入媒体播放列表（先写临时文件再替换，避免播放器读到半个文件）"""
+    segments = playlist['segments']
+    target_duration = max([math.ceil(segment['duration']) for segment in segments] + [playlist.get('target_duration', 0)])
+
+    lines = [
+        "#EXTM3U",
+        f"#EXT-X-VERSION:{playlist.get('version', 3)}",
+        f"#EXT-X-TARGETDURATION:{target_duration}",
+        f"#EXT-X-MEDIA-SEQUENCE:{playlist.get('media_sequence', 0)}"
+    ]
+    if playlist.get('playlist_type'):
+        lines.append(f"#EXT-X-PLAYLIST-TYPE:{playlist['playlist_type']}")
+    lines.extend(playlist.get('header', []))
+    for segment in segments:
+        lines.extend(segment.get('tags', []))
+        lines.append(f"#EXTINF:{segment['duration']:.6f},")
+        lines.append(segment['uri'])
+    if playlist.get('endlist'):
+        lines.append("#EXT-X-ENDLIST")
+
+    temp_path = f"{path}.tmp"
+    with open(temp_path, 'w', encoding='utf-8') as f:
+        f.write("\n".join(lines) + "\n")
+    os.replace(temp_path, path)
+
+
+def measure_bitrate(rendition_dir, playlist):
+    """根据分片文件大小计算实际码率，返回 (峰值, 平均值)，单位bit/s
+
+    峰值取单个分片的最大码率，对应主播放列表的BANDWIDTH；平均值对应AVERAGE-BANDWIDTH。
+    单文件输出时按EXT-X-BYTERANGE中的长度计算。
+    """
+    peak = 0
+    total_size = 0
+    total_duration = 0.0
+    for segment in playlist['segments']:
+        byte_range = get_byte_range(segment)
+        try:
+            size = byte_range[0] if byte_range else os.path.getsize(os.path.join(rendition_dir, segment['uri']))
+        except OSError:
+            continue
+        total_size += size
+        total_duration += segment['duration']
+        if segment['duration'] > 0:
+            peak = max(peak, size * 8 / segment['duration'])
+    average = total_size * 8 / total_duration if total_duration > 0 else 0
+    return int(math.ceil(peak)), int(math.ceil(average))
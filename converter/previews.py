@@ -0,0 +1,234 @@
+import math
+import os
+import subprocess
+
+try:
+    import numpy as np
+except ImportError:  # 没有安装NumPy时用纯Python计算评分，速度较慢但结果一致
+    np = None
+
+# 封面尺寸
+POSTER_SIZE = (280, 158)
+
+# 雪碧图中每张缩略图的尺寸和每张雪碧图的行列数
+SPRITE_TILE_SIZE = (160, 90)
+SPRITE_COLUMNS = 5
+SPRITE_ROWS = 5
+
+# 挑选封面时的候选帧数量、评分用的缩小尺寸，以及采样范围（跳过片头片尾）
+POSTER_CANDIDATES = 12
+POSTER_SAMPLE_SIZE = (96, 54)
+POSTER_SAMPLE_RANGE = (0.05, 0.95)
+
+# 平均亮度低于或高于这个值的候选帧（黑场、白场、淡入淡出）不参与挑选
+POSTER_DARK_LEVEL = 20
+POSTER_BRIGHT_LEVEL = 235
+
+# 雪碧图目录和WebVTT缩略图轨道的文件名
+SPRITES_DIR_NAME = "sprites"
+THUMBNAILS_VTT_NAME = "thumbnails.vtt"
+
+
+def get_sprites_dir(output_dir):
+    return os.path.join(output_dir, SPRITES_DIR_NAME)
+
+
+def _fit(width, height):
+    """等比缩放到指定尺寸内，不足的部分填充黑边"""
+    return (
+        f"scale={width}:{height}:force_original_aspect_ratio=decrease,"
+        f"pad={width}:{height}:(ow-iw)/2:(oh-ih)/2"
+    )
+
+
+def build_preview_args(output_dir, settings, hwaccel=None):
+    """生成封面和雪碧图输出的滤镜和输出参数
+
+    源视频解码后分出两路：一路取第一帧作为封面，一路按固定间隔抽帧拼成雪碧图。
+    硬件解码时帧在显存中，先用hwdownload复制回内存，转换本身仍在GPU上进行。
+    """
+    interval = float(settings.get('preview_interval', 10))
+    tile_width, tile_height = SPRITE_TILE_SIZE
+    download = "hwdownload,format=nv12|p010le," if hwaccel else ""
+    filters = ";".join([
+        f"[0:v]{download}split=2[poster_in][sprite_in]",
+        f"[poster_in]trim=end_frame=1,{_fit(*POSTER_SIZE)}[poster]",
+        f"[sprite_in]fps=1/{interval:g},{_fit(tile_width, tile_height)},tile={SPRITE_COLUMNS}x{SPRITE_ROWS}[sprite]"
+    ])
+    return [
+        "-filter_complex", filters,
+        "-map", "[poster]", "-frames:v", "1", "-q:v", "2", os.path.join(output_dir, "thumbnail.jpg"),
+        "-map", "[sprite]", "-q:v", "5", "-f", "image2",
+        os.path.join(get_sprites_dir(output_dir), "sprite_%03d.jpg")
+    ]
+
+
+def add_preview_outputs(command, output_dir, settings, hwaccel=None):
+    """在转换命令中加入封面和雪碧图输出，与转换共用一次解码
+
+    额外的输出放在输入文件之后、原有输出之前，原命令的最后一个参数仍是播放列表。
+    """
+    position = command.index("-i") + 2
+    return command[:position] + build_preview_args(output_dir, settings, hwaccel) + command[position:]
+
+
+def build_preview_command(input_file, output_dir, settings):
+    """单独生成封面和雪碧图的命令，只解码关键帧
+
+    用于无法在转换中顺带生成的情况（直接复制、分段编码、断点续转）。
+    """
+    return ["ffmpeg", "-y", "-skip_frame", "nokey", "-i", input_file] + build_preview_args(output_dir, settings)
+
+
+def get_sprite_count(duration, settings):
+    """按时长计算应生成的雪碧图数量"""
+    thumbnails = math.ceil(duration / float(settings.get('preview_interval', 10)))
+    return math.ceil(thumbnails / (SPRITE_COLUMNS * SPRITE_ROWS))
+
+
+def has_previews(output_dir, duration, settings):
+    """检查封面和雪碧图是否都已生成（雪碧图是否覆盖整个视频）"""
+    if not os.path.exists(os.path.join(output_dir, "thumbnail.jpg")):
+        return False
+    if not duration:
+        return True
+    sprites_dir = get_sprites_dir(output_dir)
+    return all(
+        os.path.exists(os.path.join(sprites_dir, f"sprite_{index:03d}.jpg"))
+        for index in range(1, get_sprite_count(duration, settings) + 1)
+    )
+
+
+def _format_vtt_time(seconds):
+    hours, rest = divmod(seconds, 3600)
+    minutes, seconds = divmod(rest, 60)
+    return f"{int(hours):02d}:{int(minutes):02d}:{seconds:06.3f}"
+
+
+def write_thumbnails_vtt(output_dir, duration, settings):
+    """生成WebVTT缩略图轨道，每条字幕指向雪碧图中的一块区域（#xywh）"""
+    interval = float(settings.get('preview_interval', 10))
+    tile_width, tile_height = SPRITE_TILE_SIZE
+    per_sprite = SPRITE_COLUMNS * SPRITE_ROWS
+    lines = ["WEBVTT", ""]
+    for index in range(math.ceil(duration / interval)):
+        sprite_name = f"sprite_{index // per_sprite + 1:03d}.jpg"
+        if not os.path.exists(os.path.join(get_sprites_dir(output_dir), sprite_name)):
+            break
+        position = index % per_sprite
+        x = (position % SPRITE_COLUMNS) * tile_width
+        y = (position // SPRITE_COLUMNS) * tile_height
+        start = index * interval
+        end = min(start + interval, duration)
+        lines.append(f"{_format_vtt_time(start)} --> {_format_vtt_time(end)}")
+        lines.append(f"{SPRITES_DIR_NAME}/{sprite_name}#xywh={x},{y},{tile_width},{tile_height}")
+        lines.append("")
+
+    vtt_path = os.path.join(output_dir, THUMBNAILS_VTT_NAME)
+    temp_path = f"{vtt_path}.tmp"
+    with open(temp_path, 'w', encoding='utf-8') as f:
+        f.write("\n".join(lines))
+    os.replace(temp_path, vtt_path)
+    return vtt_path
+
+
+def get_poster_candidates(duration, count=POSTER_CANDIDATES):
+    """在视频中均匀选取候选时间点"""
+    start, end = POSTER_SAMPLE_RANGE
+    if count == 1:
+        return [duration * start]
+    return [duration * (start + (end - start) * i / (count - 1)) for i in range(count)]
+
+
+def build_poster_sample_command(input_file, times):
+    """在每个候选时间点定位到最近的关键帧并只解码这一帧，缩小成灰度图后输出到标准输出"""
+    width, height = POSTER_SAMPLE_SIZE
+    command = ["ffmpeg", "-v", "error"]
+    for time in times:
+        command.extend(["-skip_frame", "nokey", "-noaccurate_seek", "-ss", f"{time:.3f}", "-i", input_file])
+    filters = [
+        f"[{i}:v]trim=end_frame=1,scale={width}:{height},setsar=1,format=gray[c{i}]"
+        for i in range(len(times))
+    ]
+    filters.append("".join(f"[c{i}]" for i in range(len(times))) + f"concat=n={len(times)}:v=1:a=0[out]")
+    command.extend([
+        "-filter_complex", ";".join(filters),
+        "-map", "[out]",
+        "-fps_mode", "passthrough",
+        "-f", "rawvideo",
+        "-pix_fmt", "gray",
+        "pipe:1"
+    ])
+    return command
+
+
+def score_frames(data, width, height):
+    """给灰度帧评分：清晰度（拉普拉斯方差）乘以曝光和对比度系数，黑场白场记0分"""
+    frame_size = width * height
+    count = len(data) // frame_size
+    if np is not None:
+        frames = np.frombuffer(data[:count * frame_size], dtype=np.uint8).reshape(count, height, width).astype(np.float32)
+        brightness = frames.mean(axis=(1, 2))
+        contrast = frames.std(axis=(1, 2))
+        laplacian = (
+            4 * frames[:, 1:-1, 1:-1]
+            - frames[:, :-2, 1:-1] - frames[:, 2:, 1:-1]
+            - frames[:, 1:-1, :-2] - frames[:, 1:-1, 2:]
+        )
+        sharpness = laplacian.var(axis=(1, 2))
+        scores = np.log1p(sharpness) * (1 - np.abs(brightness - 128) / 128) * np.minimum(contrast / 32, 1)
+        scores[(brightness < POSTER_DARK_LEVEL) | (brightness > POSTER_BRIGHT_LEVEL)] = 0
+        return scores.tolist()
+
+    scores = []
+    for index in range(count):
+        frame = data[index * frame_size:(index + 1) * frame_size]
+        brightness = sum(frame) / frame_size
+        if brightness < POSTER_DARK_LEVEL or brightness > POSTER_BRIGHT_LEVEL:
+            scores.append(0.0)
+            continue
+        contrast = math.sqrt(sum((value - brightness) ** 2 for value in frame) / frame_size)
+        laplacian = [
+            4 * frame[y * width + x]
+            - frame[(y - 1) * width + x] - frame[(y + 1) * width + x]
+            - frame[y * width + x - 1] - frame[y * width + x + 1]
+            for y in range(1, height - 1)
+            for x in range(1, width - 1)
+        ]
+        mean = sum(laplacian) / len(laplacian)
+        sharpness = sum((value - mean) ** 2 for value in laplacian) / len(laplacian)
+        scores.append(math.log1p(sharpness) * (1 - abs(brightness - 128) / 128) * min(contrast / 32, 1))
+    return scores
+
+
+def select_poster(input_file, output_dir, duration):
+    """从若干关键帧中挑选最清晰、曝光正常的一帧作为封面，返回所选时间点
+
+    所有候选帧都不合适（例如全片黑场）时保留原有封面，返回None。
+    """
+    times = get_poster_candidates(duration)
+    result = subprocess.run(build_poster_sample_command(input_file, times), capture_output=True)
+    if result.returncode != 0:
+        raise Exception(result.stderr.decode('utf-8', errors='replace'))
+
+    scores = score_frames(result.stdout, *POSTER_SAMPLE_SIZE)
+    if not scores or max(scores) <= 0:
+        return None
+    best_time = times[scores.index(max(scores))]
+
+    # 先写临时文件再替换，原封面可能是与缓存结果共享的硬链接
+    thumbnail_path = os.path.join(output_dir, "thumbnail.jpg")
+    temp_path = os.path.join(output_dir, "thumbnail.tmp.jpg")
+    command = [
+        "ffmpeg", "-y", "-v", "error",
+        "-skip_frame", "nokey", "-noaccurate_seek", "-ss", f"{best_time:.3f}", "-i", input_file,
+        "-vf", _fit(*POSTER_SIZE),
+        "-frames:v", "1",
+        "-q:v", "2",
+        temp_path
+    ]
+    result = subprocess.run(command, capture_output=True, text=True)
+    if result.returncode != 0 or not os.path.exists(temp_path):
+        raise Exception(result.stderr or "封面文件未生成")
+    os.replace(temp_path, thumbnail_path)
+    return best_time
@@ -0,0 +1,101 @@
+import json
+import subprocess
+
+
+def get_video_info(input_file):
+    """获取视频信息（ffprobe的JSON输出）"""
+    cmd = [
+        'ffprobe',
+        '-v', 'quiet',
+        '-print_format', 'json',
+        '-show_format',
+        '-show_streams',
+        input_file
+    ]
+    result = subprocess.run(cmd, capture_output=True, text=True)
+    if result.returncode != 0:
+        raise Exception(f"ffprobe failed: {result.stderr}")
+    return json.loads(result.stdout)
+
+
+def get_duration(video_info):
+    """获取视频总时长（秒），无法获取时返回None"""
+    if video_info and video_info.get('format', {}).get('duration'):
+        return float(video_info['format']['duration'])
+    return None
+
+
+def get_video_stream(video_info):
+    """获取源文件的第一个视频流，没有时返回None"""
+    if video_info and 'streams' in video_info:
+        return next((stream for stream in video_info['streams'] if stream.get('codec_type') == 'video'), None)
+    return None
+
+
+def has_audio_stream(video_info):
+    """判断源文件是否包含音频流，无法判断时按有音频处理"""
+    if video_info and 'streams' in video_info:
+        return any(stream.get('codec_type') == 'audio' for stream in video_info['streams'])
+    return True
+
+
+# H.264的profile名称到RFC 6381编解码器字符串中profile_idc的对应关系
+H264_PROFILES = {
+    "Baseline": 0x42,
+    "Constrained Baseline": 0x42,
+    "Main": 0x4d,
+    "Extended": 0x58,
+    "High": 0x64,
+    "High 10": 0x6e,
+    "High 4:2:2": 0x7a,
+    "High 4:4:4 Predictive": 0xf4
+}
+
+# 音频编码到编解码器字符串的对应关系（AAC按profile区分）
+AUDIO_CODECS = {
+    "mp3": "mp4a.40.34",
+    "ac3": "ac-3",
+    "eac3": "ec-3",
+    "opus": "opus",
+    "flac": "fLaC"
+}
+
+
+def get_media_streams(path):
+    """获取媒体文件（如fMP4初始化分片）中的流信息"""
+    cmd = [
+        'ffprobe',
+        '-v', 'error',
+        '-print_format', 'json',
+        '-show_streams',
+        path
+    ]
+    result = subprocess.run(cmd, capture_output=True, text=True)
+    if result.returncode != 0:
+        raise Exception(f"ffprobe failed: {result.stderr}")
+    return json.loads(result.stdout).get('streams', [])
+
+
+def get_codec_string(stream):
+    """根据ffprobe的流信息生成RFC 6381编解码器字符串（HLS的CODECS、DASH的codecs），无法识别时返回None"""
+    codec = stream.get('codec_name')
+    profile = stream.get('profile') or ""
+    if codec == "h264":
+        # 不认识的profile不猜测，写错的CODECS可能让播放器误判无法播放
+        if profile not in H264_PROFILES:
+            return None
+        constraints = 0x40 if profile == "Constrained Baseline" else 0
+        level = int(stream.get('level') or 40)
+        return f"avc1.{H264_PROFILES[profile]:02x}{constraints:02x}{level:02x}"
+    if codec == "hevc":
+        # Main 10用general_profile_idc=2，兼容标志只声明自身的profile
+        if profile == "Main 10":
+            return f"hvc1.2.4.L{int(stream.get('level') or 120)}.B0"
+        return f"hvc1.1.6.L{int(stream.get('level') or 120)}.B0"
+    if codec == "aac":
+        if profile == "HE-AACv2":
+            return "mp4a.40.29"
+        if profile == "HE-AAC":
+            return "mp4a.40.5"
+        return "mp4a.40.2"
+    return AUDIO_CODECS.get(codec)
@@ -0,0 +1,197 @@
+import json
+import os
+import shutil
+
+from converter.cache import forget_conversion, get_fingerprint, normalize_settings
+from converter.catalog import MANIFEST_NAME
+from converter.chunked import CHUNKS_DIR_NAME
+from converter.commands import (
+    AUDIO_RENDITION, RESOLUTION_DIRS, SINGLE_FILE_PREFIX, build_rendition_command, get_cpu_settings, get_resolution_dir
+)
+from converter.dash import DASH_MANIFEST_NAME
+from converter.encryption import KEYS_DIR_NAME
+from converter.playlist import read_media_playlist, write_media_playlist
+from converter.previews import SPRITES_DIR_NAME, THUMBNAILS_VTT_NAME
+
+# 记录输出目录是由哪个源文件、哪些设置生成的，只有两者都相同时才续转
+RESUME_MARKER_NAME = ".resume.json"
+
+# 转换生成的文件和目录，源文件或设置变化时全部删除后重新转换
+OUTPUT_FILES = ("master.m3u8", DASH_MANIFEST_NAME, MANIFEST_NAME, "thumbnail.jpg", THUMBNAILS_VTT_NAME)
+OUTPUT_DIRS = tuple(RESOLUTION_DIRS.values()) + (AUDIO_RENDITION, CHUNKS_DIR_NAME, SPRITES_DIR_NAME, KEYS_DIR_NAME)
+
+# 直接复制模式下-ss会落在目标时间之前的关键帧上，
+# 稍微往后偏移一点，避免因时长累加误差退回到上一个关键帧而重复一整段画面
+COPY_SEEK_EPSILON = 0.05
+
+
+def get_resume_name(output_name):
+    """续转时临时播放列表的文件名（不含扩展名）"""
+    return f"{output_name}_resume"
+
+
+def get_resume_marker(input_file, settings):
+    """输出目录的续转标记：源文件的内容指纹和影响输出结果的设置"""
+    return {'source': get_fingerprint(input_file), 'settings': normalize_settings(settings)}
+
+
+def read_resume_marker(output_dir):
+    """读取输出目录的续转标记，没有时返回None"""
+    try:
+        with open(os.path.join(output_dir, RESUME_MARKER_NAME), 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def clear_output(output_dir):
+    """删除输出目录中转换生成的所有文件，其他文件保持不变"""
+    for name in OUTPUT_DIRS:
+        path = os.path.join(output_dir, name)
+        if os.path.isdir(path):
+            shutil.rmtree(path)
+    for name in OUTPUT_FILES:
+        path = os.path.join(output_dir, name)
+        if os.path.exists(path):
+            os.remove(path)
+    # 目录中原有的结果已被删除，不能再作为缓存结果复用
+    forget_conversion(output_dir)
+
+
+def prepare_output(output_dir, input_file, settings):
+    """确认输出目录中已有的结果可以续转，返回是否清空了目录
+
+    已有结果是其他源文件（例如同名的另一个视频）或其他设置生成的、或者没有续转标记时，
+    先删除这些结果，再写入本次转换的标记，避免把旧的分片当作已完成的部分。
+    """
+    marker = get_resume_marker(input_file, settings)
+    existing = read_resume_marker(output_dir)
+    cleared = existing != marker and any(
+        os.path.exists(os.path.join(output_dir, name)) for name in OUTPUT_DIRS + OUTPUT_FILES
+    )
+    if cleared:
+        clear_output(output_dir)
+    if existing != marker:
+        marker_path = os.path.join(output_dir, RESUME_MARKER_NAME)
+        temp_path = f"{marker_path}.tmp"
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump(marker, f, ensure_ascii=False)
+        os.replace(temp_path, marker_path)
+    return cleared
+
+
+def merge_resume_playlist(rendition_dir, output_name):
+    """把续转生成的临时播放列表追加到原播放列表后面"""
+    playlist_path = os.path.join(rendition_dir, f"{output_name}.m3u8")
+    resume_path = os.path.join(rendition_dir, f"{get_resume_name(output_name)}.m3u8")
+    if not os.path.exists(resume_path):
+        return
+
+    resume_playlist = read_media_playlist(resume_path)
+    if os.path.exists(playlist_path):
+        playlist = read_media_playlist(playlist_path)
+        playlist['segments'].extend(resume_playlist['segments'])
+        playlist['endlist'] = resume_playlist['endlist']
+        playlist['version'] = max(playlist['version'], resume_playlist['version'])
+    else:
+        playlist = resume_playlist
+    write_media_playlist(playlist_path, playlist)
+    os.remove(resume_path)
+
+
+def inspect_rendition(rendition_dir, output_name):
+    """检查分辨率目录中已经完成的分片
+
+    播放列表中只会记录写完的分片，列表之外的分片文件是中断时写了一半的。
+    返回是否已全部完成、已完成分片数、已完成时长以及下一个分片的序号。
+    """
+    state = {'complete': False, 'segments': 0, 'duration': 0.0, 'next_sequence': 0}
+    merge_resume_playlist(rendition_dir, output_name)
+    playlist_path = os.path.join(rendition_dir, f"{output_name}.m3u8")
+    if not os.path.exists(playlist_path):
+        return state
+
+    playlist = read_media_playlist(playlist_path)
+    segments = []
+    for segment in playlist['segments']:
+        if not os.path.exists(os.path.join(rendition_dir, segment['uri'])):
+            break
+        segments.append(segment)
+
+    state['complete'] = playlist['endlist'] and len(segments) == len(playlist['segments'])
+    state['segments'] = len(segments)
+    state['duration'] = sum(segment['duration'] for segment in segments)
+    state['next_sequence'] = playlist['media_sequence'] + len(segments)
+
+    # 播放列表记录的分片有缺失时，只保留连续存在的部分
+    if len(segments) != len(playlist['segments']):
+        playlist['segments'] = segments
+        playlist['endlist'] = False
+        write_media_playlist(playlist_path, playlist)
+    return state
+
+
+def discard_partial_segments(rendition_dir, output_name):
+    """删除不在播放列表中的分片和单文件输出的媒体文件（中断时写了一半的文件）"""
+    playlist_path = os.path.join(rendition_dir, f"{output_name}.m3u8")
+    listed = set()
+    if os.path.exists(playlist_path):
+        listed = {segment['uri'] for segment in read_media_playlist(playlist_path)['segments']}
+    for name in os.listdir(rendition_dir):
+        if name.startswith(("segment_", SINGLE_FILE_PREFIX)) and name not in listed:
+            os.remove(os.path.join(rendition_dir, name))
+
+
+def plan_resume(jobs, input_file, output_dir, settings, duration=None):
+    """根据输出目录中已有的结果调整任务列表（输出目录需要先经过prepare_output确认）
+
+    * 所有分辨率都已完成的任务直接跳过
+    * 单个分辨率的任务从最后一个完整分片处继续，用-ss跳过已完成部分，
+      用-start_number接着编号，结束后再把新分片追加到原播放列表
+    * 其余未完成的任务（单次解码、分段编码中的一段）重新转换
+    """
+    output_name = settings.get('output_name', 'playlist')
+    planned = []
+    for job in jobs:
+        # 分段编码的结果合并后临时目录会被删除，以最终输出目录为准
+        if all(inspect_rendition(get_resolution_dir(output_dir, r), output_name)['complete'] for r in job['resolutions']):
+            continue
+        states = [inspect_rendition(get_resolution_dir(job['output_dir'], r), output_name) for r in job['resolutions']]
+        if all(state['complete'] for state in states):
+            continue
+
+        if len(job['resolutions']) == 1 and 'chunk' not in job and states[0]['segments'] > 0:
+            resolution = job['resolutions'][0]
+            rendition_dir = get_resolution_dir(job['output_dir'], resolution)
+            discard_partial_segments(rendition_dir, output_name)
+            done = states[0]['duration']
+            start = done + (COPY_SEEK_EPSILON if settings['video_encoder'] == "copy" else 0)
+            resume_settings = {
+                **settings,
+                'output_name': get_resume_name(output_name),
+                'start_number': states[0]['next_sequence']
+            }
+            resumed = {
+                **job,
+                'command': build_rendition_command(input_file, job['output_dir'], resolution, resume_settings, start),
+                'duration': max(duration - done, 1.0) if duration else None,
+                'time_offset': done,
+                'resumed_from': done
+            }
+            if 'fallback_command' in job:
+                resumed['fallback_command'] = build_rendition_command(
+                    input_file, job['output_dir'], resolution, get_cpu_settings(resume_settings), start
+                )
+            planned.append(resumed)
+        else:
+            planned.append(job)
+    return planned
+
+
+def finish_resume(jobs, settings):
+    """把续转任务生成的分片追加到原播放列表"""
+    output_name = settings.get('output_name', 'playlist')
+    for job in jobs:
+        if 'resumed_from' in job:
+            for resolution in job['resolutions']:
+                merge_resume_playlist(get_resolution_dir(job['output_dir'], resolution), output_name)
@@ -0,0 +1,314 @@
+import os
+import queue
+import re
+import subprocess
+import threading
+import time
+
+from converter.commands import is_hwaccel_failure
+
+# 硬件编码器的默认并发会话上限（消费级显卡驱动通常会限制同时编码的会话数）
+HW_SESSION_LIMITS = {
+    "nvenc": 3,
+    "qsv": 4
+}
+
+# 匹配-progress输出中的 speed=1.23x
+SPEED_PATTERN = re.compile(r"^\s*(\d+(?:\.\d+)?)x\s*$")
+
+# 进度回调的最小间隔（秒），任务开始和结束的状态变化不受限制
+PROGRESS_INTERVAL = 0.5
+
+# 失败时保留的stderr行数
+STDERR_TAIL_LINES = 50
+
+# 检查外部停止信号的间隔（秒）
+STOP_POLL_INTERVAL = 0.5
+
+
+def get_hw_family(video_encoder):
+    """获取硬件编码器所属的类别，软件编码返回None"""
+    for family in HW_SESSION_LIMITS:
+        if family in (video_encoder or ""):
+            return family
+    return None
+
+
+def plan_concurrency(jobs, max_workers=0, cpu_count=None):
+    """计算并行任务数以及每个libx264任务可用的线程数
+
+    max_workers为0时自动按CPU核心数决定，每个任务分到的线程数之和不超过核心数，
+    避免多个x264进程互相抢占CPU。
+    """
+    cpu_count = cpu_count or os.cpu_count() or 1
+    workers = int(max_workers or 0) or cpu_count
+    workers = max(1, min(workers, len(jobs)))
+    threads_per_job = max(1, cpu_count // workers)
+    return workers, threads_per_job
+
+
+def apply_thread_limit(command, threads):
+    """在输出文件前插入-threads参数"""
+    if "-threads" in command:
+        return list(command)
+    return command[:-1] + ["-threads", str(threads)] + command[-1:]
+
+
+def apply_progress_args(command):
+    """让FFmpeg把机器可读的进度输出到标准输出，并关闭标准错误中的统计行"""
+    if "-progress" in command:
+        return list(command)
+    return command[:1] + ["-progress", "pipe:1", "-nostats"] + command[1:]
+
+
+def parse_progress(block):
+    """解析一组-progress键值对，返回已处理秒数、帧率、编码速度和帧数"""
+    progress = {'seconds': None, 'fps': None, 'speed': None, 'frame': None}
+    # out_time_ms实际上也是微秒，新版本FFmpeg另外输出out_time_us
+    out_time = block.get('out_time_us') or block.get('out_time_ms')
+    try:
+        if out_time not in (None, 'N/A'):
+            progress['seconds'] = int(out_time) / 1000000
+    except ValueError:
+        pass
+    try:
+        progress['fps'] = float(block.get('fps', ''))
+    except ValueError:
+        pass
+    try:
+        progress['frame'] = int(block.get('frame', ''))
+    except ValueError:
+        pass
+    match = SPEED_PATTERN.match(block.get('speed', ''))
+    if match:
+        progress['speed'] = float(match.group(1))
+    return progress
+
+
+def format_eta(seconds):
+    """把剩余秒数格式化为 时:分:秒"""
+    if seconds is None:
+        return "--:--"
+    seconds = int(seconds)
+    hours, rest = divmod(seconds, 3600)
+    minutes, seconds = divmod(rest, 60)
+    if hours:
+        return f"{hours}:{minutes:02d}:{seconds:02d}"
+    return f"{minutes:02d}:{seconds:02d}"
+
+
+def _drain_stderr(process, stderr_tail):
+    """读取标准错误并保留最后若干行，防止管道写满阻塞FFmpeg"""
+    for line in process.stderr:
+        stderr_tail.append(line)
+        del stderr_tail[:-STDERR_TAIL_LINES]
+
+
+def _terminate_all(processes, lock):
+    """终止所有正在运行的FFmpeg进程"""
+    with lock:
+        for process in processes.values():
+            process.terminate()
+
+
+def _execute(index, command, events, cancel_event, processes, lock):
+    """启动FFmpeg进程并把进度放入队列，返回 (退出码, 标准错误的最后若干行)"""
+    process = subprocess.Popen(
+        apply_progress_args(command),
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        universal_newlines=True,
+        bufsize=1
+    )
+    with lock:
+        processes[index] = process
+        # 登记前已取消时其他线程终止不到这个进程，由自己终止
+        if cancel_event.is_set():
+            process.terminate()
+
+    stderr_tail = []
+    stderr_thread = threading.Thread(target=_drain_stderr, args=(process, stderr_tail), daemon=True)
+    stderr_thread.start()
+
+    # 每组键值对以progress=continue或progress=end结尾
+    block = {}
+    for line in process.stdout:
+        key, _, value = line.strip().partition("=")
+        if key == "progress":
+            events.put(('progress', index, parse_progress(block)))
+            block = {}
+        elif key:
+            block[key] = value
+    process.wait()
+    stderr_thread.join()
+
+    with lock:
+        processes.pop(index, None)
+    return process.returncode, "".join(stderr_tail)
+
+
+def _run_job(index, job, events, cancel_event, slots, hw_semaphore, processes, lock):
+    """在工作线程中执行单个任务，并把状态事件放入队列
+
+    任务带fallback_command时，硬件解码初始化失败后改用该命令（CPU解码）重新执行一次。
+    """
+    with slots:
+        if hw_semaphore is not None:
+            hw_semaphore.acquire()
+        try:
+            if cancel_event.is_set():
+                events.put(('done', index, None, "已取消"))
+                return
+
+            events.put(('start', index))
+            returncode, stderr = _execute(index, job['command'], events, cancel_event, processes, lock)
+            if (returncode != 0 and job.get('fallback_command') and not cancel_event.is_set()
+                    and is_hwaccel_failure(stderr)):
+                events.put(('fallback', index))
+                returncode, stderr = _execute(index, job['fallback_command'], events, cancel_event, processes, lock)
+            events.put(('done', index, returncode, stderr))
+        except Exception as e:
+            events.put(('done', index, -1, str(e)))
+        finally:
+            if hw_semaphore is not None:
+                hw_semaphore.release()
+
+
+def run_jobs(jobs, max_workers=0, hw_session_limits=None, duration=None, on_progress=None, cpu_count=None,
+             progress_interval=PROGRESS_INTERVAL, stop_event=None):
+    """并行执行转换任务
+
+    jobs为build_commands生成的任务列表，任务可带duration/time_offset指定自身的时长和起始时间。
+    任务在工作线程中运行，进度回调on_progress始终在调用方线程中执行
+    （Streamlit只能在脚本线程中更新页面）；单纯的进度更新每progress_interval秒最多回调一次。
+    任意任务失败或stop_event被设置后会停止其余任务，被停止的任务记为已取消。
+    返回与jobs一一对应的结果列表。
+    """
+    if not jobs:
+        return []
+
+    workers, threads_per_job = plan_concurrency(jobs, max_workers, cpu_count)
+    limits = {**HW_SESSION_LIMITS, **(hw_session_limits or {})}
+
+    slots = threading.Semaphore(workers)
+    hw_semaphores = {family: threading.Semaphore(max(1, int(limit))) for family, limit in limits.items()}
+    events = queue.Queue()
+    cancel_event = threading.Event()
+    processes = {}
+    lock = threading.Lock()
+
+    started_at = time.time()
+    state = {
+        'workers': workers,
+        'threads_per_job': threads_per_job,
+        'overall': 0.0,
+        'eta': None,
+        'jobs': [
+            {
+                'resolutions': job['resolutions'],
+                'chunk': job.get('chunk'),
+                'status': 'pending',
+                'progress': 0.0,
+                'log': '',
+                'fps': None,
+                'speed': None,
+                'eta': None,
+                'returncode': None,
+                'stderr': '',
+                'fallback': False,
+                'elapsed': 0.0,
+                'started_at': None
+            }
+            for job in jobs
+        ]
+    }
+
+    threads = []
+    for index, job in enumerate(jobs):
+        if job.get('encoder') == "libx264":
+            job = {**job, 'command': apply_thread_limit(job['command'], threads_per_job)}
+        family = get_hw_family(job.get('encoder'))
+        thread = threading.Thread(
+            target=_run_job,
+            args=(index, job, events, cancel_event, slots, hw_semaphores.get(family), processes, lock),
+            daemon=True
+        )
+        thread.start()
+        threads.append(thread)
+
+    weights = [job.get('duration') or duration for job in jobs]
+    finished = 0
+    last_report = 0.0
+    while finished < len(jobs):
+        if stop_event is not None and stop_event.is_set() and not cancel_event.is_set():
+            cancel_event.set()
+            _terminate_all(processes, lock)
+        try:
+            event = events.get(timeout=STOP_POLL_INTERVAL if stop_event is not None else None)
+        except queue.Empty:
+            continue
+        job_state = state['jobs'][event[1]]
+        if event[0] == 'start':
+            job_state['status'] = 'running'
+            job_state['started_at'] = time.time()
+        elif event[0] == 'fallback':
+            job_state['fallback'] = True
+            job_state['progress'] = 0.0
+            job_state['log'] = "硬件解码不可用，已改用CPU解码重新转换"
+        elif event[0] == 'progress':
+            _, index, progress = event
+            job_state['fps'] = progress['fps']
+            job_state['speed'] = progress['speed']
+            job_duration = weights[index]
+            if progress['seconds'] is not None and job_duration:
+                seconds = progress['seconds'] - jobs[index].get('time_offset', 0)
+                job_state['progress'] = min(max(seconds / job_duration, 0.0), 1.0)
+                if progress['speed']:
+                    job_state['eta'] = job_duration * (1 - job_state['progress']) / progress['speed']
+            job_state['log'] = (
+                f"{job_state['progress'] * 100:.1f}% | 帧 {progress['frame'] or 0} | "
+                f"{progress['fps'] or 0:.1f} fps | {progress['speed'] or 0:.2f}x | 剩余 {format_eta(job_state['eta'])}"
+            )
+        elif event[0] == 'done':
+            _, _, returncode, stderr = event
+            finished += 1
+            job_state['returncode'] = returncode
+            job_state['eta'] = None
+            if job_state['started_at']:
+                job_state['elapsed'] = time.time() - job_state['started_at']
+            if returncode == 0:
+                job_state['status'] = 'done'
+                job_state['progress'] = 1.0
+            else:
+                # 因其他任务失败而被终止的任务记为已取消
+                job_state['status'] = 'cancelled' if returncode is None or cancel_event.is_set() else 'failed'
+                job_state['stderr'] = stderr
+                if not cancel_event.is_set():
+                    # 一个任务失败后终止其余正在运行的任务
+                    cancel_event.set()
+                    _terminate_all(processes, lock)
+
+        # 只有进度变化时按间隔节流，避免每行输出都重绘页面
+        now = time.time()
+        if event[0] == 'progress' and now - last_report < progress_interval:
+            continue
+        last_report = now
+
+        # 汇总总体进度：已知时长时按各任务时长加权计算，否则按完成任务数计算
+        if all(weights):
+            state['overall'] = sum(j['progress'] * w for j, w in zip(state['jobs'], weights)) / sum(weights)
+        else:
+            state['overall'] = sum(1 for j in state['jobs'] if j['status'] == 'done') / len(jobs)
+        # 按已用时间和总体进度估算剩余时间，能反映排队等待和并行度的影响
+        if 0 < state['overall'] < 1:
+            state['eta'] = (now - started_at) * (1 - state['overall']) / state['overall']
+        else:
+            state['eta'] = None
+
+        if on_progress:
+            on_progress(state)
+
+    for thread in threads:
+        thread.join()
+
+    return state['jobs']
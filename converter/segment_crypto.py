@@ -0,0 +1,252 @@
+import math
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+from converter.cache import forget_conversion
+from converter.dash import get_dash_manifest_path
+from converter.encryption import ensure_key_pool, get_keys_dir
+from converter.playlist import get_byte_range, parse_attributes, read_media_playlist, write_media_playlist
+
+try:
+    from cryptography.hazmat.primitives import padding
+    from cryptography.hazmat.primitives.ciphers import Cipher, algorithms, modes
+except ImportError:  # 只有对已转换的视频加密、解密时才需要
+    Cipher = None
+
+# 每次读写的数据块大小，每个工作线程同时只持有一块数据
+CHUNK_SIZE = 1024 * 1024
+
+# 默认同时处理的分片数
+DEFAULT_WORKERS = 4
+
+
+def require_cryptography():
+    """没有安装cryptography时抛出RuntimeError"""
+    if Cipher is None:
+        raise RuntimeError("加密/解密分片需要安装cryptography：pip install cryptography")
+
+
+def _transform_file(source, target, key, iv, decrypt=False):
+    """用AES-128-CBC流式加密或解密一个文件（PKCS7填充）"""
+    cipher = Cipher(algorithms.AES(key), modes.CBC(iv))
+    if decrypt:
+        context = cipher.decryptor()
+        pad = padding.PKCS7(128).unpadder()
+    else:
+        context = cipher.encryptor()
+        pad = padding.PKCS7(128).padder()
+
+    with open(source, 'rb') as src, open(target, 'wb') as dst:
+        while True:
+            chunk = src.read(CHUNK_SIZE)
+            if not chunk:
+                break
+            if decrypt:
+                dst.write(pad.update(context.update(chunk)))
+            else:
+                dst.write(context.update(pad.update(chunk)))
+        if decrypt:
+            dst.write(pad.update(context.finalize()) + pad.finalize())
+        else:
+            dst.write(context.update(pad.finalize()) + context.finalize())
+
+
+def _get_temp_file(source):
+    return f"{source}.tmp"
+
+
+def _get_pending_playlist(playlist_path):
+    """新播放列表先写到这个文件，它存在表示所有分片都已处理完、正在替换"""
+    return f"{playlist_path}.pending"
+
+
+def recover_rendition(rendition_dir, output_name="playlist"):
+    """完成或撤销上次被中断的加密/解密，返回是否做了处理
+
+    待替换的播放列表已写入时，分片的临时文件都已完整，继续把剩余的临时文件替换到位再替换播放列表；
+    没有写入时只删除残留的临时文件，原分片和播放列表都未改动。
+    """
+    playlist_path = os.path.join(rendition_dir, f"{output_name}.m3u8")
+    pending_path = _get_pending_playlist(playlist_path)
+    if os.path.exists(pending_path):
+        for segment in read_media_playlist(pending_path)['segments']:
+            temp_file = _get_temp_file(os.path.join(rendition_dir, segment['uri']))
+            if os.path.exists(temp_file):
+                os.replace(temp_file, os.path.join(rendition_dir, segment['uri']))
+        os.replace(pending_path, playlist_path)
+        return True
+
+    recovered = False
+    for segment in read_media_playlist(playlist_path)['segments']:
+        temp_file = _get_temp_file(os.path.join(rendition_dir, segment['uri']))
+        if os.path.exists(temp_file):
+            os.remove(temp_file)
+            recovered = True
+    return recovered
+
+
+def _run_tasks(tasks, workers, decrypt, playlist_path, playlist):
+    """在线程池中把所有分片处理到临时文件，全部成功后再替换分片和播放列表
+
+    替换前先写入待替换的播放列表作为标记，替换过程中断时由recover_rendition继续完成，
+    不会出现分片已加密而播放列表仍是明文（再次加密会加密两遍）的状态；
+    处理分片时出错则原分片和播放列表都保持不变。
+    """
+    temp_files = [_get_temp_file(source) for source, _, _ in tasks]
+    try:
+        with ThreadPoolExecutor(max_workers=max(1, int(workers))) as executor:
+            futures = [
+                executor.submit(_transform_file, source, temp_file, key, iv, decrypt)
+                for (source, key, iv), temp_file in zip(tasks, temp_files)
+            ]
+            for future in futures:
+                future.result()
+    except Exception:
+        for temp_file in temp_files:
+            if os.path.exists(temp_file):
+                os.remove(temp_file)
+        raise
+
+    pending_path = _get_pending_playlist(playlist_path)
+    write_media_playlist(pending_path, playlist)
+    # 替换而不是原地改写，与缓存结果共享的硬链接文件不受影响
+    for (source, _, _), temp_file in zip(tasks, temp_files):
+        os.replace(temp_file, source)
+    os.replace(pending_path, playlist_path)
+
+
+def get_sequence_iv(sequence):
+    """没有显式IV时HLS使用的IV：分片媒体序号的128位大端表示"""
+    return sequence.to_bytes(16, 'big')
+
+
+def _strip_key_tags(segment):
+    return [tag for tag in segment['tags'] if not tag.startswith("#EXT-X-KEY:")]
+
+
+def is_encrypted(playlist):
+    """播放列表中是否有加密的分片"""
+    for segment in playlist['segments']:
+        for tag in segment['tags']:
+            if tag.startswith("#EXT-X-KEY:") and parse_attributes(tag.split(":", 1)[1]).get('METHOD') != "NONE":
+                return True
+    return False
+
+
+def encrypt_rendition(rendition_dir, output_name="playlist", rotation=0, workers=DEFAULT_WORKERS):
+    """加密一个分辨率目录中的所有分片，并在播放列表中写入EXT-X-KEY
+
+    密钥保存在视频输出目录的keys目录中，各分辨率共用；rotation大于0时每rotation个分片换一个密钥，
+    各分辨率中同一序号的分片使用同一个密钥。EXT-X-KEY不写IV，每个分片以自己的媒体序号作为IV
+    （HLS的默认规则），同一密钥下各分片的IV都不同。返回处理的分片数。
+    """
+    require_cryptography()
+    recover_rendition(rendition_dir, output_name)
+    playlist_path = os.path.join(rendition_dir, f"{output_name}.m3u8")
+    playlist = read_media_playlist(playlist_path)
+    if is_encrypted(playlist):
+        raise ValueError(f"{rendition_dir} 已经加密")
+    if any(get_byte_range(segment) for segment in playlist['segments']):
+        raise ValueError(f"{rendition_dir} 是单文件输出，整段加密需要每个分片一个文件")
+
+    segments = playlist['segments']
+    output_dir = os.path.dirname(os.path.abspath(rendition_dir))
+    period = rotation if rotation and rotation > 0 else max(len(segments), 1)
+    pool = ensure_key_pool(output_dir, max(math.ceil(len(segments) / period), 1))
+    key_bytes = {}
+    for key in pool:
+        with open(os.path.join(get_keys_dir(output_dir), key['name']), 'rb') as f:
+            key_bytes[key['name']] = f.read()
+
+    tasks = []
+    for index, segment in enumerate(segments):
+        key = pool[index // period]
+        iv = get_sequence_iv(playlist['media_sequence'] + index)
+        tasks.append((os.path.join(rendition_dir, segment['uri']), key_bytes[key['name']], iv))
+        tags = _strip_key_tags(segment)
+        if index % period == 0:
+            tags.append(f'#EXT-X-KEY:METHOD=AES-128,URI="{key["uri"]}"')
+        segment['tags'] = tags
+
+    _run_tasks(tasks, workers, False, playlist_path, playlist)
+    return len(segments)
+
+
+def decrypt_rendition(rendition_dir, output_name="playlist", workers=DEFAULT_WORKERS):
+    """解密一个分辨率目录中的所有分片，并从播放列表中去掉EXT-X-KEY，返回处理的分片数"""
+    require_cryptography()
+    recover_rendition(rendition_dir, output_name)
+    playlist_path = os.path.join(rendition_dir, f"{output_name}.m3u8")
+    playlist = read_media_playlist(playlist_path)
+
+    tasks = []
+    key_attributes = None
+    key_cache = {}
+    for index, segment in enumerate(playlist['segments']):
+        for tag in segment['tags']:
+            if tag.startswith("#EXT-X-KEY:"):
+                key_attributes = parse_attributes(tag.split(":", 1)[1])
+        segment['tags'] = _strip_key_tags(segment)
+        if not key_attributes or key_attributes.get('METHOD') == "NONE":
+            continue
+        if key_attributes.get('METHOD') != "AES-128" or "://" in key_attributes['URI']:
+            raise ValueError(f"不支持的加密方式或远程密钥: {key_attributes}")
+
+        key_path = os.path.normpath(os.path.join(rendition_dir, key_attributes['URI']))
+        if key_path not in key_cache:
+            with open(key_path, 'rb') as f:
+                key_cache[key_path] = f.read()
+        # 没有显式IV时IV等于分片的媒体序号
+        if 'IV' in key_attributes:
+            iv = bytes.fromhex(key_attributes['IV'][2:])
+        else:
+            iv = get_sequence_iv(playlist['media_sequence'] + index)
+        tasks.append((os.path.join(rendition_dir, segment['uri']), key_cache[key_path], iv))
+
+    _run_tasks(tasks, workers, True, playlist_path, playlist)
+    return len(tasks)
+
+
+def encrypt_renditions(rendition_dirs, output_name="playlist", rotation=0, workers=DEFAULT_WORKERS):
+    """加密多个分辨率目录，返回每个分辨率处理的分片数
+
+    各分辨率中同一序号的分片使用同一个密钥；上次中断前已经加密完成的分辨率不再处理，
+    重新执行即可继续加密其余的分辨率。
+    """
+    results = {}
+    for rendition_dir in rendition_dirs:
+        name = os.path.basename(rendition_dir)
+        recover_rendition(rendition_dir, output_name)
+        if is_encrypted(read_media_playlist(os.path.join(rendition_dir, f"{output_name}.m3u8"))):
+            results[name] = 0
+        else:
+            results[name] = encrypt_rendition(rendition_dir, output_name, rotation, workers)
+    return results
+
+
+def get_rendition_dirs(output_dir, output_name="playlist"):
+    """列出视频输出目录中包含播放列表的分辨率目录"""
+    return sorted(
+        entry.path for entry in os.scandir(output_dir)
+        if entry.is_dir() and os.path.exists(os.path.join(entry.path, f"{output_name}.m3u8"))
+    )
+
+
+def protect_output(output_dir, decrypt=False, output_name="playlist", rotation=0, workers=DEFAULT_WORKERS):
+    """对一个已转换视频的所有分辨率加密或解密，不重新编码
+
+    输出内容变化后，指向这个目录的转换缓存记录会被删除（在改动任何分片之前删除，
+    中途失败时缓存也不会再引用这个只处理了一部分的目录）。整段加密的分片DASH播放器无法播放，
+    加密时一并删除DASH清单。返回每个分辨率处理的分片数。
+    """
+    forget_conversion(output_dir)
+    rendition_dirs = get_rendition_dirs(output_dir, output_name)
+    if decrypt:
+        return {
+            os.path.basename(rendition_dir): decrypt_rendition(rendition_dir, output_name, workers)
+            for rendition_dir in rendition_dirs
+        }
+    results = encrypt_renditions(rendition_dirs, output_name, rotation, workers)
+    if os.path.exists(get_dash_manifest_path(output_dir)):
+        os.remove(get_dash_manifest_path(output_dir))
+    return results
@@ -0,0 +1,63 @@
+import copy
+import json
+
+# 默认转换设置（页面配置文件和命令行共用）
+DEFAULT_SETTINGS = {
+    'video_encoder': 'copy',
+    'resolutions': ["1920x1080", "1280x720"],  # 默认1080p和720p
+    'audio_encoder': 'copy',
+    'audio_bitrate': '128k',
+    'segment_time': '6',
+    'segment_type': 'mpegts',  # mpegts 或 fmp4（CMAF）
+    'separate_audio': False,  # 音频只编码一次，作为单独的音频组供所有分辨率共用
+    'single_file': False,  # 每个分辨率只写一个媒体文件，播放列表用字节范围引用分片
+    'encryption_enabled': False,
+    'single_decode': False,
+    'max_parallel_jobs': 0,
+    'hw_session_limit': 3,
+    'hw_decode': True,  # GPU编码时同时用GPU解码和缩放，初始化失败时自动改用CPU
+    'chunk_count': 0,
+    'resume': True,
+    'cache': True,
+    'previews': True,
+    'preview_interval': 10,  # 雪碧图抽帧间隔（秒）
+    'smart_poster': True,
+    'aligned_keyframes': True,  # 所有分辨率的关键帧和分片边界对齐
+    'scene_cuts': False,  # 关键帧计划中加入场景切换（需要先完整解码一次源视频）
+    'scene_threshold': 0.4,
+    'auto_ladder': False,  # 转换前按视频内容推荐分辨率阶梯和码率
+    'ladder_crf': 23,  # 推荐码率对应的画质（x264的CRF）
+    # 默认视频码率配置
+    'video_bitrates': {
+        "3840x2160": "15000k",
+        "2560x1440": "9000k",
+        "1920x1080": "4500k",
+        "1280x720": "2500k",
+        "854x480": "1500k",
+        "640x360": "800k",
+        "原始分辨率": "4000k"
+    }
+}
+
+
+def get_default_settings():
+    """获取一份默认设置的副本"""
+    return copy.deepcopy(DEFAULT_SETTINGS)
+
+
+def merge_settings(saved_settings):
+    """把保存的设置合并到默认设置上，确保新添加的设置项也有默认值"""
+    merged = {**get_default_settings(), **saved_settings}
+    # 特殊处理video_bitrates，确保所有分辨率都有码率设置
+    if 'video_bitrates' in saved_settings:
+        merged['video_bitrates'] = {
+            **DEFAULT_SETTINGS['video_bitrates'],
+            **saved_settings['video_bitrates']
+        }
+    return merged
+
+
+def load_settings(path):
+    """从JSON文件加载设置"""
+    with open(path, 'r', encoding='utf-8') as f:
+        return merge_settings(json.load(f))
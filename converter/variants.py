@@ -0,0 +1,77 @@
+import os
+
+from converter.playlist import measure_bitrate, parse_attributes, read_media_playlist
+from converter.probe import get_codec_string, get_media_streams
+
+
+def get_frame_rate(stream):
+    """从ffprobe的流信息中读取帧率，无法获取时返回None"""
+    for key in ('avg_frame_rate', 'r_frame_rate'):
+        numerator, _, denominator = (stream.get(key) or "").partition("/")
+        try:
+            frame_rate = float(numerator) / float(denominator or 1)
+        except (ValueError, ZeroDivisionError):
+            continue
+        if frame_rate > 0:
+            return frame_rate
+    return None
+
+
+def get_probe_file(rendition_dir, playlist):
+    """用于读取编码信息的文件：fMP4为初始化分片，MPEG-TS为第一个分片"""
+    first_segment = playlist['segments'][0]
+    for tag in first_segment['tags']:
+        if tag.startswith("#EXT-X-MAP:"):
+            return os.path.join(rendition_dir, parse_attributes(tag.split(":", 1)[1])['URI'])
+    return os.path.join(rendition_dir, first_segment['uri'])
+
+
+def analyze_rendition(rendition_dir, output_name="playlist"):
+    """统计一路输出的实际码率并读取编码信息
+
+    码率按播放列表中各分片的大小和时长计算，编码信息只对一个文件调用一次ffprobe。
+    播放列表不存在或没有分片时返回None；ffprobe失败时streams为空列表。
+    """
+    playlist_path = os.path.join(rendition_dir, f"{output_name}.m3u8")
+    if not os.path.exists(playlist_path):
+        return None
+    playlist = read_media_playlist(playlist_path)
+    if not playlist['segments']:
+        return None
+
+    peak, average = measure_bitrate(rendition_dir, playlist)
+    try:
+        streams = get_media_streams(get_probe_file(rendition_dir, playlist))
+    except Exception:
+        streams = []
+    return {'peak': peak, 'average': average, 'streams': streams}
+
+
+def get_variant_attributes(video, audio=None, frame_rate=None):
+    """根据分析结果生成EXT-X-STREAM-INF的属性
+
+    使用单独的音频组时BANDWIDTH和AVERAGE-BANDWIDTH包含音频的码率，CODECS也包含音频编码；
+    有任何一个编码无法识别时不写CODECS（写错比不写更影响播放器选择）。
+    """
+    renditions = [video] + ([audio] if audio else [])
+    attributes = {
+        'BANDWIDTH': sum(rendition['peak'] for rendition in renditions),
+        'AVERAGE-BANDWIDTH': sum(rendition['average'] for rendition in renditions)
+    }
+
+    streams = [
+        stream for rendition in renditions for stream in rendition['streams']
+        if stream.get('codec_type') in ('video', 'audio')
+    ]
+    codecs = [get_codec_string(stream) for stream in streams]
+    if codecs and all(codecs):
+        attributes['CODECS'] = f'"{",".join(dict.fromkeys(codecs))}"'
+
+    video_stream = next((stream for stream in video['streams'] if stream.get('codec_type') == "video"), None)
+    if video_stream:
+        if video_stream.get('width') and video_stream.get('height'):
+            attributes['RESOLUTION'] = f"{video_stream['width']}x{video_stream['height']}"
+        frame_rate = get_frame_rate(video_stream) or frame_rate
+    if frame_rate:
+        attributes['FRAME-RATE'] = f"{frame_rate:.3f}"
+    return attributes
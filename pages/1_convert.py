@@ -1,18 +1,17 @@
 import streamlit as st
 import os
-import subprocess
-import platform
-import re
-import shutil
 import json
 from datetime import datetime
 import time
-import glob
-from http.server import HTTPServer, SimpleHTTPRequestHandler
-import threading
-import socket
-import traceback
+from components.http_server import start_http_server
 from components.navigation import show_navigation
+from converter.cache import get_cached_ladder, get_cached_video_info
+from converter.capabilities import HW_ENCODERS, detect_capabilities
+from converter.commands import SEGMENT_TYPES, build_commands, format_command, get_resolution_label
+from converter.job_queue import INTERACTIVE_PRIORITY, JobQueue, get_live_progress, start_background_workers
+from converter.pipeline import expand_inputs, get_output_dirs
+from converter.scheduler import format_eta, get_hw_family
+from converter.settings import get_default_settings, load_settings
 
 # 设置页面配置
 st.set_page_config(
@@ -29,42 +28,13 @@ os.makedirs(os.path.dirname(CONFIG_FILE), exist_ok=True)
 
 def load_config():
     """从文件加载配置"""
-    default_config = {
-        'video_encoder': 'copy',
-        'resolutions': ["1920x1080", "1280x720"],  # 默认1080p和720p
-        'audio_encoder': 'copy',
-        'audio_bitrate': '128k',
-        'segment_time': '6',
-        'encryption_enabled': False,
-        # 添加默认视频码率配置
-        'video_bitrates': {
-            "3840x2160": "15000k",
-            "2560x1440": "9000k",
-            "1920x1080": "4500k",
-            "1280x720": "2500k",
-            "854x480": "1500k",
-            "640x360": "800k",
-            "原始分辨率": "4000k"
-        }
-    }
-    
     try:
         if os.path.exists(CONFIG_FILE):
-            with open(CONFIG_FILE, 'r', encoding='utf-8') as f:
-                saved_config = json.load(f)
-                # 合并配置，确保新添加的配置项也有默认值
-                merged_config = {**default_config, **saved_config}
-                # 特殊处理video_bitrates，确保所有分辨率都有码率设置
-                if 'video_bitrates' in saved_config:
-                    merged_config['video_bitrates'] = {
-                        **default_config['video_bitrates'],
-                        **saved_config['video_bitrates']
-                    }
-                return merged_config
+            return load_settings(CONFIG_FILE)
     except Exception as e:
         st.warning(f"加载配置文件失败: {str(e)}")
-    
-    return default_config
+
+    return get_default_settings()
 
 def save_config(config):
     """保存配置到文件"""
@@ -76,106 +46,22 @@ def save_config(config):
         st.error(f"保存配置文件失败: {str(e)}")
         return False
 
-# 从main2.py复制所需的函数
-def is_port_in_use(port):
-    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
-        return s.connect_ex(('localhost', port)) == 0
-
-def start_http_server():
-    """启动支持CORS的HTTP服务器"""
-    port = 8000
-    while is_port_in_use(port):
-        port += 1
-    
-    server = HTTPServer(('localhost', port), CORSHTTPRequestHandler)
-    thread = threading.Thread(target=server.serve_forever, daemon=True)
-    thread.start()
-    return port
-
-class CORSHTTPRequestHandler(SimpleHTTPRequestHandler):
-    def end_headers(self):
-        self.send_header('Access-Control-Allow-Origin', '*')
-        self.send_header('Access-Control-Allow-Methods', 'GET, OPTIONS')
-        self.send_header('Access-Control-Allow-Headers', '*')
-        self.send_header('Cache-Control', 'no-store, no-cache, must-revalidate')
-        super().end_headers()
-        
-    def do_OPTIONS(self):
-        self.send_response(200)
-        self.end_headers()
-
 # 在全局范围启动HTTP服务器
 HTTP_SERVER_PORT = start_http_server()
 
 def get_video_info(input_file):
     """获取视频信息"""
     try:
-        cmd = [
-            'ffprobe',
-            '-v', 'quiet',
-            '-print_format', 'json',
-            '-show_format',
-            '-show_streams',
-            input_file
-        ]
-        result = subprocess.run(cmd, capture_output=True, text=True)
-        if result.returncode != 0:
-            raise Exception(f"ffprobe failed: {result.stderr}")
-        
-        info = json.loads(result.stdout)
-        return info
+        return get_cached_video_info(input_file)
     except Exception as e:
         st.error(f"获取视频信息失败: {str(e)}")
         return None
 
-def check_system_environment():
-    """检查系统环境并返回可用的编码器信息"""
-    env_info = {
-        "ffmpeg_installed": False,
-        "ffmpeg_version": None,
-        "nvidia_gpu": False,
-        "intel_qsv": False,
-        "videotoolbox": False,
-        "cpu_info": None,
-        "os_info": platform.system()
-    }
-    
-    # 检查FFmpeg是否安装
-    ffmpeg_path = shutil.which('ffmpeg')
-    if ffmpeg_path:
-        env_info["ffmpeg_installed"] = True
-        try:
-            # 获取FFmpeg版本
-            result = subprocess.run(['ffmpeg', '-version'], capture_output=True, text=True)
-            version_match = re.search(r'ffmpeg version (\S+)', result.stdout)
-            if version_match:
-                env_info["ffmpeg_version"] = version_match.group(1)
-            
-            # 检查可用的编码器
-            encoders = subprocess.run(['ffmpeg', '-encoders'], capture_output=True, text=True)
-            env_info["nvidia_gpu"] = 'h264_nvenc' in encoders.stdout
-            env_info["intel_qsv"] = 'h264_qsv' in encoders.stdout
-            env_info["videotoolbox"] = 'h264_videotoolbox' in encoders.stdout
-        except Exception as e:
-            st.error(f"检查FFmpeg信息时出错: {str(e)}")
-    
-    # 获取CPU信息
-    try:
-        if platform.system() == "Darwin":  # macOS
-            result = subprocess.run(['sysctl', '-n', 'machdep.cpu.brand_string'], capture_output=True, text=True)
-            env_info["cpu_info"] = result.stdout.strip()
-        elif platform.system() == "Linux":
-            with open('/proc/cpuinfo', 'r') as f:
-                for line in f:
-                    if 'model name' in line:
-                        env_info["cpu_info"] = line.split(':')[1].strip()
-                        break
-        elif platform.system() == "Windows":
-            result = subprocess.run(['wmic', 'cpu', 'get', 'name'], capture_output=True, text=True)
-            env_info["cpu_info"] = result.stdout.split('\n')[1].strip()
-    except Exception as e:
-        env_info["cpu_info"] = "无法获取CPU信息"
-    
+def check_system_environment(refresh=False):
+    """检查系统环境并返回可用的编码器信息（结果会被缓存，不会在每次页面刷新时重新检测）"""
+    env_info = detect_capabilities(refresh=refresh)
+    if env_info["error"]:
+        st.error(f"检查FFmpeg信息时出错: {env_info['error']}")
     return env_info
 
 def main():
@@ -192,6 +78,11 @@ def main():
         if key not in st.session_state:
             st.session_state[key] = value
     
+    # 队列中有未完成或中断的任务时自动启动后台工作线程，关闭页面或重启程序后打开页面即继续转换
+    job_queue = JobQueue()
+    if job_queue.has_pending():
+        start_background_workers(job_queue, st.session_state.get("queue_workers", 1))
+    
     # 添加配置管理按钮
     st.sidebar.header("⚙️ 配置管理")
     col1, col2 = st.sidebar.columns(2)
@@ -215,24 +106,7 @@ def main():
     with col2:
         if st.button("🔄 恢复默认配置", help="恢复到默认的1080p和720p配置"):
             # 恢复默认配置
-            default_config = {
-                'video_encoder': 'copy',
-                'resolutions': ["1920x1080", "1280x720"],
-                'audio_encoder': 'copy',
-                'audio_bitrate': '128k',
-                'segment_time': '6',
-                'encryption_enabled': False,
-                # 添加默认视频码率配置
-                'video_bitrates': {
-                    "3840x2160": "15000k",
-                    "2560x1440": "9000k",
-                    "1920x1080": "4500k",
-                    "1280x720": "2500k",
-                    "854x480": "1500k",
-                    "640x360": "800k",
-                    "原始分辨率": "4000k"
-                }
-            }
+            default_config = get_default_settings()
             # 更新session_state
             for key, value in default_config.items():
                 st.session_state[key] = value
@@ -240,11 +114,13 @@ def main():
             if save_config(default_config):
                 st.success("✅ 已恢复默认配置并保存到本地文件")
     
-    # 检查系统环境
-    env_info = check_system_environment()
-    
     # 显示系统环境信息
     st.header("🖥️ 系统环境检测")
+
+    # 检查系统环境
+    refresh_environment = st.button("🔄 重新检测", help="重新检测FFmpeg和硬件编码器（更换显卡驱动或FFmpeg后使用）")
+    env_info = check_system_environment(refresh=refresh_environment)
+
     col1, col2 = st.columns(2)
     
     with col1:
@@ -282,6 +158,12 @@ def main():
             
         for encoder_info in encoders_available:
             st.info(encoder_info)
+
+        # FFmpeg中包含但试编码失败的硬件编码器
+        for encoder, error in env_info["encoder_errors"].items():
+            st.warning(f"⚠️ FFmpeg包含 {encoder}，但试编码失败，已禁用该编码器")
+            with st.expander(f"{encoder} 错误详情"):
+                st.code(error)
     
     st.markdown("---")
     
@@ -457,6 +339,54 @@ def main():
             help="输出的M3U8播放列表文件名（不含扩展名）",
             key="output_name"
         )
+        resume = st.checkbox(
+            "断点续转",
+            value=st.session_state.resume,
+            help="""
+            输出目录中已有上次中断的转换结果时：
+            * 已完成的分辨率直接跳过
+            * 未完成的分辨率从最后一个完整的分片处继续转换
+            * 已有结果来自其他视频或其他设置时会先清空，从头开始转换
+            * 关闭后会覆盖已有的分片，从头开始转换
+            """,
+            key="resume"
+        )
+        cache = st.checkbox(
+            "复用重复内容",
+            value=st.session_state.cache,
+            help="""
+            按文件内容（而不是文件名）识别重复上传的视频：
+            * 相同内容、相同转换设置已经转换过时，直接用硬链接复用已有结果，不再编码
+            * 视频信息的检测结果也会缓存，重复文件不再调用ffprobe
+            """,
+            key="cache"
+        )
+        previews = st.checkbox(
+            "生成预览缩略图",
+            value=st.session_state.previews,
+            help="""
+            在转换的同时生成封面、雪碧图和WebVTT缩略图轨道：
+            * 与转换共用一次解码，不再单独读取源视频（GPU解码时从显存复制一路画面生成）
+            * 直接复制、分段并行编码或断点续转时，转换后单独读取一次源视频的关键帧生成
+            * 预览页面拖动进度条时显示对应画面
+            """,
+            key="previews"
+        )
+        preview_interval = st.number_input(
+            "缩略图间隔(秒)",
+            min_value=1,
+            max_value=60,
+            value=int(st.session_state.preview_interval),
+            help="每隔多少秒抽取一张缩略图",
+            key="preview_interval",
+            disabled=not previews
+        )
+        smart_poster = st.checkbox(
+            "智能选择封面",
+            value=st.session_state.smart_poster,
+            help="在视频中抽取若干关键帧，选择画面最清晰、亮度正常的一帧作为封面，避免黑屏或片头标志",
+            key="smart_poster"
+        )
 
     # 编码设置
     st.header("🎯 编码设置")
@@ -517,6 +447,10 @@ def main():
             format_func=lambda x: encoder_descriptions[x]
         )
 
+        # 选择了本机无法使用的硬件编码器时提示
+        if video_encoder in HW_ENCODERS and not env_info[HW_ENCODERS[video_encoder]]:
+            st.warning(f"⚠️ 系统环境检测中 {video_encoder} 不可用，转换很可能失败，建议选择其他编码器")
+
         # 添加编码器说明
         if video_encoder == "copy":
             st.info("""
@@ -535,7 +469,57 @@ def main():
             * 建议：优先选择硬件加速，可大幅提升转换速度
             """)
 
+        single_decode = False
+        max_parallel_jobs = st.session_state.max_parallel_jobs
+        hw_session_limit = st.session_state.hw_session_limit
+        hw_decode = st.session_state.get('hw_decode', True)
+        chunk_count = st.session_state.chunk_count
+        auto_ladder = False
+        ladder_crf = st.session_state.ladder_crf
         if video_encoder != "copy":
+            # 按内容推荐码率：试编码几个采样片段，把推荐的分辨率阶梯和码率填入下面的设置
+            ladder_crf = st.number_input(
+                "目标画质 (CRF)",
+                min_value=15,
+                max_value=35,
+                value=st.session_state.ladder_crf,
+                help="按内容推荐码率时的目标画质，与x264的CRF含义相同：数值越小画质越高、码率越高，推荐18-28",
+                key="ladder_crf"
+            )
+            if st.button("🎯 按视频内容推荐码率", help="用低分辨率试编码几个采样片段，拟合码率-画质曲线后为所选分辨率推荐码率"):
+                if not os.path.exists(input_file):
+                    st.error("❌ 输入文件不存在，请检查文件路径")
+                else:
+                    with st.spinner("正在试编码采样片段..."):
+                        try:
+                            proposal = get_cached_ladder(
+                                input_file,
+                                {'resolutions': st.session_state.resolutions, 'ladder_crf': ladder_crf},
+                                get_cached_video_info(input_file)
+                            )
+                        except Exception as e:
+                            st.error(f"❌ 推荐码率失败: {str(e)}")
+                        else:
+                            # 更新分辨率和码率选择框的状态后重新运行页面
+                            st.session_state.resolutions = proposal['resolutions']
+                            st.session_state.setdefault('video_bitrates', {}).update(proposal['video_bitrates'])
+                            for resolution in proposal['video_bitrates']:
+                                st.session_state.pop(f"video_bitrate_{resolution}", None)
+                            st.session_state.ladder_proposal = proposal
+                            st.rerun()
+            if st.session_state.get('ladder_proposal'):
+                proposal = st.session_state.ladder_proposal
+                st.success("🎯 已按视频内容推荐码率：" + "，".join(
+                    f"{get_resolution_label(r)} {proposal['video_bitrates'][r]}" for r in proposal['resolutions']
+                ))
+
+            auto_ladder = st.checkbox(
+                "转换时自动推荐码率",
+                value=st.session_state.auto_ladder,
+                help="每个视频转换前都先试编码采样片段并推荐码率（批量转换时每个视频分别推荐），会覆盖下面选择的码率",
+                key="auto_ladder"
+            )
+
             resolutions = st.multiselect(
                 "分辨率",
                 options=[
@@ -606,14 +590,17 @@ def main():
             for resolution in resolutions:
                 # 获取上次保存的码率或默认值
                 default_index = 0
+                options = list(bitrate_settings[resolution]["options"])
                 if resolution in st.session_state.video_bitrates:
                     saved_bitrate = st.session_state.video_bitrates[resolution]
-                    if saved_bitrate in bitrate_settings[resolution]["options"]:
-                        default_index = bitrate_settings[resolution]["options"].index(saved_bitrate)
+                    # 按内容推荐或配置文件中的码率不在预设选项中时加入选项
+                    if saved_bitrate not in options:
+                        options.insert(0, saved_bitrate)
+                    default_index = options.index(saved_bitrate)
 
                 video_bitrates[resolution] = st.selectbox(
                     f"视频码率 ({resolution})",
-                    options=bitrate_settings[resolution]["options"],
+                    options=options,
                     index=default_index,
                     help=bitrate_settings[resolution]["help"],
                     key=f"video_bitrate_{resolution}"
@@ -623,6 +610,68 @@ def main():
                 # 保存选择的码率到session_state
                 st.session_state.video_bitrates[resolution] = video_bitrates[resolution]
 
+            if len(resolutions) > 1:
+                single_decode = st.checkbox(
+                    "单次解码多路输出",
+                    value=st.session_state.single_decode,
+                    help="""
+                    只解码一次源视频，通过split滤镜同时缩放并编码所有分辨率：
+                    * 所有分辨率在同一个FFmpeg进程中输出
+                    * 避免多次解码源视频，显著减少CPU占用和转换时间
+                    * 源视频分辨率越高、输出分辨率越多，收益越明显
+                    """,
+                    key="single_decode"
+                )
+
+            max_parallel_jobs = st.number_input(
+                "并行任务数",
+                min_value=0,
+                max_value=64,
+                value=st.session_state.max_parallel_jobs,
+                help="""
+                同时运行的转换任务数（每个分辨率或每个分段为一个任务）：
+                * 0：自动，根据CPU核心数决定
+                * libx264会按并行任务数自动分配每个任务的线程数，避免CPU超负荷
+                * 总耗时接近最慢的一个分辨率，而不是所有分辨率耗时之和
+                """,
+                key="max_parallel_jobs"
+            )
+
+            chunk_count = st.number_input(
+                "分段并行编码",
+                min_value=0,
+                max_value=64,
+                value=st.session_state.chunk_count,
+                help="""
+                把长视频在关键帧处切成多段，同时编码后再拼接成一个连续的播放列表：
+                * 0：不分段，整个视频由一个进程编码
+                * 2及以上：切分的段数，适合电影等长视频
+                * 每段至少60秒，视频较短时会自动减少段数
+                """,
+                key="chunk_count"
+            )
+
+            if get_hw_family(video_encoder):
+                hw_session_limit = st.number_input(
+                    "硬件编码并发上限",
+                    min_value=1,
+                    max_value=32,
+                    value=st.session_state.hw_session_limit,
+                    help="同时使用硬件编码器的最大任务数。消费级显卡驱动通常限制同时编码的会话数，超出会导致任务失败。",
+                    key="hw_session_limit"
+                )
+
+                hw_decode = st.checkbox(
+                    "GPU解码和缩放",
+                    value=st.session_state.get('hw_decode', True),
+                    help="""
+                    解码、缩放和编码都在GPU上完成（NVENC使用CUDA，QSV使用vpp_qsv）：
+                    * 画面不需要在内存和显存之间来回复制，CPU不再成为瓶颈
+                    * 驱动不支持或源视频的编码格式GPU无法解码时，自动改用CPU解码重新转换
+                    """,
+                    key="hw_decode"
+                )
+
     # 音频设置
     with col2:
         st.subheader("🔊 音频设置")
@@ -688,6 +737,23 @@ def main():
             )
             st.info(f"当前音频设置：{audio_encoder.upper()} @ {audio_bitrate}/s")
 
+        # fMP4分片的音频总是单独输出
+        audio_forced = st.session_state.get('segment_type') == "fmp4"
+        separate_audio = st.checkbox(
+            "音频单独输出",
+            value=True if audio_forced else st.session_state.get('separate_audio', False),
+            disabled=audio_forced,
+            help="""
+            音频只编码一次，输出到audio目录作为单独的音频组，所有分辨率共用：
+            * 主播放列表用EXT-X-MEDIA声明音频组，每个分辨率通过AUDIO引用
+            * 5个分辨率时可以省去4次重复的AAC编码，音频占用的空间减少约80%
+            * 切换清晰度时音频不中断
+            
+            说明：需要播放器支持音频组（Safari、hls.js都支持）；CMAF / fMP4分片格式下总是单独输出
+            """,
+            key="separate_audio"
+        )
+
     # HLS设置
     st.header("📺 HLS设置")
     col1, col2 = st.columns(2)
@@ -696,7 +762,7 @@ def main():
         segment_time = st.text_input(
             "分片时长(秒)",
             value=st.session_state.segment_time,
-            help="每个TS分片的时长，建议2-10秒之间。短视频推荐2秒，中等视频推荐5秒，长视频推荐10秒。",
+            help="每个分片的时长，建议2-10秒之间。短视频推荐2秒，中等视频推荐5秒，长视频推荐10秒。",
             key="segment_time"
         )
         try:
@@ -708,6 +774,65 @@ def main():
         
         playlist_type = 'vod'
 
+        segment_type = st.selectbox(
+            "分片格式",
+            options=list(SEGMENT_TYPES.keys()),
+            help="""
+            选择分片的封装格式：
+            * MPEG-TS：兼容性最好，所有HLS播放器都支持
+            * CMAF / fMP4：每个分辨率一个init.mp4初始化分片加.m4s分片，
+              音频单独输出一次供所有分辨率共用，并额外生成DASH清单（manifest.mpd），HLS和DASH播放器共用同一套分片
+            
+            说明：fMP4需要较新的播放器（iOS 10+、hls.js、dash.js），启用加密时不生成DASH清单
+            """,
+            key="segment_type",
+            format_func=lambda x: SEGMENT_TYPES[x]
+        )
+
+        single_file = st.checkbox(
+            "单文件输出",
+            value=st.session_state.get('single_file', False),
+            disabled=st.session_state.get('encryption_enabled', False),
+            help="""
+            每个分辨率只写一个媒体文件，播放列表用EXT-X-BYTERANGE按字节范围引用其中的分片：
+            * 2小时的视频按6秒分片、4个分辨率约有4800个分片文件，单文件输出后只有4个
+            * 减少文件数量，上传、同步和部署到CDN更快，服务器打开文件的次数也更少
+            * 服务器需要支持Range请求（预览页面的服务器已支持）
+            
+            说明：整段加密需要每个分片一个文件，启用加密时不能使用；单文件输出不生成DASH清单
+            """,
+            key="single_file"
+        )
+
+        aligned_keyframes = st.checkbox(
+            "对齐关键帧",
+            value=st.session_state.get('aligned_keyframes', True),
+            disabled=video_encoder == "copy",
+            help="""
+            所有分辨率在相同的时间点放置关键帧，分片边界完全一致：
+            * 播放器切换分辨率时不会出现画面跳动或重复下载
+            * GOP长度固定为一个分片，并关闭编码器自己的场景切换关键帧
+            
+            说明：直接复制视频流时保持源视频的关键帧
+            """,
+            key="aligned_keyframes"
+        )
+
+        scene_cuts = st.checkbox(
+            "分片边界对齐场景切换",
+            value=st.session_state.get('scene_cuts', False),
+            disabled=video_encoder == "copy" or not aligned_keyframes,
+            help="""
+            转换前先检测源视频的场景切换：
+            * 分片边界之后不远处有场景切换时，把边界移到场景切换处
+            * 其余的场景切换处额外插入关键帧，切换处的画质更好
+            * 所有分辨率使用同一组时间点，分片边界仍然对齐
+            
+            说明：需要先完整解码一次源视频，转换前会多花一些时间
+            """,
+            key="scene_cuts"
+        )
+
     with col2:
         encryption_enabled = st.checkbox(
             "启用加密",
@@ -720,8 +845,9 @@ def main():
             * 支持密钥轮换机制增强安全性
             
             说明：
-            * 加密会自动生成密钥文件(enc.key)
-            * 密钥信息文件(enc.keyinfo)包含密钥获取地址
+            * 加密会自动生成随机密钥，保存在输出目录的keys目录中，每个分片以自己的序号作为IV
+            * 转换完成后统一加密分片（需要安装cryptography）
+            * 所有分辨率共用同一组密钥，播放时可以自由切换清晰度
             * 播放器需要能访问密钥文件才能播放
             * 建议将密钥文件部署在HTTPS服务器上
             """,
@@ -738,6 +864,7 @@ def main():
                 设置密钥自动轮换的周期：
                 * 0：禁用密钥轮换，使用固定密钥
                 * 1-100：每隔指定数量的分片更换一次密钥
+                * 按分片序号轮换，所有分辨率中同一序号的分片使用同一个密钥
                 
                 说明：
                 * 密钥轮换可以提高安全性
@@ -751,9 +878,9 @@ def main():
             st.info("""
             ℹ️ 加密相关说明：
             * 启用加密后会在输出目录生成以下文件：
-                - enc.key：加密密钥文件
-                - enc.keyinfo：密钥信息文件
-                - *.ts：加密后的视频分片
+                - keys/key_000.key 等：加密密钥文件（轮换时有多个）
+                - keys/pool.json：密钥池清单（密钥文件名和URI）
+                - *.ts / *.m4s：加密后的视频分片
                 - *.m3u8：包含密钥信息的播放列表
             
             * 部署注意事项：
@@ -774,6 +901,7 @@ def main():
         st.metric("视频编码器", video_encoder)
     with col2:
         st.metric("播放列表类型", playlist_type)
+        st.metric("分片格式", SEGMENT_TYPES[segment_type])
         if audio_encoder != "copy" and 'audio_bitrate' in locals():
             st.metric("音频码率", audio_bitrate)
         st.metric("音频编码器", audio_encoder)
@@ -787,66 +915,42 @@ def main():
         st.error("请至少选择一个输出分辨率")
         return
 
-    # 为每个分辨率生成一个命令
-    for resolution in (resolutions if video_encoder != "copy" else ["原始分辨率"]):
-        # 构建FFmpeg命令
-        command_parts = ["ffmpeg", "-y", "-i", f'\"{input_file}\"']
-        
-        # 视频编码参数
-        command_parts.extend(["-c:v", video_encoder])
-        if video_encoder != "copy":
-            if resolution != "原始分辨率":
-                command_parts.extend(["-s", resolution])
-            command_parts.extend(["-b:v", video_bitrates[resolution]])
-            
-            # 根据不同编码器添加特定参数
-            if video_encoder == "libx264":
-                command_parts.extend(["-preset", "fast"])
-            elif "nvenc" in video_encoder:
-                command_parts.extend([
-                    "-preset", "p4",
-                    "-rc", "cbr"
-                ])
-            elif "qsv" in video_encoder:
-                command_parts.extend(["-preset", "medium"])
-            elif "videotoolbox" in video_encoder:
-                command_parts.extend(["-allow_sw", "1"])
-        
-        # 音频编码参数
-        command_parts.extend(["-c:a", audio_encoder])
-        if audio_encoder != "copy" and 'audio_bitrate' in locals():
-            command_parts.extend(["-b:a", audio_bitrate])
-        
-        # 创建分辨率特定的输出目录
-        resolution_dir = f"{output_dir}/{resolution.replace('x', 'p')}"
-        
-        # HLS参数
-        command_parts.extend([
-            "-f", "hls",
-            "-hls_time", segment_time,
-            "-hls_playlist_type", playlist_type,
-            "-hls_segment_filename", f'"{resolution_dir}/segment_%03d.ts"'
-        ])
-        
-        # 加密参数
-        if encryption_enabled:
-            key_file = os.path.join(resolution_dir, "enc.key")
-            key_info_file = os.path.join(resolution_dir, "enc.keyinfo")
-            command_parts.extend([
-                "-hls_key_info_file", f'"{key_info_file}"',
-                "-hls_enc", "1"
-            ])
-            if key_rotation_period > 0:
-                command_parts.extend(["-hls_key_rotation_period", str(key_rotation_period)])
-        
-        # 输出文件
-        output_path = f"{resolution_dir}/{output_name}.m3u8"
-        command_parts.append(f'"{output_path}"')
-        
-        # 显示命令
-        st.subheader(f"📺 {resolution} 转换命令")
-        ffmpeg_command = " ".join(command_parts)
-        st.code(ffmpeg_command, language="bash")
+    # 收集当前的转换设置
+    settings = {
+        'video_encoder': video_encoder,
+        'resolutions': resolutions if video_encoder != "copy" else [],
+        'video_bitrates': video_bitrates if video_encoder != "copy" else {},
+        'audio_encoder': audio_encoder,
+        'audio_bitrate': audio_bitrate if audio_encoder != "copy" else None,
+        'segment_time': segment_time,
+        'playlist_type': playlist_type,
+        'segment_type': segment_type,
+        'single_file': single_file,
+        'aligned_keyframes': aligned_keyframes,
+        'scene_cuts': scene_cuts and aligned_keyframes,
+        'separate_audio': separate_audio,
+        'output_name': output_name,
+        'encryption_enabled': encryption_enabled,
+        'key_rotation': key_rotation_period if encryption_enabled else 0,
+        'single_decode': single_decode,
+        'max_parallel_jobs': max_parallel_jobs,
+        'hw_session_limit': hw_session_limit,
+        'hw_decode': hw_decode,
+        'chunk_count': chunk_count,
+        'resume': resume,
+        'cache': cache,
+        'previews': previews,
+        'preview_interval': preview_interval,
+        'smart_poster': smart_poster,
+        'auto_ladder': auto_ladder,
+        'ladder_crf': ladder_crf
+    }
+
+    # 显示每个任务的命令
+    for job in build_commands(input_file, output_dir, settings):
+        job_title = " + ".join(get_resolution_label(resolution) for resolution in job['resolutions'])
+        st.subheader(f"📺 {job_title} 转换命令")
+        st.code(format_command(job['command']), language="bash")
 
     # 使用说明
     st.info("""
@@ -862,245 +966,181 @@ def main():
     st.markdown("---")
     st.header("🚀 开始转换")
     
-    # 创建一个容器来显示转换进度
-    progress_container = st.empty()
-    output_container = st.empty()
-    
+    st.caption("转换在后台执行，修改设置、切换页面或刷新都不会中断或重复正在进行的转换")
+
+    job_queue = JobQueue()
+    active_jobs = st.session_state.setdefault('active_jobs', [])
     if st.button("开始转换", type="primary"):
         if not os.path.exists(input_file):
             st.error("❌ 输入文件不存在，请检查文件路径")
             return
-            
-        try:
-            # 创建输出目录
-            os.makedirs(output_dir, exist_ok=True)
-            
-            # 显示进度条
-            progress_bar = progress_container.progress(0)
-            status_text = output_container.empty()
-            
-            # 存储所有要执行的命令
-            commands = []
-            
-            # 为每个分辨率生成命令
-            for resolution in (resolutions if video_encoder != "copy" else ["原始分辨率"]):
-                # 构建FFmpeg命令
-                command_parts = ["ffmpeg", "-y", "-i", f'{input_file}']
-                
-                # 视频编码参数
-                command_parts.extend(["-c:v", video_encoder])
-                if video_encoder != "copy":
-                    if resolution != "原始分辨率":
-                        command_parts.extend(["-s", resolution])
-                    command_parts.extend(["-b:v", video_bitrates[resolution]])
-                    
-                    # 根据不同编码器添加特定参数
-                    if video_encoder == "libx264":
-                        command_parts.extend(["-preset", "fast"])
-                    elif "nvenc" in video_encoder:
-                        command_parts.extend([
-                            "-preset", "p4",
-                            "-rc", "cbr"
-                        ])
-                    elif "qsv" in video_encoder:
-                        command_parts.extend(["-preset", "medium"])
-                    elif "videotoolbox" in video_encoder:
-                        command_parts.extend(["-allow_sw", "1"])
-                
-                # 音频编码参数
-                command_parts.extend(["-c:a", audio_encoder])
-                if audio_encoder != "copy" and 'audio_bitrate' in locals():
-                    command_parts.extend(["-b:a", audio_bitrate])
-                
-                # 创建分辨率特定的输出目录
-                resolution_dir = f"{output_dir}/"
-                if resolution == "原始分辨率":
-                    resolution_dir += "raw"
-                else:
-                    # 映射分辨率到标准名称
-                    resolution_map = {
-                        "3840x2160": "4k",
-                        "2560x1440": "2k",
-                        "1920x1080": "1080p",
-                        "1280x720": "720p",
-                        "854x480": "480p",
-                        "640x360": "360p"
-                    }
-                    resolution_dir += resolution_map.get(resolution, "raw")
-                
-                os.makedirs(resolution_dir, exist_ok=True)
-                
-                # HLS参数
-                command_parts.extend([
-                    "-f", "hls",
-                    "-hls_time", segment_time,
-                    "-hls_playlist_type", playlist_type,
-                    "-hls_segment_filename", f'{resolution_dir}/segment_%03d.ts'
-                ])
-                
-                # 加密参数
-                if encryption_enabled:
-                    key_file = os.path.join(resolution_dir, "enc.key")
-                    key_info_file = os.path.join(resolution_dir, "enc.keyinfo")
-                    command_parts.extend([
-                        "-hls_key_info_file", key_info_file,
-                        "-hls_enc", "1"
-                    ])
-                    if key_rotation_period > 0:
-                        command_parts.extend(["-hls_key_rotation_period", str(key_rotation_period)])
-                
-                # 输出文件
-                output_path = f"{resolution_dir}/{output_name}.m3u8"
-                command_parts.append(output_path)
-                
-                commands.append(command_parts)
-            
-            # 执行所有命令
-            total_commands = len(commands)
-            for i, command_parts in enumerate(commands):
-                # 更新进度条
-                progress = (i / total_commands) * 100
-                progress_bar.progress(int(progress))
-                
-                # 显示当前正在处理的分辨率
-                resolution = resolutions[i] if video_encoder != "copy" else "原始分辨率"
-                resolution_display = resolution
-                if resolution != "原始分辨率":
-                    resolution_map = {
-                        "3840x2160": "4K (3840x2160)",
-                        "2560x1440": "2K (2560x1440)",
-                        "1920x1080": "1080P (1920x1080)",
-                        "1280x720": "720P (1280x720)",
-                        "854x480": "480P (854x480)",
-                        "640x360": "360P (640x360)"
-                    }
-                    resolution_display = resolution_map.get(resolution, resolution)
+
+        # 同一文件、同一输出目录的任务还在进行时不重复提交
+        running_job = None
+        for job_id in active_jobs:
+            job = job_queue.get(job_id)
+            if job and job['status'] in ('queued', 'running') and job['input_file'] == input_file and job['output_dir'] == output_dir:
+                running_job = job
+        if running_job:
+            st.warning(f"⚠️ 该文件正在转换中（任务 #{running_job['id']}），请等待完成")
+        else:
+            # 优先于批量队列中排队的任务
+            job_id = job_queue.enqueue(input_file, output_dir, settings, priority=INTERACTIVE_PRIORITY)
+            active_jobs.append(job_id)
+            st.success(f"✅ 已开始转换，任务编号 #{job_id}")
+        start_background_workers(job_queue, st.session_state.get("queue_workers", 1))
+
+    if active_jobs:
+        # 有未完成的任务时每秒刷新一次进度，只重新运行进度区域，不影响页面上的其他操作
+        pending = any(
+            (job_queue.get(job_id) or {}).get('status') in ('queued', 'running')
+            for job_id in active_jobs
+        )
+        st.fragment(show_active_jobs, run_every=1 if pending else None)(job_queue)
+
+    # 批量转换队列
+    show_batch_queue(input_file, output_dir, settings)
+
+def show_job_states(state):
+    """显示调度器中每个任务的进度"""
+    running = sum(1 for job_state in state['jobs'] if job_state['status'] == 'running')
+    done = sum(1 for job_state in state['jobs'] if job_state['status'] == 'done')
+    st.progress(int(state['overall'] * 100))
+    st.info(
+        f"⏳ 正在并行处理 {running} 个任务，已完成 {done}/{len(state['jobs'])}（最多同时 {state['workers']} 个）"
+        f"，总进度 {state['overall'] * 100:.1f}%，预计剩余 {format_eta(state['eta'])}"
+    )
+    for job_state in state['jobs']:
+        resolution_display = " / ".join(get_resolution_label(r) for r in job_state['resolutions'])
+        if job_state['chunk'] is not None:
+            resolution_display += f" 第{job_state['chunk'] + 1}段"
+        if job_state['status'] == 'done':
+            st.success(f"✅ {resolution_display} 转换完成（耗时 {job_state['elapsed']:.1f} 秒）")
+        elif job_state['status'] == 'running':
+            st.code(f"正在处理 {resolution_display}:\n{job_state['log'] or '等待FFmpeg输出进度...'}")
+        elif job_state['status'] == 'pending':
+            st.info(f"🕒 {resolution_display} 等待中")
+
+
+def show_active_jobs(job_queue):
+    """显示本页面提交的转换任务的状态，只按任务编号读取状态，不持有转换过程"""
+    active_jobs = st.session_state.get('active_jobs', [])
+    pending = False
+    for job_id in reversed(active_jobs):
+        job = job_queue.get(job_id)
+        if job is None:
+            continue
+        with st.container(border=True):
+            st.markdown(f"**任务 #{job_id}**：{job['input_file']} → {job['output_dir']}")
+            if job['status'] == 'queued':
+                pending = True
+                ahead = job_queue.position(job_id)
+                running = job_queue.counts().get('running', 0)
+                if ahead:
+                    st.info(f"🕒 排队中，前面还有 {ahead} 个任务，等待后台工作线程...")
+                elif running:
+                    st.info(f"🕒 排在队列最前面，等待正在转换的 {running} 个任务完成...")
                 else:
-                    resolution_display = "原始分辨率"
-                
-                status_text.info(f"⏳ 正在处理 {resolution_display} ... ({i+1}/{total_commands})")
-                
-                # 执行命令
-                process = subprocess.Popen(
-                    command_parts,
-                    stdout=subprocess.PIPE,
-                    stderr=subprocess.PIPE,
-                    universal_newlines=True,
-                    bufsize=1
-                )
-                
-                # 创建日志显示区域
-                log_area = st.empty()
-                log_text = f"正在处理 {resolution_display}:\n\n"
-                
-                # 实时显示FFmpeg输出
-                while True:
-                    output = process.stderr.readline()
-                    if output == '' and process.poll() is not None:
-                        break
-                    if output:
-                        # 只显示包含进度信息的行
-                        if "frame=" in output or "speed=" in output or "time=" in output:
-                            log_text = f"正在处理 {resolution_display}:\n{output.strip()}"
-                            log_area.code(log_text)
-                
-                # 检查命令执行结果
-                if process.returncode != 0:
-                    # 获取完整的错误输出
-                    _, stderr = process.communicate()
-                    raise Exception(f"处理 {resolution_display} 时出错：\n{stderr}")
+                    st.info("🕒 排队中，等待后台工作线程...")
+            elif job['status'] == 'running':
+                pending = True
+                live = get_live_progress(job_id)
+                if live and live['message']:
+                    st.info(live['message'])
+                if live and live['state']:
+                    show_job_states(live['state'])
                 else:
-                    log_area.success(f"✅ {resolution_display} 转换完成")
-            
-            # 完成所有转换后，生成主播放列表
-            master_playlist_path = os.path.join(output_dir, "master.m3u8")
-            with open(master_playlist_path, "w", encoding="utf-8") as f:
-                f.write("#EXTM3U\n")
-                f.write("#EXT-X-VERSION:3\n")
-                
-                # 为每个分辨率添加一个流
-                for resolution in (resolutions if video_encoder != "copy" else ["原始分辨率"]):
-                    if resolution == "原始分辨率":
-                        resolution_name = "raw"
-                        bandwidth = "2000000"  # 默认码率
-                    else:
-                        # 获取分辨率对应的目录名和推荐码率
-                        resolution_map = {
-                            "3840x2160": ("4k", "15000000"),
-                            "2560x1440": ("2k", "9000000"),
-                            "1920x1080": ("1080p", "4500000"),
-                            "1280x720": ("720p", "2500000"),
-                            "854x480": ("480p", "1000000"),
-                            "640x360": ("360p", "500000")
-                        }
-                        resolution_name, bandwidth = resolution_map.get(resolution, ("raw", "2000000"))
-                    
-                    # 添加流信息
-                    if resolution != "原始分辨率":
-                        width, height = resolution.split("x")
-                        f.write(f'#EXT-X-STREAM-INF:BANDWIDTH={bandwidth},RESOLUTION={resolution}\n')
-                    else:
-                        f.write(f'#EXT-X-STREAM-INF:BANDWIDTH={bandwidth}\n')
-                    
-                    f.write(f'{resolution_name}/{output_name}.m3u8\n')
+                    # 任务由其他进程（命令行工作进程）执行时只能读取数据库中的进度
+                    st.progress(int(job['progress'] * 100))
+            elif job['status'] == 'success':
+                result = job['result']
+                for warning in result['warnings']:
+                    st.warning(f"⚠️ {warning}")
+                if result['thumbnail'] and os.path.exists(result['thumbnail']):
+                    st.image(result['thumbnail'], caption="视频封面预览", width=280)
+                st.success(f"🎉 转换完成！（耗时 {result['elapsed']:.1f} 秒）")
+                st.info(f"📂 输出目录：{result['output_dir']}")
+                st.text("🎯 已生成以下分辨率：\n" + "\n".join(
+                    f"   ✓ {get_resolution_label(rendition['resolution'])}" for rendition in result['renditions']
+                ))
+                if result.get('dash_manifest'):
+                    st.info(f"📄 DASH清单：{result['dash_manifest']}")
+            elif job['status'] == 'failed':
+                st.error(f"❌ 转换过程中出错: {job['error']}")
+            else:
+                st.warning("⛔ 任务已取消")
 
-            # 完成所有转换
-            progress_bar.progress(100)
-            
-            # 显示最终结果
-            st.success("🎉 转换完成！")
-            
-            # 在转换成功后生成视频封面
-            with st.spinner("⏳ 正在生成视频封面..."):
-                thumbnail_path = os.path.join(output_dir, "thumbnail.jpg")
-                try:
-                    # 使用ffmpeg提取第一帧
-                    thumbnail_cmd = [
-                        'ffmpeg',
-                        '-i', input_file,
-                        '-vf', 'select=eq(n\\,0),scale=280:158:force_original_aspect_ratio=decrease,pad=280:158:(ow-iw)/2:(oh-ih)/2',
-                        '-vframes', '1',
-                        '-q:v', '2',  # 高质量
-                        thumbnail_path
-                    ]
-                    result = subprocess.run(thumbnail_cmd, capture_output=True, text=True)
-                    
-                    if result.returncode == 0:
-                        if os.path.exists(thumbnail_path):
-                            st.success("✅ 已生成视频封面")
-                            # 显示生成的封面
-                            st.image(thumbnail_path, caption="视频封面预览", width=280)
-                        else:
-                            st.warning("⚠️ 封面文件未生成")
-                    else:
-                        st.warning(f"⚠️ 生成视频封面失败: {result.stderr}")
-                except Exception as e:
-                    st.warning(f"⚠️ 生成视频封面失败: {str(e)}")
-                    st.error(f"错误详情: {traceback.format_exc()}")
-            
-            # 显示最终结果
-            st.success("🎉 转换完成！")
-            st.info(f"📂 输出目录：{output_dir}")
-            st.info("🎯 已生成以下分辨率：")
-            for resolution in (resolutions if video_encoder != "copy" else ["原始分辨率"]):
-                if resolution == "原始分辨率":
-                    st.text("   ✓ 原始分辨率")
-                else:
-                    resolution_map = {
-                        "3840x2160": "4K (3840x2160)",
-                        "2560x1440": "2K (2560x1440)",
-                        "1920x1080": "1080P (1920x1080)",
-                        "1280x720": "720P (1280x720)",
-                        "854x480": "480P (854x480)",
-                        "640x360": "360P (640x360)"
-                    }
-                    st.text(f"   ✓ {resolution_map.get(resolution, resolution)}")
-            
-        except Exception as e:
-            st.error(f"❌ 转换过程中出错: {str(e)}")
-            if 'process' in locals():
-                output, error = process.communicate()
-                st.error(f"错误详情: {error}")
+    if not pending:
+        if st.button("🧹 清除已结束的任务"):
+            st.session_state['active_jobs'] = []
+            st.rerun()
+        # 所有任务都结束后重新运行整个页面，停止定时刷新
+        if st.session_state.get('active_jobs_pending'):
+            st.session_state['active_jobs_pending'] = False
+            st.rerun(scope="app")
+    else:
+        st.session_state['active_jobs_pending'] = True
+
+
+def show_batch_queue(input_file, output_dir, settings):
+    """显示批量转换队列：加入队列、启动后台转换、查看任务状态"""
+    st.markdown("---")
+    st.header("📋 批量转换队列")
+    st.info("""
+    ℹ️ 批量转换说明：
+    * 输入文件路径支持通配符，如 input/*.mp4，每个文件输出到 output/<文件名> 目录
+    * 队列保存在本地数据库中，关闭页面不会中断转换；重启程序后打开本页面，未完成的任务会自动继续转换
+    * 也可以在命令行中运行 python -m converter worker 处理队列
+    """)
+
+    job_queue = JobQueue()
+    col1, col2 = st.columns(2)
+    with col1:
+        if st.button("📥 加入批量队列", help="把输入文件（支持通配符）加入队列，由后台工作线程依次转换"):
+            input_files = [path for path in expand_inputs([input_file]) if os.path.exists(path)]
+            if not input_files:
+                st.error("❌ 没有找到要转换的文件，请检查文件路径")
+            elif len(input_files) == 1 and input_files[0] == input_file:
+                job_id = job_queue.enqueue(input_file, output_dir, settings)
+                st.success(f"✅ 已加入队列，任务编号 #{job_id}")
+            else:
+                for path, path_output_dir in zip(input_files, get_output_dirs(input_files, "output")):
+                    job_queue.enqueue(path, path_output_dir, settings)
+                st.success(f"✅ 已将 {len(input_files)} 个文件加入队列")
+    with col2:
+        worker_count = st.number_input("后台工作线程数", min_value=1, max_value=16, value=1, key="queue_workers")
+        if st.button("▶️ 启动后台转换", help="在当前程序中启动后台工作线程处理队列，关闭浏览器页面不会中断转换"):
+            running = start_background_workers(job_queue, worker_count)
+            st.success(f"✅ 后台转换已启动（{running} 个工作线程）")
+
+    counts = job_queue.counts()
+    st.write(
+        f"排队中 {counts.get('queued', 0)} ｜ 转换中 {counts.get('running', 0)} ｜ "
+        f"成功 {counts.get('success', 0)} ｜ 失败 {counts.get('failed', 0)}"
+    )
+    jobs = job_queue.list(limit=50)
+    if jobs:
+        status_names = {
+            'queued': "🕒 排队中",
+            'running': "⏳ 转换中",
+            'success': "✅ 成功",
+            'failed': "❌ 失败",
+            'cancelled': "⛔ 已取消"
+        }
+        st.dataframe([
+            {
+                "编号": job['id'],
+                "输入文件": job['input_file'],
+                "输出目录": job['output_dir'],
+                "状态": status_names.get(job['status'], job['status']),
+                "进度": f"{job['progress'] * 100:.0f}%",
+                "分辨率": " ".join(f"{name}:{status_names.get(status, status)[:1]}" for name, status in job['renditions'].items()),
+                "错误": (job['error'] or "")[:200]
+            }
+            for job in jobs
+        ], use_container_width=True, hide_index=True)
+        if st.button("🔄 刷新队列状态"):
+            st.rerun()
 
 if __name__ == "__main__":
     main() 
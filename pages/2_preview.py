@@ -1,10 +1,14 @@
 import streamlit as st
 import os
-from datetime import datetime
-from http.server import HTTPServer, SimpleHTTPRequestHandler
-import threading
-import socket
+import math
+from datetime import datetime, timedelta
+from urllib.parse import quote
+from components.http_server import start_http_server
 from components.navigation import show_navigation
+from converter.catalog import Catalog
+from converter.commands import RESOLUTION_DIRS, get_resolution_label
+from converter.dash import get_dash_manifest_path
+from converter.previews import THUMBNAILS_VTT_NAME
 
 # 设置页面配置
 st.set_page_config(
@@ -13,33 +17,6 @@ st.set_page_config(
     layout="wide"
 )
 
-def is_port_in_use(port):
-    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
-        return s.connect_ex(('localhost', port)) == 0
-
-def start_http_server():
-    """启动支持CORS的HTTP服务器"""
-    port = 8000
-    while is_port_in_use(port):
-        port += 1
-    
-    server = HTTPServer(('localhost', port), CORSHTTPRequestHandler)
-    thread = threading.Thread(target=server.serve_forever, daemon=True)
-    thread.start()
-    return port
-
-class CORSHTTPRequestHandler(SimpleHTTPRequestHandler):
-    def end_headers(self):
-        self.send_header('Access-Control-Allow-Origin', '*')
-        self.send_header('Access-Control-Allow-Methods', 'GET, OPTIONS')
-        self.send_header('Access-Control-Allow-Headers', '*')
-        self.send_header('Cache-Control', 'no-store, no-cache, must-revalidate')
-        super().end_headers()
-        
-    def do_OPTIONS(self):
-        self.send_response(200)
-        self.end_headers()
-
 # 在全局范围启动HTTP服务器
 HTTP_SERVER_PORT = start_http_server()
 
@@ -49,12 +26,10 @@ def main():
     
     st.title("📺 视频预览")
     
-    # 扫描output目录
-    output_dirs = []
-    if os.path.exists("output"):
-        output_dirs = [d for d in os.listdir("output") if os.path.isdir(os.path.join("output", d))]
-    
-    if not output_dirs:
+    # 从视频索引读取列表，output目录有新增或删除时才增量更新索引
+    catalog = Catalog()
+    catalog.refresh("output")
+    if catalog.count("output") == 0:
         st.warning("⚠️ 还没有任何转换好的视频")
         return
     
@@ -66,13 +41,15 @@ def main():
         show_player(video_path)
     else:
         # 显示视频列表
-        show_video_list(output_dirs)
+        show_library(catalog)
 
 def show_player(video_dir):
     """显示视频播放器"""
     # 获取视频信息
     master_playlist = os.path.join(video_dir, "master.m3u8")
     thumbnail_path = os.path.join(video_dir, "thumbnail.jpg")
+    thumbnails_vtt = os.path.join(video_dir, THUMBNAILS_VTT_NAME)
+    thumbnails_vtt_url = f"http://localhost:{HTTP_SERVER_PORT}/{thumbnails_vtt}" if os.path.exists(thumbnails_vtt) else ""
     if st.button("⬅️ 返回列表"):
         st.query_params.clear()
         st.rerun()
@@ -99,8 +76,9 @@ def show_player(video_dir):
     resolution_order = {"4k": 0, "2k": 1, "1080p": 2, "720p": 3, "480p": 4, "360p": 5, "raw": 6}
     available_resolutions.sort(key=lambda x: resolution_order.get(x[0], 999))
     
-    # 创建清晰度选择的按钮组
+    # 创建清晰度选择的按钮组，第一个按钮为自动切换
     st.write("### 📊 选择清晰度")
+    available_resolutions.insert(0, (None, "自动"))
     resolution_cols = st.columns(len(available_resolutions))
     
     # 初始化当前清晰度
@@ -110,21 +88,20 @@ def show_player(video_dir):
     for i, (res_key, display_name) in enumerate(available_resolutions):
         with resolution_cols[i]:
             button_style = "primary" if st.session_state.current_resolution == res_key else "secondary"
-            if st.button(display_name, key=f"res_{res_key}", type=button_style):
+            if st.button(display_name, key=f"res_{res_key or 'auto'}", type=button_style):
                 st.session_state.current_resolution = res_key
                 st.rerun()
     
     # 显示播放器
     if os.path.exists(master_playlist):
-                # 添加返回按钮
+        # 始终加载主播放列表，选择清晰度时切换到对应的码率层级；
+        # fMP4输出的音频在单独的音频组中，单独加载某个分辨率的播放列表会没有声音
+        current_resolution = st.session_state.get('current_resolution') or ""
+        playlist_path = master_playlist
 
-
-        # 确定要播放的播放列表
-        current_resolution = st.session_state.get('current_resolution')
-        if current_resolution:
-            playlist_path = os.path.join(video_dir, current_resolution, "playlist.m3u8")
-        else:
-            playlist_path = master_playlist
+        dash_manifest = get_dash_manifest_path(video_dir)
+        if os.path.exists(dash_manifest):
+            st.caption(f"📄 DASH清单：http://localhost:{HTTP_SERVER_PORT}/{quote(dash_manifest.replace(os.sep, '/'))}")
 
         # 生成视频播放器的HTML代码
         player_html = f"""
@@ -136,9 +113,14 @@ def show_player(video_dir):
                 poster="http://localhost:{HTTP_SERVER_PORT}/{thumbnail_path if os.path.exists(thumbnail_path) else ''}"
             >
                 <source src="http://localhost:{HTTP_SERVER_PORT}/{playlist_path}" type="application/x-mpegURL">
+                {f'<track kind="metadata" label="thumbnails" src="{thumbnails_vtt_url}">' if thumbnails_vtt_url else ''}
                 您的浏览器不支持HTML5视频播放
             </video>
         </div>
+        <div id="scrub-bar" style="display: {'block' if thumbnails_vtt_url else 'none'};">
+            <div id="scrub-played"></div>
+            <div id="scrub-preview"><div id="scrub-image"></div><div id="scrub-time"></div></div>
+        </div>
         <script src="https://cdn.jsdelivr.net/npm/hls.js@latest"></script>
         <script>
             function initPlayer() {{
@@ -157,7 +139,19 @@ def show_player(video_dir):
                     
                     hls.loadSource(videoSrc);
                     hls.attachMedia(video);
-                    hls.on(Hls.Events.MANIFEST_PARSED, function() {{
+                    hls.on(Hls.Events.MANIFEST_PARSED, function(event, data) {{
+                        // 按分辨率目录名找到对应的码率层级，没有选择时自动切换
+                        const selected = '{current_resolution}';
+                        if (selected) {{
+                            const level = data.levels.findIndex(function(level) {{
+                                const url = Array.isArray(level.url) ? level.url[0] : level.url;
+                                return url.indexOf('/' + selected + '/') >= 0;
+                            }});
+                            if (level >= 0) {{
+                                hls.startLevel = level;
+                                hls.currentLevel = level;
+                            }}
+                        }}
                         video.play().catch(function(error) {{
                             console.log("播放器自动播放失败:", error);
                         }});
@@ -187,11 +181,74 @@ def show_player(video_dir):
                 }}
             }}
 
+            // 拖动预览：读取WebVTT缩略图轨道，鼠标在进度条上移动时显示雪碧图中对应的画面
+            function parseVttTime(text) {{
+                const parts = text.trim().split(':').map(parseFloat);
+                return parts.reduce(function(total, part) {{ return total * 60 + part; }}, 0);
+            }}
+
+            function initScrubPreview() {{
+                const thumbnailsUrl = '{thumbnails_vtt_url}';
+                const video = document.getElementById('player');
+                const bar = document.getElementById('scrub-bar');
+                if (!thumbnailsUrl || !video || !bar) return;
+
+                const baseUrl = thumbnailsUrl.substring(0, thumbnailsUrl.lastIndexOf('/') + 1);
+                const preview = document.getElementById('scrub-preview');
+                const image = document.getElementById('scrub-image');
+                const timeLabel = document.getElementById('scrub-time');
+                const played = document.getElementById('scrub-played');
+                let cues = [];
+
+                fetch(thumbnailsUrl).then(function(response) {{ return response.text(); }}).then(function(text) {{
+                    text.split(/\\n\\s*\\n/).forEach(function(block) {{
+                        const lines = block.trim().split('\\n');
+                        if (lines.length < 2 || lines[0].indexOf('-->') < 0) return;
+                        const times = lines[0].split('-->');
+                        const target = lines[1].split('#xywh=');
+                        const box = target[1].split(',').map(Number);
+                        cues.push({{start: parseVttTime(times[0]), end: parseVttTime(times[1]), url: baseUrl + target[0], box: box}});
+                    }});
+                }});
+
+                function timeAt(event) {{
+                    const rect = bar.getBoundingClientRect();
+                    const ratio = Math.min(Math.max((event.clientX - rect.left) / rect.width, 0), 1);
+                    return {{ratio: ratio, time: ratio * (video.duration || (cues.length ? cues[cues.length - 1].end : 0))}};
+                }}
+
+                bar.addEventListener('mousemove', function(event) {{
+                    const position = timeAt(event);
+                    const cue = cues.find(function(c) {{ return position.time >= c.start && position.time < c.end; }}) || cues[cues.length - 1];
+                    if (!cue) return;
+                    image.style.width = cue.box[2] + 'px';
+                    image.style.height = cue.box[3] + 'px';
+                    image.style.background = 'url(' + cue.url + ') -' + cue.box[0] + 'px -' + cue.box[1] + 'px';
+                    const minutes = Math.floor(position.time / 60);
+                    const seconds = Math.floor(position.time % 60);
+                    timeLabel.textContent = minutes + ':' + String(seconds).padStart(2, '0');
+                    const left = Math.min(Math.max(event.clientX - bar.getBoundingClientRect().left - cue.box[2] / 2, 0), bar.clientWidth - cue.box[2]);
+                    preview.style.left = left + 'px';
+                    preview.style.display = 'block';
+                }});
+                bar.addEventListener('mouseleave', function() {{
+                    preview.style.display = 'none';
+                }});
+                bar.addEventListener('click', function(event) {{
+                    if (video.duration) video.currentTime = timeAt(event).time;
+                }});
+                video.addEventListener('timeupdate', function() {{
+                    if (video.duration) played.style.width = (video.currentTime / video.duration * 100) + '%';
+                }});
+            }}
+
             // 确保DOM加载完成后初始化播放器
             if (document.readyState === 'loading') {{
                 document.addEventListener('DOMContentLoaded', initPlayer);
+                document.addEventListener('DOMContentLoaded', initScrubPreview);
             }} else {{
                 initPlayer();
+                initScrubPreview();
             }}
         </script>
         <style>
@@ -215,6 +272,35 @@ def show_player(video_dir):
             #player:focus {{
                 outline: none;
             }}
+            #scrub-bar {{
+                position: relative;
+                height: 10px;
+                margin-top: 12px;
+                background: rgba(128, 128, 128, 0.3);
+                border-radius: 5px;
+                cursor: pointer;
+            }}
+            #scrub-played {{
+                height: 100%;
+                width: 0;
+                background: #ff4b4b;
+                border-radius: 5px;
+            }}
+            #scrub-preview {{
+                display: none;
+                position: absolute;
+                bottom: 16px;
+                pointer-events: none;
+                background: #000;
+                border: 2px solid #fff;
+                border-radius: 4px;
+            }}
+            #scrub-time {{
+                color: #fff;
+                font-size: 12px;
+                text-align: center;
+                padding: 2px 0;
+            }}
             #player:hover {{
                 box-shadow: 0 6px 8px rgba(0, 0, 0, 0.15);
             }}
@@ -223,64 +309,107 @@ def show_player(video_dir):
         st.components.v1.html(player_html, height=800)
         
 
-def show_video_list(output_dirs):
-    """显示视频列表"""
-    # 获取目录及其创建时间
-    dir_times = []
-    for dir_name in output_dirs:
-        video_dir = os.path.join("output", dir_name)
-        try:
-            dir_time = datetime.fromtimestamp(os.path.getctime(video_dir))
-            dir_times.append((dir_name, dir_time))
-        except:
-            dir_times.append((dir_name, datetime.fromtimestamp(0)))  # 如果获取时间失败，设为最早时间
-    
-    # 按创建时间倒序排序
-    dir_times.sort(key=lambda x: x[1], reverse=True)
-    sorted_dirs = [d[0] for d in dir_times]
-    
+def format_size(size):
+    """把字节数格式化为便于阅读的大小"""
+    for unit in ("B", "KB", "MB", "GB"):
+        if size < 1024:
+            return f"{size:.1f} {unit}" if unit != "B" else f"{size} {unit}"
+        size /= 1024
+    return f"{size:.1f} TB"
+
+
+def reset_library_page():
+    """筛选条件或排序变化后回到第一页"""
+    st.session_state.library_page = 1
+
+
+def show_library(catalog):
+    """显示视频库：筛选、排序和分页都在索引中完成，只读取当前页的视频"""
+    sort_options = {
+        "newest": "最新转换",
+        "oldest": "最早转换",
+        "title": "名称",
+        "duration": "时长（长到短）",
+        "size": "大小（大到小）"
+    }
+    resolution_options = {"": "全部清晰度"}
+    resolution_options.update({name: get_resolution_label(resolution) for resolution, name in RESOLUTION_DIRS.items()})
+
+    col1, col2, col3, col4, col5 = st.columns([3, 2, 2, 2, 1])
+    with col1:
+        search = st.text_input("🔍 搜索名称", key="library_search", on_change=reset_library_page)
+    with col2:
+        resolution = st.selectbox(
+            "清晰度", list(resolution_options), format_func=resolution_options.get,
+            key="library_resolution", on_change=reset_library_page
+        )
+    with col3:
+        date_range = st.date_input("转换日期", value=(), key="library_dates", on_change=reset_library_page)
+    with col4:
+        sort = st.selectbox("排序", list(sort_options), format_func=sort_options.get, key="library_sort", on_change=reset_library_page)
+    with col5:
+        page_size = st.selectbox("每页", [12, 24, 48], key="library_page_size", on_change=reset_library_page)
+
+    filters = {'search': search.strip() or None, 'resolution': resolution or None}
+    if len(date_range) >= 1:
+        filters['date_from'] = datetime.combine(date_range[0], datetime.min.time()).timestamp()
+        end_date = date_range[1] if len(date_range) == 2 else date_range[0]
+        filters['date_to'] = datetime.combine(end_date + timedelta(days=1), datetime.min.time()).timestamp()
+
+    total = catalog.count("output", **filters)
+    if total == 0:
+        st.info("没有符合条件的视频")
+        return
+    page_count = math.ceil(total / page_size)
+    page = min(max(st.session_state.get('library_page', 1), 1), page_count)
+    st.session_state.library_page = page
+
+    videos = catalog.list("output", limit=page_size, offset=(page - 1) * page_size, sort=sort, **filters)
+    st.caption(f"共 {total} 个视频，第 {page}/{page_count} 页")
+    show_video_list(videos)
+
+    # 翻页
+    col1, col2, col3 = st.columns([1, 2, 1])
+    with col1:
+        if st.button("⬅️ 上一页", disabled=page <= 1, use_container_width=True):
+            st.session_state.library_page = page - 1
+            st.rerun()
+    with col2:
+        st.markdown(f"<div style='text-align: center;'>第 {page} / {page_count} 页</div>", unsafe_allow_html=True)
+    with col3:
+        if st.button("下一页 ➡️", disabled=page >= page_count, use_container_width=True):
+            st.session_state.library_page = page + 1
+            st.rerun()
+
+
+def show_video_list(videos):
+    """显示视频列表，所有信息都来自视频索引，不访问各个输出目录"""
     # 创建多列布局
     cols = st.columns(3)
     col_index = 0
     
-    for dir_name in sorted_dirs:
-        video_dir = os.path.join("output", dir_name)
-        thumbnail_path = os.path.join(video_dir, "thumbnail.jpg")
-        master_playlist = os.path.join(video_dir, "master.m3u8")
-        
-        # 获取文件夹创建时间
-        try:
-            dir_time = datetime.fromtimestamp(os.path.getctime(video_dir))
-            formatted_time = dir_time.strftime("%Y-%m-%d %H:%M:%S")
-        except:
-            formatted_time = "未知时间"
-            
-        # 获取可用的清晰度
-        available_resolutions = []
-        resolution_map = {
-            "4k": "4K",
-            "2k": "2K",
-            "1080p": "1080P",
-            "720p": "720P",
-            "480p": "480P",
-            "360p": "360P",
-            "raw": "原始分辨率"
-        }
-        
-        for subdir in os.listdir(video_dir):
-            if os.path.isdir(os.path.join(video_dir, subdir)) and subdir in resolution_map:
-                available_resolutions.append(resolution_map[subdir])
+    for video in videos:
+        video_dir = os.path.relpath(video['output_dir'])
+        thumbnail_path = os.path.join(video_dir, video['thumbnail']) if video.get('thumbnail') else None
+        formatted_time = datetime.fromtimestamp(video['created_at']).strftime("%Y-%m-%d %H:%M:%S")
         
-        resolutions_text = " / ".join(sorted(available_resolutions)) if available_resolutions else "未知清晰度"
+        # 可用的清晰度
+        available_resolutions = [get_resolution_label(rendition['resolution']) for rendition in video['renditions']]
+        resolutions_text = " / ".join(available_resolutions) if available_resolutions else "未知清晰度"
         
         with cols[col_index]:
             # 创建一个带边框的容器
             with st.container():
                 st.markdown('<div class="video-item">', unsafe_allow_html=True)
                 
-                # 显示缩略图
-                if os.path.exists(thumbnail_path):
-                    st.image(thumbnail_path, width=280)
+                # 显示缩略图：由浏览器通过HTTP服务器懒加载并缓存，页面本身不读取图片文件
+                if thumbnail_path:
+                    thumbnail_url = f"http://localhost:{HTTP_SERVER_PORT}/{quote(thumbnail_path.replace(os.sep, '/'))}"
+                    st.markdown(
+                        f'<img src="{thumbnail_url}" loading="lazy" width="280" height="158" '
+                        f'style="object-fit: contain; border-radius: 5px; margin-bottom: 10px;">',
+                        unsafe_allow_html=True
+                    )
                 else:
                     st.markdown("""
                         <div style="
@@ -303,14 +432,17 @@ def show_video_list(output_dirs):
                     """, unsafe_allow_html=True)
                 
                 # 显示视频信息
-                st.markdown(f"**📂 {dir_name}**")
+                st.markdown(f"**📂 {video['title']}**")
                 st.markdown(f"⏰ {formatted_time}")
                 st.markdown(f"🎯 {resolutions_text}")
+                details = [format_size(video.get('size', 0))]
+                if video.get('duration'):
+                    details.insert(0, f"{int(video['duration'] // 60)}:{int(video['duration'] % 60):02d}")
+                st.markdown(f"💾 {' ｜ '.join(details)}")
                 
                 # 添加预览按钮
-                if st.button(f"▶️ 预览播放", key=f"play_{dir_name}"):
-                    video_path = os.path.join("output", dir_name)
-                    st.query_params["video"] = video_path
+                if st.button(f"▶️ 预览播放", key=f"play_{video_dir}"):
+                    st.query_params["video"] = video_dir
                     st.rerun()
                 
                 st.markdown('</div>', unsafe_allow_html=True)
@@ -0,0 +1,34 @@
+import stat
+import sys
+
+import pytest
+
+# 模拟FFmpeg：按输出文件名决定行为，否则带硬件解码参数时初始化失败
+FAKE_FFMPEG = '''
+import os
+import sys
+import time
+
+args = sys.argv[1:]
+output = os.path.basename(args[-1])
+if "fail" in output:
+    time.sleep(0.5)
+    sys.stderr.write("Conversion failed!\\n")
+    sys.exit(1)
+if "-hwaccel" in args:
+    sys.stderr.write("Device creation failed: -542398533.\\n")
+    sys.exit(1)
+if "slow" in output:
+    time.sleep(20)
+print("frame=25\\nfps=50.0\\nout_time_us=1000000\\nspeed=2.0x\\nprogress=continue", flush=True)
+print("out_time_us=2000000\\nprogress=end", flush=True)
+'''
+
+
+@pytest.fixture
+def fake_ffmpeg(tmp_path):
+    """返回一个可以代替ffmpeg作为command[0]的可执行脚本"""
+    path = tmp_path / "ffmpeg"
+    path.write_text(f"#!{sys.executable}\n{FAKE_FFMPEG}", encoding='utf-8')
+    path.chmod(path.stat().st_mode | stat.S_IEXEC)
+    return str(path)
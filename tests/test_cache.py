@@ -0,0 +1,51 @@
+from converter import cache
+from converter.cache import get_cached_ladder, get_conversion_key
+from converter.settings import get_default_settings
+
+
+def _settings(**overrides):
+    settings = get_default_settings()
+    settings.update({'video_encoder': "h264_nvenc", 'resolutions': ["1280x720", "640x360"], **overrides})
+    return settings
+
+
+def test_conversion_key_changes_with_decode_and_keyframe_settings():
+    base = get_conversion_key("source", _settings())
+    assert get_conversion_key("source", _settings(hw_decode=False)) != base
+    assert get_conversion_key("source", _settings(single_decode=True)) != base
+    assert get_conversion_key("source", _settings(aligned_keyframes=False)) != base
+
+
+def test_conversion_key_ignores_hw_decode_for_software_encoders():
+    settings = _settings(video_encoder="libx264")
+    assert get_conversion_key("source", settings) == get_conversion_key("source", {**settings, 'hw_decode': False})
+
+
+def test_conversion_key_ignores_speed_only_settings():
+    base = get_conversion_key("source", _settings())
+    assert get_conversion_key("source", _settings(max_parallel_jobs=8, chunk_count=4, resume=False)) == base
+
+
+def test_ladder_proposal_is_probed_once_per_content_and_settings(tmp_path, monkeypatch):
+    source = tmp_path / "input.mp4"
+    source.write_bytes(b"video" * 1000)
+    calls = []
+
+    def fake_propose(input_file, settings, video_info=None):
+        calls.append(settings.get('ladder_crf'))
+        return {
+            'resolutions': ["1280x720"],
+            'video_bitrates': {"1280x720": "1800k"},
+            'points': {20: 900000.0, 26: 500000.0, 32: 300000.0},
+            'target_crf': settings.get('ladder_crf')
+        }
+
+    monkeypatch.setattr(cache, "propose_ladder", fake_propose)
+    settings = {'resolutions': ["1280x720", "640x360"], 'ladder_crf': 23}
+    first = get_cached_ladder(str(source), settings, cache_dir=str(tmp_path / "cache"))
+    second = get_cached_ladder(str(source), settings, cache_dir=str(tmp_path / "cache"))
+    assert calls == [23]
+    assert second == first
+
+    get_cached_ladder(str(source), {**settings, 'ladder_crf': 28}, cache_dir=str(tmp_path / "cache"))
+    assert calls == [23, 28]
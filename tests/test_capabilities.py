@@ -0,0 +1,60 @@
+import json
+import os
+
+from converter import capabilities
+from converter.capabilities import detect_capabilities
+
+
+def _setup(tmp_path, monkeypatch, error=None):
+    ffmpeg = tmp_path / "ffmpeg"
+    ffmpeg.write_text("")
+    calls = []
+
+    def fake_detect(ffmpeg_path):
+        calls.append(ffmpeg_path)
+        return {'ffmpeg_installed': True, 'ffmpeg_path': ffmpeg_path, 'nvidia_gpu': len(calls) > 1, 'error': error}
+
+    monkeypatch.setattr(capabilities.shutil, "which", lambda name: str(ffmpeg))
+    monkeypatch.setattr(capabilities, "_detect", fake_detect)
+    monkeypatch.setattr(capabilities, "_capabilities", {})
+    return ffmpeg, calls, str(tmp_path / "config" / "capabilities.json")
+
+
+def test_detection_is_cached_in_process_and_on_disk(tmp_path, monkeypatch):
+    ffmpeg, calls, cache_file = _setup(tmp_path, monkeypatch)
+
+    first = detect_capabilities(cache_file=cache_file)
+    assert detect_capabilities(cache_file=cache_file) is first
+    assert len(calls) == 1
+
+    # 进程重启后从磁盘读取
+    monkeypatch.setattr(capabilities, "_capabilities", {})
+    assert detect_capabilities(cache_file=cache_file) == first
+    assert len(calls) == 1
+    with open(cache_file, encoding='utf-8') as f:
+        assert list(json.load(f)) == [f"{ffmpeg}|{os.path.getmtime(ffmpeg)}"]
+
+
+def test_ffmpeg_change_or_refresh_detects_again(tmp_path, monkeypatch):
+    ffmpeg, calls, cache_file = _setup(tmp_path, monkeypatch)
+    detect_capabilities(cache_file=cache_file)
+
+    # FFmpeg升级后修改时间变化，缓存键随之变化
+    mtime = os.path.getmtime(ffmpeg) + 10
+    os.utime(ffmpeg, (mtime, mtime))
+    assert detect_capabilities(cache_file=cache_file)['nvidia_gpu']
+    assert len(calls) == 2
+
+    detect_capabilities(refresh=True, cache_file=cache_file)
+    assert len(calls) == 3
+
+
+def test_failed_detection_is_not_written_to_disk(tmp_path, monkeypatch):
+    _, calls, cache_file = _setup(tmp_path, monkeypatch, error="ffmpeg crashed")
+
+    detect_capabilities(cache_file=cache_file)
+
+    assert not os.path.exists(cache_file)
+    monkeypatch.setattr(capabilities, "_capabilities", {})
+    detect_capabilities(cache_file=cache_file)
+    assert len(calls) == 2
@@ -0,0 +1,83 @@
+import os
+
+from converter.catalog import Catalog, build_manifest
+
+
+def _make_title(root, title, created_at, resolutions=("1920x1080",), duration=None):
+    output_dir = root / title
+    for resolution in resolutions:
+        rendition_dir = output_dir / {"1920x1080": "1080p", "1280x720": "720p"}[resolution]
+        rendition_dir.mkdir(parents=True)
+        (rendition_dir / "segment_000.ts").write_bytes(b"x" * 10)
+    return build_manifest(str(output_dir), resolutions, duration=duration, created_at=created_at)
+
+
+def _catalog(tmp_path):
+    root = tmp_path / "output"
+    catalog = Catalog(str(tmp_path / "catalog.db"))
+    manifests = [
+        _make_title(root, "Alpha", 100, duration=30),
+        _make_title(root, "beta_cut", 200, resolutions=("1920x1080", "1280x720"), duration=10),
+        _make_title(root, "Gamma", 300, resolutions=("1280x720",), duration=20),
+        _make_title(root, "beta%", 400, duration=5),
+    ]
+    for manifest in manifests:
+        catalog.add(manifest)
+    return catalog, str(root)
+
+
+def test_build_manifest_lists_existing_renditions(tmp_path):
+    manifest = _make_title(tmp_path, "movie", 123, resolutions=("1920x1080", "1280x720"))
+    # 不存在的分辨率目录不会写入清单
+    manifest_missing = build_manifest(manifest['output_dir'], ["1920x1080", "640x360"])
+
+    assert manifest['title'] == "movie"
+    assert manifest['created_at'] == 123
+    assert [r['name'] for r in manifest['renditions']] == ["1080p", "720p"]
+    assert manifest['size'] == 20
+    assert manifest['thumbnail'] is None
+    assert [r['name'] for r in manifest_missing['renditions']] == ["1080p"]
+
+
+def test_list_paginates_in_sort_order(tmp_path):
+    catalog, root = _catalog(tmp_path)
+
+    assert catalog.count(root) == 4
+    first = catalog.list(root, limit=2)
+    second = catalog.list(root, limit=2, offset=2)
+    assert [m['title'] for m in first] == ["beta%", "Gamma"]
+    assert [m['title'] for m in second] == ["beta_cut", "Alpha"]
+
+    assert [m['title'] for m in catalog.list(root, sort="oldest")] == ["Alpha", "beta_cut", "Gamma", "beta%"]
+    assert [m['title'] for m in catalog.list(root, sort="title")] == ["Alpha", "beta%", "beta_cut", "Gamma"]
+    assert [m['title'] for m in catalog.list(root, sort="duration")] == ["Alpha", "Gamma", "beta_cut", "beta%"]
+    # 未知的排序方式按最新排序
+    assert catalog.list(root, sort="unknown") == catalog.list(root)
+
+
+def test_filters_search_resolution_and_dates(tmp_path):
+    catalog, root = _catalog(tmp_path)
+
+    assert [m['title'] for m in catalog.list(root, search="BETA", sort="oldest")] == ["beta_cut", "beta%"]
+    # 通配符按字面匹配
+    assert [m['title'] for m in catalog.list(root, search="%")] == ["beta%"]
+    assert [m['title'] for m in catalog.list(root, search="_")] == ["beta_cut"]
+
+    assert catalog.count(root, resolution="720p") == 2
+    assert [m['title'] for m in catalog.list(root, resolution="720p", sort="title")] == ["beta_cut", "Gamma"]
+
+    assert catalog.count(root, date_from=200, date_to=400) == 2
+    assert catalog.count(root, search="beta", resolution="1080p", date_to=300) == 1
+
+    # 其他根目录的视频不会列出
+    assert catalog.count(os.path.join(str(tmp_path), "other")) == 0
+
+
+def test_remove_and_get(tmp_path):
+    catalog, root = _catalog(tmp_path)
+    output_dir = os.path.join(root, "Gamma")
+
+    assert catalog.get(output_dir)['duration'] == 20
+    catalog.remove(output_dir)
+    assert catalog.get(output_dir) is None
+    assert catalog.count(root) == 3
@@ -0,0 +1,114 @@
+import os
+
+from converter.chunked import plan_chunks, stitch_playlists
+from converter.playlist import read_media_playlist, write_media_playlist
+
+
+def _write_chunk(chunk_dir, segments, files):
+    os.makedirs(chunk_dir)
+    for name, data in files.items():
+        with open(os.path.join(chunk_dir, name), 'wb') as f:
+            f.write(data)
+    write_media_playlist(os.path.join(chunk_dir, "playlist.m3u8"), {
+        'version': 3, 'media_sequence': 0, 'playlist_type': "VOD", 'endlist': True, 'segments': segments
+    })
+
+
+def test_plan_chunks_splits_at_keyframes_near_segment_boundaries():
+    keyframes = [float(t) for t in range(0, 300, 5)]
+    chunks = plan_chunks(keyframes, 300, 3, segment_time=6)
+
+    # 分界点取分片时长的整数倍（102、198），再对齐到其后的关键帧
+    assert chunks == [(0.0, 105.0), (105.0, 95.0), (200.0, 100.0)]
+    assert plan_chunks(keyframes, 300, 3) == [(0.0, 100.0), (100.0, 100.0), (200.0, 100.0)]
+
+
+def test_plan_chunks_keeps_short_or_unprobed_videos_whole():
+    # 每段至少MIN_CHUNK_SECONDS秒
+    assert plan_chunks([0.0, 30.0, 60.0, 90.0], 100, 4) == [(0.0, 100)]
+    assert plan_chunks([], 600, 4) == [(0.0, 600)]
+    assert plan_chunks([0.0, 50.0, 70.0], 130, 2) == [(0.0, 70.0), (70.0, 60.0)]
+
+
+def test_plan_chunks_skips_boundaries_without_later_keyframes():
+    # 后面没有关键帧的分界点被跳过，不会产生空段
+    assert plan_chunks([0.0, 10.0], 300, 3) == [(0.0, 300)]
+    assert plan_chunks([0.0, 150.0], 300, 3) == [(0.0, 150.0), (150.0, 150.0)]
+
+
+def test_stitch_playlists_renumbers_segments(tmp_path):
+    chunk_dirs = [str(tmp_path / f"chunk_{i}") for i in range(2)]
+    _write_chunk(chunk_dirs[0], [
+        {'duration': 6.0, 'uri': "segment_000.ts", 'tags': []},
+        {'duration': 4.0, 'uri': "segment_001.ts", 'tags': []},
+    ], {"segment_000.ts": b"a0", "segment_001.ts": b"a1"})
+    _write_chunk(chunk_dirs[1], [
+        {'duration': 6.0, 'uri': "segment_000.ts", 'tags': []},
+        {'duration': 5.0, 'uri': "segment_001.ts", 'tags': []},
+    ], {"segment_000.ts": b"b0", "segment_001.ts": b"b1"})
+    rendition_dir = tmp_path / "720p"
+    rendition_dir.mkdir()
+
+    assert stitch_playlists(chunk_dirs, str(rendition_dir), "playlist") == 4
+
+    playlist = read_media_playlist(str(rendition_dir / "playlist.m3u8"))
+    assert playlist['endlist'] and playlist['media_sequence'] == 0
+    assert [s['uri'] for s in playlist['segments']] == [f"segment_{i:03d}.ts" for i in range(4)]
+    assert [s['duration'] for s in playlist['segments']] == [6.0, 4.0, 6.0, 5.0]
+    assert [(rendition_dir / s['uri']).read_bytes() for s in playlist['segments']] == [b"a0", b"a1", b"b0", b"b1"]
+    assert os.listdir(chunk_dirs[0]) == ["playlist.m3u8"]
+
+
+def test_stitch_playlists_dedupes_fmp4_init(tmp_path):
+    chunk_dirs = [str(tmp_path / f"chunk_{i}") for i in range(3)]
+    init_a, init_b = b"init-a", b"init-b"
+    _write_chunk(chunk_dirs[0], [
+        {'duration': 6.0, 'uri': "segment_000.m4s", 'tags': ['#EXT-X-MAP:URI="init.mp4"']},
+        {'duration': 4.0, 'uri': "segment_001.m4s", 'tags': []},
+    ], {"init.mp4": init_a, "segment_000.m4s": b"a0", "segment_001.m4s": b"a1"})
+    # 与前一段初始化分片相同时共用，不同时另外引用
+    _write_chunk(chunk_dirs[1], [
+        {'duration': 6.0, 'uri': "segment_000.m4s", 'tags': ['#EXT-X-MAP:URI="init.mp4"']},
+    ], {"init.mp4": init_a, "segment_000.m4s": b"b0"})
+    _write_chunk(chunk_dirs[2], [
+        {'duration': 5.0, 'uri': "segment_000.m4s", 'tags': ['#EXT-X-MAP:URI="init.mp4"']},
+    ], {"init.mp4": init_b, "segment_000.m4s": b"c0"})
+    rendition_dir = tmp_path / "720p"
+    rendition_dir.mkdir()
+
+    assert stitch_playlists(chunk_dirs, str(rendition_dir), "playlist") == 4
+
+    playlist = read_media_playlist(str(rendition_dir / "playlist.m3u8"))
+    assert [s['uri'] for s in playlist['segments']] == [
+        "segment_000.m4s", "segment_001.m4s", "segment_002.m4s", "segment_003.m4s"
+    ]
+    assert [s['tags'] for s in playlist['segments']] == [
+        ['#EXT-X-MAP:URI="init_000.mp4"'], [], [], ['#EXT-X-MAP:URI="init_002.mp4"']
+    ]
+    assert [(rendition_dir / s['uri']).read_bytes() for s in playlist['segments']] == [b"a0", b"a1", b"b0", b"c0"]
+    assert (rendition_dir / "init_000.mp4").read_bytes() == init_a
+    assert (rendition_dir / "init_002.mp4").read_bytes() == init_b
+    assert not (rendition_dir / "init_001.mp4").exists()
+    assert not os.path.exists(os.path.join(chunk_dirs[1], "init.mp4"))
+
+
+def test_stitch_playlists_moves_single_file_media(tmp_path):
+    chunk_dirs = [str(tmp_path / f"chunk_{i}") for i in range(2)]
+    for index, chunk_dir in enumerate(chunk_dirs):
+        _write_chunk(chunk_dir, [
+            {'duration': 6.0, 'uri': "playlist.mp4",
+             'tags': ['#EXT-X-MAP:URI="playlist.mp4",BYTERANGE="100@0"', "#EXT-X-BYTERANGE:500@100"]},
+            {'duration': 6.0, 'uri': "playlist.mp4", 'tags': ["#EXT-X-BYTERANGE:400@600"]},
+        ], {"playlist.mp4": f"chunk{index}".encode()})
+    rendition_dir = tmp_path / "720p"
+    rendition_dir.mkdir()
+
+    assert stitch_playlists(chunk_dirs, str(rendition_dir), "playlist") == 4
+
+    playlist = read_media_playlist(str(rendition_dir / "playlist.m3u8"))
+    assert [s['uri'] for s in playlist['segments']] == ["media_000.mp4"] * 2 + ["media_001.mp4"] * 2
+    assert playlist['segments'][2]['tags'] == [
+        '#EXT-X-MAP:URI="media_001.mp4",BYTERANGE="100@0"', "#EXT-X-BYTERANGE:500@100"
+    ]
+    assert playlist['segments'][3]['tags'] == ["#EXT-X-BYTERANGE:400@600"]
+    assert (rendition_dir / "media_001.mp4").read_bytes() == b"chunk1"
@@ -0,0 +1,79 @@
+import argparse
+import json
+
+import pytest
+
+from converter.cli import build_parser, build_settings, main, parse_ladder
+from converter.settings import get_default_settings
+
+
+def test_parse_ladder():
+    settings = get_default_settings()
+
+    resolutions, bitrates = parse_ladder("1920x1080:5000k, 1280x720,raw:3000k,", settings)
+
+    assert resolutions == ["1920x1080", "1280x720", "原始分辨率"]
+    assert bitrates["1920x1080"] == "5000k"
+    assert bitrates["1280x720"] == settings['video_bitrates']["1280x720"]
+    assert bitrates["原始分辨率"] == "3000k"
+    # 没有修改传入的设置
+    assert settings['video_bitrates']["1920x1080"] == "4500k"
+
+    # 不在默认码率表中的分辨率必须指定码率
+    assert parse_ladder("960x540:1200k", settings)[1]["960x540"] == "1200k"
+    with pytest.raises(argparse.ArgumentTypeError):
+        parse_ladder("960x540", settings)
+
+
+def test_build_settings_from_arguments():
+    args = build_parser().parse_args([
+        "convert", "in.mp4", "--video-encoder", "libx264", "--ladder", "1280x720:2000k,640x360",
+        "--segment-time", "4", "--parallel", "2", "--single-decode", "--output-name", "index"
+    ])
+
+    settings = build_settings(args)
+
+    assert settings['video_encoder'] == "libx264"
+    assert settings['resolutions'] == ["1280x720", "640x360"]
+    assert settings['video_bitrates']["1280x720"] == "2000k"
+    assert settings['segment_time'] == "4"
+    assert settings['max_parallel_jobs'] == 2
+    assert settings['single_decode'] is True
+    assert settings['output_name'] == "index"
+    # 没有指定的参数保持默认值
+    assert settings['audio_encoder'] == get_default_settings()['audio_encoder']
+    assert settings['chunk_count'] == get_default_settings()['chunk_count']
+
+
+def test_build_settings_loads_config_file(tmp_path):
+    config = tmp_path / "config.json"
+    config.write_text(json.dumps({'video_encoder': "h264_nvenc", 'video_bitrates': {"1280x720": "1800k"}}))
+
+    settings = build_settings(build_parser().parse_args(["convert", "in.mp4", "--config", str(config)]))
+
+    assert settings['video_encoder'] == "h264_nvenc"
+    assert settings['video_bitrates']["1280x720"] == "1800k"
+    # 配置文件中没有的码率使用默认值
+    assert settings['video_bitrates']["1920x1080"] == "4500k"
+
+
+def test_convert_reports_argument_errors(capsys, tmp_path):
+    assert main(["convert", "in.mp4", "--ladder", "960x540"]) == 2
+    assert "参数错误" in capsys.readouterr().err
+
+    assert main(["convert", str(tmp_path / "*.mp4")]) == 2
+    assert "没有找到" in capsys.readouterr().err
+
+
+def test_enqueue_prints_jobs_as_json(capsys, tmp_path):
+    queue_path = str(tmp_path / "jobs.db")
+
+    assert main(["enqueue", "a.mp4", "b/a.mp4", "-o", str(tmp_path / "out"), "--queue", queue_path]) == 0
+
+    output = json.loads(capsys.readouterr().out)
+    assert output['enqueued'] == 2
+    # 同名的输入文件输出到不同目录
+    assert [job['output_dir'] for job in output['jobs']] == [str(tmp_path / "out" / "a"), str(tmp_path / "out" / "a_2")]
+
+    assert main(["jobs", "--queue", queue_path]) == 0
+    assert len(json.loads(capsys.readouterr().out)) == 2
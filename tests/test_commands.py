@@ -0,0 +1,131 @@
+import pytest
+
+from converter.commands import build_commands, is_hwaccel_failure
+from converter.scheduler import run_jobs
+from converter.settings import get_default_settings
+
+HWACCEL_ARGS = {
+    "h264_nvenc": (["-hwaccel", "cuda", "-hwaccel_output_format", "cuda"], "scale_cuda"),
+    "h264_qsv": (["-hwaccel", "qsv", "-hwaccel_output_format", "qsv"], "vpp_qsv"),
+}
+
+
+def _settings(video_encoder, **overrides):
+    settings = get_default_settings()
+    settings.update({'video_encoder': video_encoder, 'hw_decode': True, 'resolutions': ["1920x1080", "1280x720"],
+                     **overrides})
+    return settings
+
+
+def _assert_cpu_command(command):
+    """CPU解码的命令：没有硬件解码参数和GPU缩放滤镜"""
+    assert "-hwaccel" not in command
+    assert "-hwaccel_output_format" not in command
+    assert not any("scale_cuda" in part or "vpp_qsv" in part for part in command)
+
+
+@pytest.mark.parametrize("video_encoder", sorted(HWACCEL_ARGS))
+def test_hw_decode_commands(video_encoder):
+    hwaccel_args, gpu_filter = HWACCEL_ARGS[video_encoder]
+    jobs = build_commands("in.mp4", "out", _settings(video_encoder))
+
+    assert [job['resolutions'] for job in jobs] == [["1920x1080"], ["1280x720"]]
+    for job, size in zip(jobs, [("1920", "1080"), ("1280", "720")]):
+        command = job['command']
+        # 硬件解码参数必须在-i之前才作用于输入
+        start = command.index("-hwaccel")
+        assert command[start:start + 4] == hwaccel_args
+        assert start < command.index("-i")
+        # GPU缩放代替-s/scale
+        vf = command[command.index("-vf") + 1]
+        assert vf.startswith(gpu_filter) and size[0] in vf and size[1] in vf
+        assert "-s" not in command
+        assert not any(part.startswith("scale=") for part in command)
+        fallback = job['fallback_command']
+        _assert_cpu_command(fallback)
+        assert fallback[fallback.index("-s") + 1] == "x".join(size)
+        assert fallback[fallback.index("-c:v") + 1] == video_encoder
+        assert fallback[-1] == command[-1]
+
+
+@pytest.mark.parametrize("video_encoder", sorted(HWACCEL_ARGS))
+def test_hw_decode_single_decode_command(video_encoder):
+    hwaccel_args, gpu_filter = HWACCEL_ARGS[video_encoder]
+    job, = build_commands("in.mp4", "out", _settings(video_encoder, single_decode=True, previews=False))
+
+    command = job['command']
+    start = command.index("-hwaccel")
+    assert command[start:start + 4] == hwaccel_args
+    assert start < command.index("-i")
+    filter_complex = command[command.index("-filter_complex") + 1]
+    assert filter_complex.count(gpu_filter) == 2
+    assert "scale=" not in filter_complex
+
+    fallback = job['fallback_command']
+    _assert_cpu_command(fallback)
+    fallback_filter = fallback[fallback.index("-filter_complex") + 1]
+    assert "[s0]scale=1920:1080[v0]" in fallback_filter
+    assert "[s1]scale=1280:720[v1]" in fallback_filter
+
+
+@pytest.mark.parametrize("single_decode", [False, True])
+def test_hw_decode_previews_share_the_gpu_decode(single_decode):
+    jobs = build_commands("in.mp4", "out", _settings("h264_nvenc", single_decode=single_decode))
+
+    job = jobs[0]
+    assert job['previews']
+    assert all('previews' not in other for other in jobs[1:])
+    # 封面和雪碧图从显存中下载一路画面生成，不再单独解码源视频
+    preview_filter = next(part for part in job['command'] if part.startswith("[0:v]hwdownload,"))
+    assert "tile=5x5" in preview_filter
+    # CPU解码的备用命令同样生成预览，不需要hwdownload
+    fallback = job['fallback_command']
+    assert not any("hwdownload" in part for part in fallback)
+    assert any(part.startswith("[0:v]split=2[poster_in]") for part in fallback)
+    assert fallback.count("-filter_complex") == job['command'].count("-filter_complex")
+
+
+def test_without_hw_decode_there_is_no_fallback():
+    for settings in (_settings("h264_nvenc", hw_decode=False), _settings("libx264"), _settings("copy")):
+        for job in build_commands("in.mp4", "out", settings):
+            assert 'fallback_command' not in job
+            _assert_cpu_command(job['command'])
+
+
+def test_is_hwaccel_failure():
+    stderr = (
+        "[Parsed_scale_0 @ 0x55d5] Impossible to convert between the formats supported by the filter "
+        "'graph 0 input from stream 0:0' and the filter 'auto_scale_0'\n"
+        "Error reinitializing filters!\n"
+    )
+    assert is_hwaccel_failure(stderr)
+    assert is_hwaccel_failure("[AVHWDeviceContext @ 0x1] Cannot load libcuda.so.1\nDevice creation failed: -1.\n")
+    assert not is_hwaccel_failure("in.mp4: No such file or directory\n")
+    assert not is_hwaccel_failure(None)
+
+
+def _fake_jobs(fake_ffmpeg, tmp_path, **overrides):
+    jobs = build_commands("in.mp4", str(tmp_path / "out"), _settings("h264_nvenc", **overrides))
+    for job in jobs:
+        job['command'][0] = fake_ffmpeg
+        job['fallback_command'][0] = fake_ffmpeg
+    return jobs
+
+
+def test_run_jobs_falls_back_to_cpu_decode(fake_ffmpeg, tmp_path):
+    results = run_jobs(_fake_jobs(fake_ffmpeg, tmp_path), cpu_count=2)
+
+    assert [result['status'] for result in results] == ['done', 'done']
+    assert all(result['fallback'] for result in results)
+    assert all(result['returncode'] == 0 for result in results)
+
+
+def test_run_jobs_does_not_retry_other_failures(fake_ffmpeg, tmp_path):
+    # 不是硬件解码引起的失败不改用CPU解码重试
+    jobs = _fake_jobs(fake_ffmpeg, tmp_path, resolutions=["1280x720"], output_name="fail")
+
+    result, = run_jobs(jobs, cpu_count=1)
+
+    assert result['status'] == 'failed'
+    assert not result['fallback']
+    assert "Conversion failed!" in result['stderr']
@@ -0,0 +1,107 @@
+import os
+import xml.etree.ElementTree as ET
+
+import pytest
+
+from converter import dash
+from converter.commands import build_commands
+from converter.dash import write_dash_manifest
+from converter.playlist import write_media_playlist
+from converter.settings import get_default_settings
+
+MPD_NS = {'mpd': "urn:mpeg:dash:schema:mpd:2011"}
+
+STREAMS = {
+    "720p": {'codec_type': "video", 'codec_name': "h264", 'profile': "High", 'level': 31, 'width': 1280, 'height': 720},
+    "360p": {'codec_type': "video", 'codec_name': "h264", 'profile': "Main", 'level': 30, 'width': 640, 'height': 360},
+    "audio": {'codec_type': "audio", 'codec_name': "aac", 'profile': "LC", 'sample_rate': "48000", 'channels': 2},
+}
+
+
+def _write_fmp4_rendition(output_dir, name, durations, segment_size=1000):
+    rendition_dir = output_dir / name
+    rendition_dir.mkdir(parents=True)
+    (rendition_dir / "init.mp4").write_bytes(b"init")
+    segments = []
+    for index, duration in enumerate(durations):
+        uri = f"segment_{index:03d}.m4s"
+        (rendition_dir / uri).write_bytes(b"x" * segment_size)
+        segments.append({'duration': duration, 'uri': uri, 'tags': ['#EXT-X-MAP:URI="init.mp4"'] if index == 0 else []})
+    write_media_playlist(str(rendition_dir / "playlist.m3u8"), {
+        'version': 7, 'media_sequence': 0, 'playlist_type': "VOD", 'endlist': True, 'segments': segments
+    })
+
+
+def test_fmp4_commands_write_init_segment_and_m4s():
+    settings = get_default_settings()
+    settings.update({'video_encoder': "libx264", 'segment_type': "fmp4", 'resolutions': ["1280x720"], 'previews': False})
+
+    jobs = build_commands("in.mp4", "out", settings)
+
+    # fMP4模式下音频单独输出一路
+    assert [job['resolutions'] for job in jobs] == [["1280x720"], ["audio"]]
+    video = jobs[0]['command']
+    assert video[video.index("-hls_segment_type") + 1] == "fmp4"
+    assert video[video.index("-hls_fmp4_init_filename") + 1] == "init.mp4"
+    assert video[video.index("-hls_segment_filename") + 1].endswith("segment_%03d.m4s")
+    assert "-an" in video
+
+
+def test_segment_timeline_merges_repeated_durations():
+    timeline = dash._segment_timeline([6.0, 6.0, 6.0, 4.5, 6.0, 2.0])
+    assert [entry.attrib for entry in timeline] == [
+        {'t': "0", 'd': "6000", 'r': "2"},
+        {'t': "18000", 'd': "4500"},
+        {'t': "22500", 'd': "6000"},
+        {'t': "28500", 'd': "2000"},
+    ]
+
+
+def test_segment_timeline_does_not_accumulate_rounding_errors():
+    timeline = dash._segment_timeline([1 / 3] * 9)
+    total = sum(int(entry.get('d')) * (int(entry.get('r', 0)) + 1) for entry in timeline)
+    assert total == 3000
+
+
+def test_write_dash_manifest(tmp_path, monkeypatch):
+    monkeypatch.setattr(dash, "get_media_streams", lambda path: [STREAMS[os.path.basename(os.path.dirname(path))]])
+    _write_fmp4_rendition(tmp_path, "360p", [6.0, 6.0, 3.0], segment_size=1000)
+    _write_fmp4_rendition(tmp_path, "720p", [6.0, 6.0, 3.0], segment_size=4000)
+    _write_fmp4_rendition(tmp_path, "audio", [6.0, 6.0, 3.0], segment_size=100)
+
+    manifest_path = write_dash_manifest(str(tmp_path), ["360p", "720p", "audio", "1080p"], segment_time=6)
+
+    mpd = ET.parse(manifest_path).getroot()
+    assert mpd.get('mediaPresentationDuration') == "PT15.000S"
+    video, audio = mpd.findall("mpd:Period/mpd:AdaptationSet", MPD_NS)
+    assert video.get('contentType') == "video" and audio.get('contentType') == "audio"
+
+    # 同一AdaptationSet中按带宽从高到低排列
+    representations = video.findall("mpd:Representation", MPD_NS)
+    assert [r.get('id') for r in representations] == ["720p", "360p"]
+    assert representations[0].get('codecs') == "avc1.64001f"
+    # 带宽取单个分片的峰值码率（最后一个3秒的分片）
+    assert representations[0].get('bandwidth') == "10667"
+    template = representations[0].find("mpd:SegmentTemplate", MPD_NS)
+    assert template.get('initialization') == "720p/init.mp4"
+    assert template.get('media') == "720p/segment_$Number%03d$.m4s"
+    assert template.get('startNumber') == "0"
+    assert [s.attrib for s in template.find("mpd:SegmentTimeline", MPD_NS)] == [
+        {'t': "0", 'd': "6000", 'r': "1"}, {'t': "12000", 'd': "3000"}
+    ]
+
+    audio_representation = audio.find("mpd:Representation", MPD_NS)
+    assert audio_representation.get('audioSamplingRate') == "48000"
+    assert audio_representation.find("mpd:AudioChannelConfiguration", MPD_NS).get('value') == "2"
+
+
+def test_dash_manifest_rejects_encrypted_segments(tmp_path, monkeypatch):
+    monkeypatch.setattr(dash, "get_media_streams", lambda path: [STREAMS["720p"]])
+    _write_fmp4_rendition(tmp_path, "720p", [6.0])
+    playlist_path = tmp_path / "720p" / "playlist.m3u8"
+    playlist_path.write_text(
+        playlist_path.read_text().replace("#EXT-X-MAP", '#EXT-X-KEY:METHOD=AES-128,URI="key_0.key"\n#EXT-X-MAP')
+    )
+
+    with pytest.raises(ValueError, match="加密"):
+        write_dash_manifest(str(tmp_path), ["720p"])
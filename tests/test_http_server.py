@@ -0,0 +1,56 @@
+import http.client
+import threading
+
+from components.http_server import HLSRequestHandler, HLSServer, _bind, get_cache_control
+
+
+def test_media_files_are_revalidated_not_cached_as_immutable():
+    for name in ("segment_000.ts", "segment_000.m4s", "init.mp4", "media_000.ts"):
+        assert get_cache_control(f"/output/720p/{name}") == "no-cache"
+    assert get_cache_control("/output/720p/playlist.m3u8") == "public, max-age=2"
+    assert get_cache_control("/output/key_000.key") == "no-store"
+
+
+def test_rewritten_segment_fails_revalidation(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    segment = tmp_path / "segment_000.ts"
+    segment.write_bytes(b"plain" * 100)
+
+    server = HLSServer(("localhost", 0), HLSRequestHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        def get(headers=None):
+            conn = http.client.HTTPConnection("localhost", server.server_address[1])
+            conn.request("GET", "/segment_000.ts", headers=headers or {})
+            response = conn.getresponse()
+            body = response.read()
+            conn.close()
+            return response, body
+
+        response, _ = get()
+        etag = response.getheader("ETag")
+        assert response.getheader("Cache-Control") == "no-cache"
+        assert get({'If-None-Match': etag})[0].status == 304
+
+        # 原地改写后（如后期加密）同一URL必须返回新内容
+        segment.write_bytes(b"cipher" * 200)
+        response, body = get({'If-None-Match': etag})
+        assert response.status == 200
+        assert body == b"cipher" * 200
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+def test_bind_skips_port_in_use():
+    first = _bind("localhost", 0)
+    try:
+        port = first.server_address[1]
+        second = _bind("localhost", port)
+        try:
+            assert second.server_address[1] != port
+        finally:
+            second.server_close()
+    finally:
+        first.server_close()
@@ -0,0 +1,105 @@
+import sqlite3
+
+import pytest
+
+from converter import job_queue as job_queue_module
+from converter.job_queue import INTERACTIVE_PRIORITY, JobQueue, run_job
+from converter.pipeline import ConversionError
+
+
+def test_stale_worker_cannot_overwrite_taken_over_job(tmp_path):
+    job_queue = JobQueue(str(tmp_path / "jobs.db"))
+    job_id = job_queue.enqueue("input.mp4", "output", {})
+
+    # 第一个工作进程的租约立即过期，任务被第二个工作进程接管
+    assert job_queue.claim("worker-1", lease_seconds=-1)['id'] == job_id
+    assert job_queue.claim("worker-2")['id'] == job_id
+
+    assert not job_queue.complete(job_id, "worker-1", {'ok': True})
+    assert not job_queue.fail(job_id, "worker-1", "中断")
+    job = job_queue.get(job_id)
+    assert job['status'] == 'running'
+    assert job['worker'] == "worker-2"
+
+    assert job_queue.complete(job_id, "worker-2", {'ok': True})
+    assert job_queue.get(job_id)['status'] == 'success'
+
+
+def test_lost_lease_stops_conversion(tmp_path, monkeypatch):
+    job_queue = JobQueue(str(tmp_path / "jobs.db"))
+    job_id = job_queue.enqueue("input.mp4", "output", {})
+    job = job_queue.claim("worker-1", lease_seconds=-1)
+    assert job_queue.claim("worker-2")['id'] == job_id
+
+    def fake_convert(input_file, output_dir, settings, on_progress, on_status, stop_event):
+        # 续约失败后转换应被停止
+        assert stop_event.wait(5)
+        raise ConversionError("转换已停止")
+
+    monkeypatch.setattr(job_queue_module, "LEASE_SECONDS", 0.03)
+    monkeypatch.setattr(job_queue_module, "convert", fake_convert)
+    with pytest.raises(ConversionError):
+        run_job(job_queue, job, "worker-1")
+
+    job = job_queue.get(job_id)
+    assert job['status'] == 'running'
+    assert job['worker'] == "worker-2"
+
+
+def test_has_pending_includes_interrupted_jobs(tmp_path):
+    job_queue = JobQueue(str(tmp_path / "jobs.db"))
+    assert not job_queue.has_pending()
+
+    job_id = job_queue.enqueue("input.mp4", "output", {})
+    assert job_queue.has_pending()
+    job_queue.claim("worker-1")
+    assert not job_queue.has_pending()
+
+    # 工作进程中断、租约过期后任务需要重新处理
+    with sqlite3.connect(job_queue.path) as conn:
+        conn.execute("UPDATE jobs SET lease_expires = 0 WHERE id = ?", (job_id,))
+    conn.close()
+    assert job_queue.has_pending()
+
+
+def test_finished_job_cannot_be_failed_afterwards(tmp_path):
+    job_queue = JobQueue(str(tmp_path / "jobs.db"))
+    job_id = job_queue.enqueue("input.mp4", "output", {})
+    job_queue.claim("worker-1")
+
+    assert job_queue.fail(job_id, "worker-1", "出错")
+    assert not job_queue.complete(job_id, "worker-1", {'ok': True})
+    assert job_queue.get(job_id)['status'] == 'failed'
+
+
+def test_interactive_jobs_are_claimed_before_batch_jobs(tmp_path):
+    job_queue = JobQueue(str(tmp_path / "jobs.db"))
+    batch = [job_queue.enqueue(f"batch_{i}.mp4", "output", {}) for i in range(3)]
+    interactive = job_queue.enqueue("page.mp4", "output", {}, priority=INTERACTIVE_PRIORITY)
+
+    assert job_queue.position(interactive) == 0
+    assert job_queue.position(batch[2]) == 3
+    assert job_queue.claim("worker-1")['id'] == interactive
+    assert job_queue.position(interactive) is None
+    assert job_queue.claim("worker-1")['id'] == batch[0]
+
+
+def test_old_database_gains_priority_column(tmp_path):
+    path = str(tmp_path / "jobs.db")
+    with sqlite3.connect(path) as conn:
+        conn.execute(
+            "CREATE TABLE jobs (id INTEGER PRIMARY KEY AUTOINCREMENT, input_file TEXT NOT NULL, "
+            "output_dir TEXT NOT NULL, settings TEXT NOT NULL, status TEXT NOT NULL DEFAULT 'queued', "
+            "worker TEXT, lease_expires REAL, attempts INTEGER NOT NULL DEFAULT 0, "
+            "progress REAL NOT NULL DEFAULT 0, result TEXT, error TEXT, "
+            "created_at REAL NOT NULL, updated_at REAL NOT NULL)"
+        )
+        conn.execute(
+            "INSERT INTO jobs (input_file, output_dir, settings, created_at, updated_at) "
+            "VALUES ('old.mp4', 'output', '{}', 0, 0)"
+        )
+    conn.close()
+
+    job_queue = JobQueue(path)
+    job_id = job_queue.enqueue("page.mp4", "output", {}, priority=INTERACTIVE_PRIORITY)
+    assert job_queue.claim("worker-1")['id'] == job_id
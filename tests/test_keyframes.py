@@ -0,0 +1,52 @@
+from converter.keyframes import build_keyframe_args, plan_keyframes
+
+
+def _settings(**overrides):
+    return {'video_encoder': "libx264", 'segment_time': "6", 'aligned_keyframes': True, **overrides}
+
+
+def test_plan_keyframes_without_scene_cuts():
+    assert plan_keyframes(30, 6) == [0.0, 6.0, 12.0, 18.0, 24.0]
+    assert plan_keyframes(31, "6") == [0.0, 6.0, 12.0, 18.0, 24.0, 30.0]
+
+
+def test_plan_keyframes_snaps_boundaries_and_inserts_scene_cuts():
+    # 7.0在边界6之后的1.5秒内，边界移到场景切换处；15.0额外插入关键帧
+    assert plan_keyframes(30, 6, [7.0, 15.0]) == [0.0, 7.0, 12.0, 15.0, 18.0, 24.0]
+    # 离已有关键帧太近或在视频结尾之后的场景切换被忽略
+    assert plan_keyframes(30, 6, [11.8, 40.0]) == [0.0, 6.0, 12.0, 18.0, 24.0]
+
+
+def test_keyframe_args_disabled_for_copy_or_unaligned():
+    assert build_keyframe_args(_settings(video_encoder="copy")) == []
+    assert build_keyframe_args(_settings(aligned_keyframes=False)) == []
+
+
+def test_keyframe_args_fixed_interval():
+    assert build_keyframe_args(_settings(frame_rate=25)) == [
+        "-force_key_frames", "expr:gte(t,n_forced*6)", "-g", "150", "-keyint_min", "150", "-sc_threshold", "0"
+    ]
+    # 分段编码时从起点之后的下一个分片边界开始
+    assert build_keyframe_args(_settings(), start=13.0)[:2] == [
+        "-force_key_frames", "expr:gte(t,(n_forced+2)*6-13.000)"
+    ]
+
+
+def test_keyframe_args_follow_keyframe_plan():
+    times = [0.0, 7.0, 12.0, 15.0, 18.0, 24.0]
+    args = build_keyframe_args(_settings(keyframe_times=times, frame_rate=25))
+    assert args[:2] == ["-force_key_frames", "0.000,7.000,12.000,15.000,18.000,24.000"]
+    # 最大间隔7秒决定GOP长度
+    assert args[args.index("-g") + 1] == "175"
+
+    # 只保留当前段内的时间点，并换算为相对时间
+    args = build_keyframe_args(_settings(keyframe_times=times), start=12.0, length=12.0)
+    assert args[:2] == ["-force_key_frames", "0.000,3.000,6.000"]
+    assert "-g" not in args
+
+
+def test_keyframe_args_for_hardware_encoders():
+    assert build_keyframe_args(_settings(video_encoder="h264_nvenc", frame_rate=30)) == [
+        "-force_key_frames", "expr:gte(t,n_forced*6)", "-g", "180", "-forced-idr", "1", "-no-scenecut", "1"
+    ]
+    assert build_keyframe_args(_settings(video_encoder="h264_qsv"))[-2:] == ["-forced_idr", "1"]
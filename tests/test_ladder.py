@@ -0,0 +1,67 @@
+import math
+
+import pytest
+
+from converter.ladder import build_ladder, fit_rate_curve, format_ladder, get_sample_times, predict_bitrate
+
+RESOLUTIONS = ["1920x1080", "1280x720", "854x480", "640x360"]
+
+
+def _curve(kbps_at_crf23, slope=-0.12):
+    """在试编码分辨率（360p）下CRF 23的码率为kbps_at_crf23的曲线"""
+    return math.log(kbps_at_crf23 * 1000) - slope * 23, slope
+
+
+def test_fit_rate_curve_recovers_exponential_model():
+    points = {crf: math.exp(14.0 - 0.11 * crf) for crf in (20, 26, 32)}
+
+    intercept, slope = fit_rate_curve(points)
+
+    assert intercept == pytest.approx(14.0)
+    assert slope == pytest.approx(-0.11)
+    assert predict_bitrate((intercept, slope), 23) == pytest.approx(math.exp(14.0 - 0.11 * 23))
+
+
+def test_fit_rate_curve_with_single_crf_is_flat():
+    assert fit_rate_curve({23: math.e ** 10}) == (pytest.approx(10.0), 0.0)
+
+
+def test_build_ladder_scales_bitrate_by_pixel_count():
+    resolutions, bitrates = build_ladder(_curve(600), RESOLUTIONS, (1920, 1080))
+
+    assert resolutions == RESOLUTIONS
+    # 360p就是试编码分辨率，其余按像素数的0.75次方换算
+    assert bitrates == {"1920x1080": "3120k", "1280x720": "1700k", "854x480": "920k", "640x360": "600k"}
+
+
+def test_build_ladder_drops_rungs_too_close_to_the_one_above():
+    # 原始分辨率与1080p像素数相同，码率相差不到MIN_RUNG_RATIO倍，只保留一档
+    resolutions, bitrates = build_ladder(_curve(600), ["1920x1080", "原始分辨率", "1280x720"], (1920, 1080))
+    assert len(resolutions) == 2
+    assert resolutions[-1] == "1280x720"
+    assert set(bitrates) == set(resolutions)
+
+
+def test_build_ladder_clamps_to_default_bitrate_limits():
+    # 几乎静止的画面不低于默认码率的0.2倍，运动剧烈的画面不超过默认码率的2倍
+    _, low = build_ladder(_curve(5), ["1920x1080"], (1920, 1080))
+    _, high = build_ladder(_curve(50000), ["1920x1080"], (1920, 1080))
+
+    assert low == {"1920x1080": "900k"}
+    assert high == {"1920x1080": "9000k"}
+
+
+def test_build_ladder_skips_upscaling():
+    resolutions, _ = build_ladder(_curve(600), ["3840x2160", "1280x720", "原始分辨率"], (1280, 720))
+    assert "3840x2160" not in resolutions
+
+    # 所有分辨率都比源视频大时保留最小的一档
+    resolutions, bitrates = build_ladder(_curve(600), ["3840x2160", "1920x1080"], (640, 360))
+    assert resolutions == ["1920x1080"] and list(bitrates) == ["1920x1080"]
+
+
+def test_format_ladder_and_sample_times():
+    assert format_ladder(["1920x1080", "原始分辨率"], {"1920x1080": "3000k", "原始分辨率": "2000k"}) == \
+        "1920x1080:3000k,raw:2000k"
+    assert get_sample_times(10) == [0.0]
+    assert get_sample_times(100) == pytest.approx([10.0, 35.333, 60.667, 86.0], abs=1e-3)
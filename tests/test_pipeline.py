@@ -0,0 +1,78 @@
+import os
+
+from converter.commands import build_commands
+from converter.pipeline import write_master_playlist
+from converter.playlist import write_media_playlist
+from converter.settings import get_default_settings
+
+
+def _settings(**overrides):
+    settings = get_default_settings()
+    settings.update({
+        'video_encoder': "libx264", 'audio_encoder': "aac", 'resolutions': ["1920x1080", "1280x720"],
+        'separate_audio': True, 'previews': False, **overrides
+    })
+    return settings
+
+
+def _write_rendition(rendition_dir):
+    rendition_dir.mkdir(parents=True)
+    (rendition_dir / "segment_000.ts").write_bytes(b"\x47" * 188 * 10)
+    write_media_playlist(str(rendition_dir / "playlist.m3u8"), {
+        'version': 3, 'media_sequence': 0, 'playlist_type': "VOD", 'endlist': True,
+        'segments': [{'duration': 6.0, 'uri': "segment_000.ts", 'tags': []}]
+    })
+
+
+def test_separate_audio_is_encoded_once():
+    jobs = build_commands("in.mp4", "out", _settings())
+
+    assert [job['resolutions'] for job in jobs] == [["1920x1080"], ["1280x720"], ["audio"]]
+    for job in jobs[:2]:
+        assert "-an" in job['command'] and "-c:a" not in job['command']
+    audio = jobs[2]['command']
+    assert audio[audio.index("-vn") + 1:audio.index("-vn") + 3] == ["-map", "0:a:0"]
+    assert audio[audio.index("-c:a") + 1] == "aac"
+    assert audio[-1] == os.path.join("out", "audio", "playlist.m3u8")
+
+    # 没有音频流时不输出音频路
+    assert [job['resolutions'] for job in build_commands("in.mp4", "out", _settings(), has_audio=False)] == [
+        ["1920x1080"], ["1280x720"]
+    ]
+
+
+def test_single_decode_maps_audio_once():
+    job, = build_commands("in.mp4", "out", _settings(single_decode=True))
+
+    command = job['command']
+    assert job['resolutions'] == ["1920x1080", "1280x720", "audio"]
+    assert command.count("0:a:0") == 1
+    assert command[command.index("-var_stream_map") + 1] == "v:0,name:1080p v:1,name:720p a:0,name:audio"
+
+
+def test_master_playlist_references_audio_group(tmp_path):
+    for name in ("1080p", "720p", "audio"):
+        _write_rendition(tmp_path / name)
+
+    write_master_playlist(str(tmp_path), _settings())
+
+    lines = (tmp_path / "master.m3u8").read_text(encoding='utf-8').splitlines()
+    media = [line for line in lines if line.startswith("#EXT-X-MEDIA:")]
+    assert media == [
+        '#EXT-X-MEDIA:TYPE=AUDIO,GROUP-ID="audio",NAME="audio",DEFAULT=YES,AUTOSELECT=YES,URI="audio/playlist.m3u8"'
+    ]
+    variants = [line for line in lines if line.startswith("#EXT-X-STREAM-INF:")]
+    assert len(variants) == 2
+    assert all(line.endswith(',AUDIO="audio"') for line in variants)
+    assert [line for line in lines if not line.startswith("#")] == ["1080p/playlist.m3u8", "720p/playlist.m3u8"]
+
+
+def test_master_playlist_without_audio_group(tmp_path):
+    for name in ("1080p", "720p"):
+        _write_rendition(tmp_path / name)
+
+    write_master_playlist(str(tmp_path), _settings(separate_audio=False))
+
+    text = (tmp_path / "master.m3u8").read_text(encoding='utf-8')
+    assert "#EXT-X-MEDIA" not in text
+    assert "AUDIO=" not in text
@@ -0,0 +1,78 @@
+import os
+
+from converter.commands import build_commands, uses_single_file
+from converter.playlist import get_byte_range, read_media_playlist, write_media_playlist
+from converter.settings import get_default_settings
+
+SINGLE_FILE_PLAYLIST = """#EXTM3U
+#EXT-X-VERSION:7
+#EXT-X-TARGETDURATION:6
+#EXT-X-MEDIA-SEQUENCE:0
+#EXT-X-PLAYLIST-TYPE:VOD
+#EXT-X-INDEPENDENT-SEGMENTS
+#EXT-X-MAP:URI="media_000.mp4",BYTERANGE="812@0"
+#EXTINF:6.000000,
+#EXT-X-BYTERANGE:40000@812
+media_000.mp4
+#EXTINF:5.500000,
+#EXT-X-BYTERANGE:38000
+media_000.mp4
+#EXT-X-ENDLIST
+"""
+
+
+def _settings(**overrides):
+    settings = get_default_settings()
+    settings.update({'video_encoder': "libx264", 'resolutions': ["1280x720"], 'previews': False, **overrides})
+    return settings
+
+
+def test_read_single_file_playlist(tmp_path):
+    path = tmp_path / "playlist.m3u8"
+    path.write_text(SINGLE_FILE_PLAYLIST, encoding='utf-8')
+
+    playlist = read_media_playlist(str(path))
+
+    assert playlist['version'] == 7
+    assert playlist['endlist']
+    assert playlist['header'] == ["#EXT-X-INDEPENDENT-SEGMENTS"]
+    first, second = playlist['segments']
+    # EXT-X-MAP和EXT-X-BYTERANGE跟随其后的分片
+    assert first['tags'] == ['#EXT-X-MAP:URI="media_000.mp4",BYTERANGE="812@0"', "#EXT-X-BYTERANGE:40000@812"]
+    assert (first['duration'], first['uri']) == (6.0, "media_000.mp4")
+    assert get_byte_range(first) == (40000, 812)
+    # 省略起始位置时紧接在上一个分片之后
+    assert get_byte_range(second) == (38000, None)
+    assert get_byte_range({'tags': []}) is None
+
+
+def test_playlist_round_trip(tmp_path):
+    path = tmp_path / "playlist.m3u8"
+    path.write_text(SINGLE_FILE_PLAYLIST, encoding='utf-8')
+    playlist = read_media_playlist(str(path))
+
+    write_media_playlist(str(tmp_path / "copy.m3u8"), playlist)
+
+    assert read_media_playlist(str(tmp_path / "copy.m3u8")) == playlist
+    assert not (tmp_path / "copy.m3u8.tmp").exists()
+
+
+def test_single_file_command_arguments():
+    command = build_commands("in.mp4", "out", _settings(single_file=True, segment_type="fmp4"))[0]['command']
+
+    assert command[command.index("-hls_flags") + 1] == "single_file"
+    assert command[command.index("-hls_segment_filename") + 1].endswith(os.path.join("720p", "media_000.m4s"))
+    assert command[command.index("-hls_fmp4_init_filename") + 1] == "init.mp4"
+
+    # 续转时写到以起始序号命名的新文件
+    command = build_commands("in.mp4", "out", _settings(single_file=True, start_number=12))[0]['command']
+    assert command[command.index("-hls_segment_filename") + 1].endswith(os.path.join("720p", "media_012.ts"))
+    assert command[command.index("-start_number") + 1] == "12"
+
+
+def test_single_file_is_disabled_with_encryption():
+    assert uses_single_file(_settings(single_file=True))
+    assert not uses_single_file(_settings(single_file=True, encryption_enabled=True))
+    command = build_commands("in.mp4", "out", _settings(single_file=True, encryption_enabled=True))[0]['command']
+    assert "-hls_flags" not in command
+    assert command[command.index("-hls_segment_filename") + 1].endswith("segment_%03d.ts")
@@ -0,0 +1,100 @@
+import os
+
+import pytest
+
+from converter import previews
+from converter.previews import (
+    add_preview_outputs, get_poster_candidates, get_sprite_count, has_previews, score_frames, write_thumbnails_vtt
+)
+
+SETTINGS = {'preview_interval': 10}
+
+
+def _make_sprites(output_dir, count):
+    sprites_dir = output_dir / "sprites"
+    sprites_dir.mkdir()
+    for index in range(1, count + 1):
+        (sprites_dir / f"sprite_{index:03d}.jpg").write_bytes(b"jpg")
+
+
+def test_preview_outputs_share_the_encode_input():
+    command = ["ffmpeg", "-y", "-i", "in.mp4", "-c:v", "libx264", "out/720p/playlist.m3u8"]
+
+    result = add_preview_outputs(command, "out", SETTINGS)
+
+    # 封面和雪碧图输出插在输入之后，播放列表仍是最后一个参数
+    assert result[:4] == command[:4]
+    assert result[-3:] == command[-3:]
+    filter_complex = result[result.index("-filter_complex") + 1]
+    assert "fps=1/10" in filter_complex and "tile=5x5" in filter_complex
+    assert os.path.join("out", "thumbnail.jpg") in result
+    assert os.path.join("out", "sprites", "sprite_%03d.jpg") in result
+
+
+def test_thumbnails_vtt_points_into_sprite_tiles(tmp_path):
+    _make_sprites(tmp_path, 2)
+
+    write_thumbnails_vtt(str(tmp_path), 265.5, SETTINGS)
+
+    lines = (tmp_path / "thumbnails.vtt").read_text(encoding='utf-8').split("\n")
+    assert lines[:2] == ["WEBVTT", ""]
+    cues = [(lines[i], lines[i + 1]) for i in range(2, len(lines), 3)]
+    assert len(cues) == 27
+    assert cues[0] == ("00:00:00.000 --> 00:00:10.000", "sprites/sprite_001.jpg#xywh=0,0,160,90")
+    assert cues[6] == ("00:01:00.000 --> 00:01:10.000", "sprites/sprite_001.jpg#xywh=160,90,160,90")
+    assert cues[24][1] == "sprites/sprite_001.jpg#xywh=640,360,160,90"
+    # 每张雪碧图25块，第26块开始在下一张
+    assert cues[25][1] == "sprites/sprite_002.jpg#xywh=0,0,160,90"
+    # 最后一条到视频结尾为止
+    assert cues[26][0] == "00:04:20.000 --> 00:04:25.500"
+
+
+def test_thumbnails_vtt_stops_at_missing_sprite(tmp_path):
+    _make_sprites(tmp_path, 1)
+
+    write_thumbnails_vtt(str(tmp_path), 3600, SETTINGS)
+
+    text = (tmp_path / "thumbnails.vtt").read_text(encoding='utf-8')
+    assert text.count(" --> ") == 25
+    assert "sprite_002" not in text
+
+
+def test_has_previews_requires_all_sprites(tmp_path):
+    assert get_sprite_count(265.5, SETTINGS) == 2
+    assert not has_previews(str(tmp_path), 265.5, SETTINGS)
+    (tmp_path / "thumbnail.jpg").write_bytes(b"jpg")
+    _make_sprites(tmp_path, 1)
+    assert not has_previews(str(tmp_path), 265.5, SETTINGS)
+    assert has_previews(str(tmp_path), 200, SETTINGS)
+    assert has_previews(str(tmp_path), None, SETTINGS)
+
+
+def _frame(width, height, pixel):
+    return bytes(pixel(x, y) for y in range(height) for x in range(width))
+
+
+def test_pure_python_poster_scores(monkeypatch):
+    # 没有安装NumPy时用纯Python计算
+    monkeypatch.setattr(previews, "np", None)
+    width, height = 16, 12
+    frames = [
+        _frame(width, height, lambda x, y: 5),  # 黑场
+        _frame(width, height, lambda x, y: 250),  # 白场
+        _frame(width, height, lambda x, y: 128),  # 没有细节的灰场
+        _frame(width, height, lambda x, y: 64 + 128 * ((x + y) % 2)),  # 清晰的细节
+        _frame(width, height, lambda x, y: 40 + 128 * ((x + y) % 2)),  # 同样的细节，但偏暗
+        _frame(width, height, lambda x, y: 96 + 64 * (x >= width // 2)),  # 只有一条边缘
+    ]
+
+    scores = score_frames(b"".join(frames) + b"\x00" * 10, width, height)
+
+    assert len(scores) == 6
+    assert scores[:3] == [0.0, 0.0, 0.0]
+    assert scores[3] == max(scores)
+    assert 0 < scores[4] < scores[3]
+    assert 0 < scores[5] < scores[3]
+
+
+def test_poster_candidates_skip_intro_and_credits():
+    assert get_poster_candidates(100, count=3) == pytest.approx([5.0, 50.0, 95.0])
+    assert get_poster_candidates(100, count=1) == [5.0]
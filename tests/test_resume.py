@@ -0,0 +1,171 @@
+import os
+
+from converter.commands import build_commands
+from converter.playlist import read_media_playlist, write_media_playlist
+from converter import resume
+from converter.resume import RESUME_MARKER_NAME, finish_resume, plan_resume, prepare_output
+from converter.settings import get_default_settings
+
+
+def _settings(**overrides):
+    settings = get_default_settings()
+    settings.update({'video_encoder': "libx264", 'previews': False, **overrides})
+    return settings
+
+
+def _write_rendition(rendition_dir, segment_count, endlist, extra_files=()):
+    os.makedirs(rendition_dir)
+    segments = []
+    for index in range(segment_count):
+        uri = f"segment_{index:03d}.ts"
+        with open(os.path.join(rendition_dir, uri), 'wb') as f:
+            f.write(b"ts")
+        segments.append({'duration': 6.0, 'uri': uri, 'tags': []})
+    for name in extra_files:
+        with open(os.path.join(rendition_dir, name), 'wb') as f:
+            f.write(b"partial")
+    write_media_playlist(os.path.join(rendition_dir, "playlist.m3u8"), {
+        'version': 3, 'media_sequence': 0, 'playlist_type': "VOD", 'endlist': endlist, 'segments': segments
+    })
+
+
+def test_plan_resume_skips_finished_and_continues_partial(tmp_path):
+    output_dir = str(tmp_path / "out")
+    settings = _settings()
+    _write_rendition(os.path.join(output_dir, "1080p"), 5, endlist=True)
+    # 中断时segment_002.ts写了一半，还没有记录到播放列表中
+    _write_rendition(os.path.join(output_dir, "720p"), 2, endlist=False, extra_files=["segment_002.ts"])
+
+    jobs = plan_resume(build_commands("in.mp4", output_dir, settings), "in.mp4", output_dir, settings, duration=30)
+
+    assert len(jobs) == 1
+    job = jobs[0]
+    assert job['resolutions'] == ["1280x720"]
+    assert job['resumed_from'] == 12.0
+    assert job['time_offset'] == 12.0
+    assert job['duration'] == 18.0
+    command = job['command']
+    assert command[command.index("-ss") + 1] == "12.000"
+    assert command.index("-ss") < command.index("-i")
+    assert command[command.index("-start_number") + 1] == "2"
+    assert command[-1] == os.path.join(output_dir, "720p", "playlist_resume.m3u8")
+    assert not os.path.exists(os.path.join(output_dir, "720p", "segment_002.ts"))
+
+
+def test_plan_resume_restarts_jobs_without_segments(tmp_path):
+    output_dir = str(tmp_path / "out")
+    settings = _settings()
+    jobs = build_commands("in.mp4", output_dir, settings)
+
+    assert plan_resume(jobs, "in.mp4", output_dir, settings, duration=30) == jobs
+
+
+def test_plan_resume_rebuilds_cpu_fallback(tmp_path):
+    output_dir = str(tmp_path / "out")
+    settings = _settings(video_encoder="h264_nvenc", resolutions=["1280x720"], hw_decode=True)
+    _write_rendition(os.path.join(output_dir, "720p"), 1, endlist=False)
+
+    job, = plan_resume(build_commands("in.mp4", output_dir, settings), "in.mp4", output_dir, settings)
+
+    assert job['duration'] is None
+    assert "-hwaccel" in job['command']
+    fallback = job['fallback_command']
+    assert "-hwaccel" not in fallback
+    assert fallback[fallback.index("-ss") + 1] == "6.000"
+    assert fallback[fallback.index("-start_number") + 1] == "1"
+
+
+def test_copy_resume_seeks_past_last_keyframe(tmp_path):
+    output_dir = str(tmp_path / "out")
+    settings = _settings(video_encoder="copy")
+    _write_rendition(os.path.join(output_dir, "raw"), 2, endlist=False)
+
+    job, = plan_resume(build_commands("in.mp4", output_dir, settings), "in.mp4", output_dir, settings, duration=30)
+
+    assert job['command'][job['command'].index("-ss") + 1] == "12.050"
+
+
+def test_finish_resume_appends_new_segments(tmp_path):
+    output_dir = str(tmp_path / "out")
+    settings = _settings(resolutions=["1280x720"])
+    rendition_dir = os.path.join(output_dir, "720p")
+    _write_rendition(rendition_dir, 2, endlist=False)
+    jobs = plan_resume(build_commands("in.mp4", output_dir, settings), "in.mp4", output_dir, settings, duration=18)
+
+    # 模拟续转命令的输出
+    with open(os.path.join(rendition_dir, "segment_002.ts"), 'wb') as f:
+        f.write(b"ts")
+    write_media_playlist(os.path.join(rendition_dir, "playlist_resume.m3u8"), {
+        'version': 3, 'media_sequence': 2, 'playlist_type': "VOD", 'endlist': True,
+        'segments': [{'duration': 6.0, 'uri': "segment_002.ts", 'tags': []}]
+    })
+    finish_resume(jobs, settings)
+
+    playlist = read_media_playlist(os.path.join(rendition_dir, "playlist.m3u8"))
+    assert [segment['uri'] for segment in playlist['segments']] == ["segment_000.ts", "segment_001.ts", "segment_002.ts"]
+    assert playlist['endlist']
+    assert not os.path.exists(os.path.join(rendition_dir, "playlist_resume.m3u8"))
+
+
+def _partial_output(tmp_path, monkeypatch, settings):
+    """用settings转换到一半的输出目录，返回 (源文件, 输出目录, 清除缓存记录的调用)"""
+    forgotten = []
+    monkeypatch.setattr(resume, "forget_conversion", forgotten.append)
+    source = tmp_path / "input.mp4"
+    source.write_bytes(b"source video")
+    output_dir = str(tmp_path / "out")
+    os.makedirs(output_dir)
+    assert not prepare_output(output_dir, str(source), settings)
+    _write_rendition(os.path.join(output_dir, "1080p"), 5, endlist=True)
+    _write_rendition(os.path.join(output_dir, "720p"), 2, endlist=False)
+    return source, output_dir, forgotten
+
+
+def test_same_source_and_settings_resume(tmp_path, monkeypatch):
+    settings = _settings()
+    source, output_dir, forgotten = _partial_output(tmp_path, monkeypatch, settings)
+
+    assert not prepare_output(output_dir, str(source), settings)
+
+    jobs = plan_resume(build_commands(str(source), output_dir, settings), str(source), output_dir, settings, 30)
+    assert [job.get('resumed_from') for job in jobs] == [12.0]
+    assert forgotten == []
+
+
+def test_changed_settings_convert_from_scratch(tmp_path, monkeypatch):
+    source, output_dir, forgotten = _partial_output(tmp_path, monkeypatch, _settings())
+    with open(os.path.join(output_dir, "notes.txt"), 'w') as f:
+        f.write("不是转换结果")
+    settings = _settings()
+    settings['video_bitrates']["1280x720"] = "1800k"
+
+    assert prepare_output(output_dir, str(source), settings)
+
+    # 旧的分片全部删除，其他文件保留，指向这个目录的缓存记录也被删除
+    assert sorted(os.listdir(output_dir)) == [RESUME_MARKER_NAME, "notes.txt"]
+    assert forgotten == [output_dir]
+    jobs = build_commands(str(source), output_dir, settings)
+    assert plan_resume(jobs, str(source), output_dir, settings, 30) == jobs
+    # 标记已更新为新的设置
+    assert not prepare_output(output_dir, str(source), settings)
+
+
+def test_different_source_with_same_output_dir_is_not_resumed(tmp_path, monkeypatch):
+    settings = _settings()
+    source, output_dir, _ = _partial_output(tmp_path, monkeypatch, settings)
+    other = tmp_path / "other" / "input.mp4"
+    other.parent.mkdir()
+    other.write_bytes(b"another video")
+
+    assert prepare_output(output_dir, str(other), settings)
+    assert not os.path.exists(os.path.join(output_dir, "1080p"))
+
+
+def test_output_without_marker_is_not_resumed(tmp_path, monkeypatch):
+    settings = _settings()
+    source, output_dir, _ = _partial_output(tmp_path, monkeypatch, settings)
+    os.remove(os.path.join(output_dir, RESUME_MARKER_NAME))
+
+    assert prepare_output(output_dir, str(source), settings)
+    assert os.listdir(output_dir) == [RESUME_MARKER_NAME]
+
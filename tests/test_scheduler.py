@@ -0,0 +1,89 @@
+import threading
+import time
+
+from converter.scheduler import format_eta, parse_progress, plan_concurrency, run_jobs
+
+
+def _job(ffmpeg, output, encoder="libx264", **extra):
+    return {'resolutions': ["1280x720"], 'encoder': encoder, 'command': [ffmpeg, "-y", "-i", "in.mp4", output], **extra}
+
+
+def test_plan_concurrency_splits_cpu_threads():
+    jobs = [{}] * 3
+    assert plan_concurrency(jobs, cpu_count=8) == (3, 2)
+    assert plan_concurrency(jobs, max_workers=2, cpu_count=8) == (2, 4)
+    # 并发数不超过任务数，每个任务至少一个线程
+    assert plan_concurrency([{}], max_workers=4, cpu_count=8) == (1, 8)
+    assert plan_concurrency(jobs * 4, cpu_count=4) == (4, 1)
+    assert plan_concurrency(jobs, max_workers=6, cpu_count=2) == (3, 1)
+
+
+def test_run_jobs_reports_progress(fake_ffmpeg, tmp_path):
+    states = []
+    jobs = [_job(fake_ffmpeg, str(tmp_path / "a.m3u8")), _job(fake_ffmpeg, str(tmp_path / "b.m3u8"))]
+
+    results = run_jobs(jobs, duration=2, cpu_count=4, progress_interval=0,
+                       on_progress=lambda state: states.append(state['overall']))
+
+    assert [result['status'] for result in results] == ['done', 'done']
+    assert [result['progress'] for result in results] == [1.0, 1.0]
+    assert any(0 < overall < 1 for overall in states)
+    assert states[-1] == 1.0
+
+
+def test_failed_job_cancels_running_jobs(fake_ffmpeg, tmp_path):
+    jobs = [_job(fake_ffmpeg, str(tmp_path / "slow.m3u8")), _job(fake_ffmpeg, str(tmp_path / "fail.m3u8"))]
+
+    started = time.time()
+    results = run_jobs(jobs, max_workers=2, cpu_count=2)
+
+    # 失败的任务终止了仍在运行的任务，不用等它结束
+    assert time.time() - started < 15
+    assert results[1]['status'] == 'failed'
+    assert "Conversion failed!" in results[1]['stderr']
+    assert results[0]['status'] == 'cancelled'
+
+
+def test_queued_jobs_are_skipped_after_failure(fake_ffmpeg, tmp_path):
+    jobs = [_job(fake_ffmpeg, str(tmp_path / "fail.m3u8")), _job(fake_ffmpeg, str(tmp_path / "b.m3u8"))]
+
+    results = run_jobs(jobs, max_workers=1, cpu_count=1)
+
+    assert results[0]['status'] == 'failed'
+    assert results[1]['status'] == 'cancelled'
+    assert results[1]['returncode'] is None
+
+
+def test_stop_event_terminates_running_jobs(fake_ffmpeg, tmp_path):
+    jobs = [_job(fake_ffmpeg, str(tmp_path / "slow.m3u8")), _job(fake_ffmpeg, str(tmp_path / "slow_2.m3u8"))]
+    stop_event = threading.Event()
+    threading.Timer(0.5, stop_event.set).start()
+
+    started = time.time()
+    results = run_jobs(jobs, max_workers=1, cpu_count=1, stop_event=stop_event)
+
+    assert time.time() - started < 15
+    assert [result['status'] for result in results] == ['cancelled', 'cancelled']
+    assert results[1]['returncode'] is None
+
+
+def test_parse_progress_reads_block():
+    progress = parse_progress({
+        'frame': "250", 'fps': "49.5", 'out_time_us': "10000000", 'out_time_ms': "1", 'speed': " 1.98x"
+    })
+    assert progress == {'seconds': 10.0, 'fps': 49.5, 'speed': 1.98, 'frame': 250}
+
+
+def test_parse_progress_tolerates_missing_values():
+    # 旧版本只有out_time_ms（单位也是微秒）；开始时各项为N/A
+    assert parse_progress({'out_time_ms': "2500000"})['seconds'] == 2.5
+    assert parse_progress({'out_time_us': "N/A", 'fps': "N/A", 'speed': "N/A", 'frame': ""}) == {
+        'seconds': None, 'fps': None, 'speed': None, 'frame': None
+    }
+    assert parse_progress({}) == {'seconds': None, 'fps': None, 'speed': None, 'frame': None}
+
+
+def test_format_eta():
+    assert format_eta(None) == "--:--"
+    assert format_eta(65.7) == "01:05"
+    assert format_eta(3725) == "1:02:05"
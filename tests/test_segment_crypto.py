@@ -0,0 +1,142 @@
+import os
+
+import pytest
+
+pytest.importorskip("cryptography")
+
+from converter import segment_crypto
+from converter.playlist import read_media_playlist, write_media_playlist
+from converter.segment_crypto import decrypt_rendition, encrypt_rendition, encrypt_renditions, is_encrypted, protect_output
+
+
+def _make_output(output_dir, renditions=("720p", "360p"), count=4):
+    """生成带明文分片的输出目录，返回 {分辨率: [分片内容]}"""
+    contents = {}
+    for name in renditions:
+        rendition_dir = output_dir / name
+        rendition_dir.mkdir(parents=True)
+        segments = []
+        contents[name] = []
+        for index in range(count):
+            data = (b"\x47" + bytes([index]) * 187) * (index + 3)
+            (rendition_dir / f"segment_{index:03d}.ts").write_bytes(data)
+            contents[name].append(data)
+            segments.append({'duration': 6.0, 'uri': f"segment_{index:03d}.ts", 'tags': []})
+        write_media_playlist(str(rendition_dir / "playlist.m3u8"), {
+            'version': 3, 'media_sequence': 0, 'playlist_type': "VOD", 'endlist': True, 'segments': segments
+        })
+    return contents
+
+
+def _read_segments(rendition_dir):
+    playlist = read_media_playlist(os.path.join(rendition_dir, "playlist.m3u8"))
+    return [open(os.path.join(rendition_dir, segment['uri']), 'rb').read() for segment in playlist['segments']]
+
+
+def test_encrypt_then_decrypt_restores_segments(tmp_path):
+    contents = _make_output(tmp_path)
+    rendition_dir = str(tmp_path / "720p")
+
+    assert encrypt_rendition(rendition_dir, rotation=2) == 4
+    assert is_encrypted(read_media_playlist(os.path.join(rendition_dir, "playlist.m3u8")))
+    assert _read_segments(rendition_dir) != contents["720p"]
+
+    assert decrypt_rendition(rendition_dir) == 4
+    assert _read_segments(rendition_dir) == contents["720p"]
+    assert sorted(os.listdir(rendition_dir)) == ["playlist.m3u8"] + [f"segment_{i:03d}.ts" for i in range(4)]
+
+
+def test_interrupted_replace_is_completed_not_encrypted_twice(tmp_path, monkeypatch):
+    contents = _make_output(tmp_path)
+    rendition_dir = str(tmp_path / "720p")
+
+    # 替换到第二个分片时进程中断：一个分片已是密文，播放列表还是明文
+    real_replace = os.replace
+    calls = []
+
+    def crashing_replace(source, target):
+        if source.endswith(".ts.tmp"):
+            calls.append(source)
+            if len(calls) == 2:
+                raise KeyboardInterrupt
+        real_replace(source, target)
+
+    monkeypatch.setattr(segment_crypto.os, "replace", crashing_replace)
+    with pytest.raises(KeyboardInterrupt):
+        encrypt_rendition(rendition_dir)
+    monkeypatch.setattr(segment_crypto.os, "replace", real_replace)
+
+    results = protect_output(str(tmp_path))
+    assert results == {"360p": 4, "720p": 0}
+    assert not any(name.endswith((".tmp", ".pending")) for name in os.listdir(rendition_dir))
+
+    protect_output(str(tmp_path), decrypt=True)
+    assert _read_segments(rendition_dir) == contents["720p"]
+    assert _read_segments(str(tmp_path / "360p")) == contents["360p"]
+
+
+def test_failed_transform_leaves_rendition_untouched(tmp_path, monkeypatch):
+    contents = _make_output(tmp_path)
+    rendition_dir = str(tmp_path / "720p")
+
+    def failing_transform(source, target, key, iv, decrypt=False):
+        open(target, 'wb').write(b"partial")
+        raise OSError("磁盘已满")
+
+    monkeypatch.setattr(segment_crypto, "_transform_file", failing_transform)
+    with pytest.raises(OSError):
+        encrypt_rendition(rendition_dir)
+    assert _read_segments(rendition_dir) == contents["720p"]
+    assert not is_encrypted(read_media_playlist(os.path.join(rendition_dir, "playlist.m3u8")))
+    assert sorted(os.listdir(rendition_dir)) == ["playlist.m3u8"] + [f"segment_{i:03d}.ts" for i in range(4)]
+
+
+def test_cache_entry_is_dropped_before_segments_change(tmp_path, monkeypatch):
+    _make_output(tmp_path)
+    events = []
+    monkeypatch.setattr(segment_crypto, "forget_conversion", lambda output_dir: events.append("forget"))
+
+    def failing_encrypt(rendition_dir, output_name, rotation, workers):
+        events.append("encrypt")
+        raise RuntimeError("加密失败")
+
+    monkeypatch.setattr(segment_crypto, "encrypt_rendition", failing_encrypt)
+    with pytest.raises(RuntimeError):
+        protect_output(str(tmp_path))
+    assert events == ["forget", "encrypt"]
+
+
+def test_segments_use_their_media_sequence_as_iv(tmp_path):
+    _make_output(tmp_path)
+    rendition_dir = str(tmp_path / "720p")
+    # 内容相同的两个分片在同一密钥下加密后也不能相同
+    for index in (0, 1):
+        (tmp_path / "720p" / f"segment_{index:03d}.ts").write_bytes(b"\x47" * 188 * 4)
+
+    encrypt_rendition(rendition_dir)
+    playlist = read_media_playlist(os.path.join(rendition_dir, "playlist.m3u8"))
+    key_tags = [tag for segment in playlist['segments'] for tag in segment['tags'] if tag.startswith("#EXT-X-KEY:")]
+    assert len(key_tags) == 1
+    assert "IV=" not in key_tags[0]
+
+    first, second = _read_segments(rendition_dir)[:2]
+    assert first != second
+
+
+def test_rotation_switches_keys_at_the_same_segment_in_every_rendition(tmp_path):
+    _make_output(tmp_path, renditions=("720p", "360p", "audio"), count=5)
+    rendition_dirs = [str(tmp_path / name) for name in ("720p", "360p", "audio")]
+
+    assert encrypt_renditions(rendition_dirs, rotation=2) == {"720p": 5, "360p": 5, "audio": 5}
+    schedules = []
+    for rendition_dir in rendition_dirs:
+        playlist = read_media_playlist(os.path.join(rendition_dir, "playlist.m3u8"))
+        schedules.append([
+            (index, tag) for index, segment in enumerate(playlist['segments'])
+            for tag in segment['tags'] if tag.startswith("#EXT-X-KEY:")
+        ])
+    assert [index for index, _ in schedules[0]] == [0, 2, 4]
+    assert schedules[0] == schedules[1] == schedules[2]
+
+    # 已经加密的分辨率再次执行时跳过
+    assert encrypt_renditions(rendition_dirs, rotation=2) == {"720p": 0, "360p": 0, "audio": 0}
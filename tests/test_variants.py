@@ -0,0 +1,78 @@
+from converter.playlist import measure_bitrate
+from converter.probe import get_codec_string
+from converter.variants import get_frame_rate, get_variant_attributes
+
+VIDEO_STREAM = {
+    'codec_type': "video", 'codec_name': "h264", 'profile': "High", 'level': 40,
+    'width': 1920, 'height': 1080, 'avg_frame_rate': "30000/1001"
+}
+AUDIO_STREAM = {'codec_type': "audio", 'codec_name': "aac", 'profile': "LC"}
+
+
+def test_measure_bitrate_from_segment_sizes(tmp_path):
+    (tmp_path / "segment_000.ts").write_bytes(b"x" * 6000)
+    (tmp_path / "segment_001.ts").write_bytes(b"x" * 1000)
+    playlist = {'segments': [
+        {'duration': 6.0, 'uri': "segment_000.ts", 'tags': []},
+        {'duration': 2.0, 'uri': "segment_001.ts", 'tags': []},
+        # 缺失的分片不参与计算
+        {'duration': 6.0, 'uri': "segment_002.ts", 'tags': []},
+    ]}
+
+    assert measure_bitrate(str(tmp_path), playlist) == (8000, 7000)
+
+
+def test_measure_bitrate_uses_byte_ranges(tmp_path):
+    playlist = {'segments': [
+        {'duration': 4.0, 'uri': "media_000.ts", 'tags': ["#EXT-X-BYTERANGE:3000@0"]},
+        {'duration': 4.0, 'uri': "media_000.ts", 'tags': ["#EXT-X-BYTERANGE:1000"]},
+    ]}
+
+    assert measure_bitrate(str(tmp_path), playlist) == (6000, 4000)
+    assert measure_bitrate(str(tmp_path), {'segments': []}) == (0, 0)
+
+
+def test_codec_strings():
+    assert get_codec_string(VIDEO_STREAM) == "avc1.640028"
+    assert get_codec_string({'codec_name': "h264", 'profile': "Main", 'level': 31}) == "avc1.4d001f"
+    assert get_codec_string({'codec_name': "h264", 'profile': "Constrained Baseline", 'level': 30}) == "avc1.42401e"
+    assert get_codec_string({'codec_name': "hevc", 'profile': "Main 10", 'level': 150}) == "hvc1.2.4.L150.B0"
+    assert get_codec_string(AUDIO_STREAM) == "mp4a.40.2"
+    assert get_codec_string({'codec_name': "aac", 'profile': "HE-AAC"}) == "mp4a.40.5"
+    assert get_codec_string({'codec_name': "ac3"}) == "ac-3"
+    assert get_codec_string({'codec_name': "vp9"}) is None
+    # 不认识的H.264 profile不猜测为High
+    assert get_codec_string({'codec_name': "h264", 'profile': "High 10 Intra", 'level': 40}) is None
+    assert get_codec_string({'codec_name': "h264", 'level': 40}) is None
+
+
+def test_frame_rate():
+    assert round(get_frame_rate(VIDEO_STREAM), 3) == 29.97
+    assert get_frame_rate({'avg_frame_rate': "0/0", 'r_frame_rate': "25/1"}) == 25.0
+    assert get_frame_rate({}) is None
+
+
+def test_variant_attributes_include_audio_group():
+    video = {'peak': 5000000, 'average': 4000000, 'streams': [VIDEO_STREAM]}
+    audio = {'peak': 130000, 'average': 128000, 'streams': [AUDIO_STREAM]}
+
+    assert get_variant_attributes(video, audio) == {
+        'BANDWIDTH': 5130000,
+        'AVERAGE-BANDWIDTH': 4128000,
+        'CODECS': '"avc1.640028,mp4a.40.2"',
+        'RESOLUTION': "1920x1080",
+        'FRAME-RATE': "29.970"
+    }
+
+
+def test_variant_attributes_without_probe_results():
+    # ffprobe失败时不写CODECS和RESOLUTION，帧率使用源视频的
+    video = {'peak': 800000, 'average': 700000, 'streams': []}
+    assert get_variant_attributes(video, frame_rate=25) == {
+        'BANDWIDTH': 800000, 'AVERAGE-BANDWIDTH': 700000, 'FRAME-RATE': "25.000"
+    }
+    # 有编码无法识别时整个CODECS都不写
+    video = {'peak': 800000, 'average': 700000, 'streams': [{**VIDEO_STREAM, 'codec_name': "vp9"}]}
+    assert 'CODECS' not in get_variant_attributes(video)
+    video = {'peak': 800000, 'average': 700000, 'streams': [{**VIDEO_STREAM, 'profile': "unknown"}]}
+    assert 'CODECS' not in get_variant_attributes(video, {'peak': 1, 'average': 1, 'streams': [AUDIO_STREAM]})